@@ -0,0 +1,88 @@
+"""Benchmark of the time it takes to load the extension into an IPython shell.
+
+Every run starts a fresh interpreter, which creates an IPython shell, and then loads the extension, timing the load
+alone. The modules that should only be imported when the magics are first used are checked not to be imported by
+the load. Run it from the repository root::
+
+    python benchmarks/import_time.py --runs 20 --output import_time.json
+"""
+
+import argparse
+import compileall
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+
+# modules that are only needed to measure memory usage, not to register the magics
+DEFERRED_MODULES = (
+    "psutil",
+    "ctypes",
+    "multiprocessing.shared_memory",
+    "memory_magics.memory_tracer.context_memory_tracer",
+)
+
+RUN_SCRIPT = """
+import json, sys, time
+from IPython.core.interactiveshell import InteractiveShell
+
+shell = InteractiveShell.instance()
+start = time.perf_counter()
+import memory_magics
+memory_magics.load_ipython_extension(shell)
+duration = time.perf_counter() - start
+print(json.dumps({"load": duration, "imported": [name for name in %r if name in sys.modules]}))
+""" % (
+    DEFERRED_MODULES,
+)
+
+
+def run_once() -> dict:
+    output = subprocess.run([sys.executable, "-c", RUN_SCRIPT], check=True, capture_output=True, text=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the extension load time.")
+
+    parser.add_argument("--runs", type=int, default=10, help="Number of fresh interpreters to time the load in")
+    parser.add_argument("--output", type=str, help="Path to write the results to as JSON")
+
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+
+    # the bytecode is compiled beforehand, otherwise the first runs, or all of them with PYTHONDONTWRITEBYTECODE,
+    # would time the compilation
+    compileall.compile_dir(
+        os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "memory_magics"), quiet=1
+    )
+
+    runs = [run_once() for _ in range(args.runs)]
+    load_times = sorted(run["load"] * 1000 for run in runs)
+    imported = sorted({name for run in runs for name in run["imported"]})
+
+    print(f"extension load: median {statistics.median(load_times):.1f} ms, min {load_times[0]:.1f} ms")
+    print(f"deferred modules imported by the load: {', '.join(imported) or 'none'}")
+
+    if args.output is not None:
+        with open(args.output, "w") as file:
+            results = {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "runs": args.runs,
+                "median_ms": round(statistics.median(load_times), 3),
+                "min_ms": round(load_times[0], 3),
+                "imported": imported,
+            }
+            json.dump(results, file, indent=2)
+    if imported:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
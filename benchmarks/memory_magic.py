@@ -0,0 +1,212 @@
+"""Benchmark of the overhead and the accuracy of the %memory magic.
+
+The magic is run through an in-process IPython shell on cells of different allocation profiles. The overhead of
+a mode is the median wall-clock time of a cell run with the magic in the mode minus the median time of the cell run
+without it. The accuracy is the error of the reported cell peak against a synthetic allocation of a known size.
+
+The results are written as JSON with ``--output``, and compared with the results of a previous run with
+``--compare``, which fails if an overhead grew or a peak error exceeds the tolerance. Run it from the repository
+root::
+
+    python benchmarks/memory_magic.py --runs 10 --output benchmark.json
+    python benchmarks/memory_magic.py --runs 10 --compare benchmark.json
+"""
+
+import argparse
+import io
+import json
+import platform
+import statistics
+import sys
+import time
+from contextlib import redirect_stdout
+from typing import Dict, List, Optional
+
+from IPython.core.interactiveshell import InteractiveShell
+
+# options of the magic by mode, None runs the cell without the magic
+MODES = {
+    "baseline": None,
+    "tracemalloc": "",
+    "sample": "--sample",
+    "notebook": "-n",
+    "notebook-thread": "-n -b thread",
+    "jupyter": "-j",
+}
+
+# cells by allocation profile
+PROFILES = {
+    "small-objects": "x = [(i, str(i)) for i in range(200000)]\ndel x",
+    "large-buffer": "x = b'x' * (256 * 2**20)\ndel x",
+    "spikes": "for _ in range(50):\n    x = b'x' * (8 * 2**20)\n    del x",
+}
+
+# size of the synthetic allocation, the bytes are written, so the process RSS grows by the size too
+SYNTHETIC_SIZE = 128 * 2**20
+
+# the allocation is held long enough to be sampled
+SYNTHETIC_CELL = f"import time\nx = b'x' * {SYNTHETIC_SIZE}\ntime.sleep(0.1)\ndel x"
+
+# modes, which measure the cell peak, and the relative errors of the peak they are expected to stay within
+ACCURACY_TOLERANCES = {"tracemalloc": 0.01, "sample": 0.1}
+
+
+class MagicBenchmark:
+    """Run cells through an in-process IPython shell with the extension loaded."""
+
+    def __init__(self) -> None:
+        self.shell = InteractiveShell.instance()
+        self.shell.run_line_magic("load_ext", "memory_magics")
+        self.magics = self.shell.magics_manager.registry["MemoryMagics"]
+
+    def run_cell(self, cell: str, options: Optional[str]) -> float:
+        """Run a cell, with the magic in the mode of the options if they are set, and get the wall-clock time."""
+
+        if options is not None:
+            cell = f"%%memory -q {options}\n{cell}"
+
+        with redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            result = self.shell.run_cell(cell, silent=True)
+            duration = time.perf_counter() - start
+        result.raise_error()
+
+        return duration
+
+    def time_cell(self, cell: str, options: Optional[str], runs: int) -> float:
+        """Get the median wall-clock time of a cell in milliseconds, after a warm-up run."""
+
+        self.run_cell(cell, options)
+        return statistics.median(self.run_cell(cell, options) for _ in range(runs)) * 1000
+
+    def measure_peak(self, options: str) -> int:
+        """Run the synthetic allocation with the magic and get the cell peak it reports."""
+
+        self.run_cell(SYNTHETIC_CELL, options)
+        return self.magics.history.to_dict()["cell_peak"][-1]
+
+    def run(self, runs: int) -> Dict[str, list]:
+        overhead = []
+        for profile, cell in PROFILES.items():
+            baseline = self.time_cell(cell, MODES["baseline"], runs)
+            for mode, options in MODES.items():
+                duration = baseline if options is None else self.time_cell(cell, options, runs)
+                overhead.append(
+                    {
+                        "profile": profile,
+                        "mode": mode,
+                        "median_ms": round(duration, 3),
+                        "overhead_ms": round(duration - baseline, 3),
+                        "overhead_ratio": round(duration / baseline, 3),
+                    }
+                )
+
+        accuracy = []
+        for mode, tolerance in ACCURACY_TOLERANCES.items():
+            peak = self.measure_peak(MODES[mode])
+            accuracy.append(
+                {
+                    "mode": mode,
+                    "expected": SYNTHETIC_SIZE,
+                    "peak": peak,
+                    "error": round(abs(peak - SYNTHETIC_SIZE) / SYNTHETIC_SIZE, 4),
+                    "tolerance": tolerance,
+                }
+            )
+
+        return {"overhead": overhead, "accuracy": accuracy}
+
+    def close(self) -> None:
+        """Unload the extension, which stops the memory tracers."""
+
+        self.shell.run_line_magic("unload_ext", "memory_magics")
+
+
+def compare(results: Dict[str, list], previous: Dict[str, list], tolerance: float) -> List[str]:
+    """Get the regressions of the results against the previous ones.
+
+    An overhead regresses if it grew by more than `tolerance` of the previous cell time and by more than
+    a millisecond, to ignore the noise of fast cells. A peak regresses if its error exceeds its tolerance.
+    """
+
+    regressions = []
+
+    previous_overhead = {(row["profile"], row["mode"]): row for row in previous["overhead"]}
+    for row in results["overhead"]:
+        previous_row = previous_overhead.get((row["profile"], row["mode"]))
+        if previous_row is None:
+            continue
+        growth = row["overhead_ms"] - previous_row["overhead_ms"]
+        if growth > max(tolerance * previous_row["median_ms"], 1):
+            regressions.append(
+                f"{row['mode']} overhead on {row['profile']}: "
+                f"{previous_row['overhead_ms']:.1f} ms -> {row['overhead_ms']:.1f} ms"
+            )
+
+    for row in results["accuracy"]:
+        if row["error"] > row["tolerance"]:
+            regressions.append(f"{row['mode']} peak error: {row['error']:.2%} > {row['tolerance']:.2%}")
+
+    return regressions
+
+
+def print_results(results: Dict[str, list]) -> None:
+    print(f"{'profile':<15} {'mode':<18} {'median':>10} {'overhead':>10} {'ratio':>7}")
+    for row in results["overhead"]:
+        print(
+            f"{row['profile']:<15} {row['mode']:<18} {row['median_ms']:>7.1f} ms "
+            f"{row['overhead_ms']:>7.1f} ms {row['overhead_ratio']:>6.2f}x"
+        )
+    print()
+    for row in results["accuracy"]:
+        print(
+            f"{row['mode']} peak of a {row['expected']} bytes allocation: {row['peak']} bytes, error {row['error']:.2%}"
+        )
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the overhead and the accuracy of the %memory magic.")
+
+    parser.add_argument("--runs", type=int, default=5, help="Number of timed runs of every cell in every mode")
+    parser.add_argument("--output", type=str, help="Path to write the results to as JSON")
+    parser.add_argument("--compare", type=str, help="Path to the JSON results of a previous run to compare with")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.25, help="Allowed overhead growth as a fraction of the cell time"
+    )
+
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+
+    benchmark = MagicBenchmark()
+    try:
+        results = {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "runs": args.runs,
+            **benchmark.run(args.runs),
+        }
+    finally:
+        benchmark.close()
+    print_results(results)
+
+    if args.output is not None:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+    previous = {"overhead": []}
+    if args.compare is not None:
+        with open(args.compare) as file:
+            previous = json.load(file)
+
+    regressions = compare(results, previous, args.tolerance)
+
+    if regressions:
+        print("\nRegressions:\n" + "\n".join(regressions))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,15 @@
 from memory_magics._version import __version__
-from memory_magics.memory_magics import load_ipython_extension
+from memory_magics.result import MemoryResult
+from memory_magics.tracing import trace, traced
 
-__all__ = ["load_ipython_extension", "__version__"]
+
+def __getattr__(name: str):
+    # IPython is only imported when the extension is loaded
+    if name in {"load_ipython_extension", "unload_ipython_extension"}:
+        from memory_magics import memory_magics  # noqa: WPS433
+
+        return getattr(memory_magics, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+__all__ = ["load_ipython_extension", "unload_ipython_extension", "trace", "traced", "MemoryResult", "__version__"]
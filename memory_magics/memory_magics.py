@@ -1,21 +1,186 @@
 """Main module with memory magic functions for IPython notebooks."""
 
-import ast
 import os
-import tracemalloc
-from typing import Any, Dict, Optional, Tuple
+import time
+from contextlib import ExitStack, contextmanager
+from typing import Any, Dict, Iterator, Optional, Sequence, Tuple, Union
 
-import psutil
+from IPython.core.display_functions import display
 from IPython.core.error import UsageError
-from IPython.core.magic import Magics, line_cell_magic, magics_class, needs_local_scope, no_var_expand
-
-from memory_magics.memory_tracer.context_memory_tracer import ContextMemoryTracer
-from memory_magics.utils.jupyter import get_jupyter_memory_usage, get_jupyter_pids
-from memory_magics.utils.print import print_memory_usage_info
+from IPython.core.magic import Magics, line_cell_magic, line_magic, magics_class, needs_local_scope, no_var_expand
+from traitlets import Float, Int, List, Unicode, observe
+
+from memory_magics import tracing
+from memory_magics.memory_tracer import MEMORY_TRACERS
+from memory_magics.memory_tracer._memory_tracer import AdaptiveInterval
+from memory_magics.memory_tracer.leak_memory_tracer import LeakMemoryTracer
+from memory_magics.memory_tracer.limit_memory_tracer import MemoryLimitExceeded
+from memory_magics.memory_tracer.line_memory_tracer import LineMemoryTracer
+from memory_magics.memory_tracer.snapshot_memory_tracer import SnapshotMemoryTracer
+from memory_magics.memory_tracer.task_memory_tracer import TaskMemoryTracer
+from memory_magics.memory_tracer.thread_memory_tracer import ThreadMemoryTracer
+from memory_magics.options import (
+    LONG_OPTIONS,
+    SHORT_OPTIONS,
+    MemoryOptions,
+    MemoryOptionsParser,
+    get_option,
+    parse_leak_options,
+    parse_sampling_interval,
+)
+from memory_magics.recorder import AutoMemoryRecorder
+from memory_magics.result import MemoryResult
+from memory_magics.runner import CodeRunner
+from memory_magics.utils.history import CellMemoryUsage, MemoryHistory, get_source_hash
+from memory_magics.utils.jupyter import JupyterProcessFinder, get_jupyter_memory_usage, get_memory_usage
+from memory_magics.utils.print import (
+    format_bytes,
+    print_line_memory_usage,
+    print_memory_history,
+    print_memory_leaks,
+    print_memory_limit_exceeded,
+    print_memory_usage_info,
+    print_namespace_memory_usage,
+    print_task_memory_usage,
+    print_top_allocations,
+    print_variable_sizes,
+)
+from memory_magics.utils.sizeof import SHARED_TYPES, SizeCache
+
+_JUPYTER_PIDS_TTL = 30.0
+_SAMPLING_CPU_BUDGET = 2.0
+# number of the cells and objects printed by default
+_N_ROWS = 20
+
+# long options of %memory_history
+_HISTORY_OPTIONS = ("top=", "by=", "export=", "pandas", "arrow", "clear")
+# current and peak memory usages of the scopes, e.g. the kernel process and Jupyter
+ScopesMemory = Dict[str, Tuple[int, Optional[int]]]
 
 
 @magics_class
 class MemoryMagics(Magics):
+    jupyter_pids = List(
+        Int(),
+        default_value=None,
+        allow_none=True,
+        help="Ids of Jupyter processes to trace, the kernel is always traced. Found automatically if not set.",
+    ).tag(config=True)
+
+    jupyter_pids_ttl = Float(
+        _JUPYTER_PIDS_TTL,
+        help="Number of seconds to cache the found Jupyter processes ids for.",
+    ).tag(config=True)
+
+    memory_limit = Unicode(
+        None,
+        allow_none=True,
+        help="Default memory limit of %memory executions, e.g. '8GiB', or '90%' of the cgroup or total memory.",
+    ).tag(config=True)
+
+    sampling_cpu_budget = Float(
+        _SAMPLING_CPU_BUDGET,
+        help="Percentage of a CPU core the adaptive RSS sampler (-i auto) may use.",
+    ).tag(config=True)
+
+    children_scan_interval = Float(
+        100.0,
+        help="Interval in milliseconds of re-scanning the kernel descendant processes for new workers with -c.",
+    ).tag(config=True)
+
+    variables_time_budget = Float(
+        1.0,
+        help="Time budget in seconds of measuring the objects with %memory -v and %memory_ns, then sizes are partial.",
+    ).tag(config=True)
+
+    history_size = Int(
+        1000,
+        help="Number of the last measured cells to keep the memory usages of in the history.",
+    ).tag(config=True)
+
+    def __init__(self, shell=None, **kwargs) -> None:
+        super().__init__(shell, **kwargs)
+        self._memory_tracers: Dict[str, Any] = {}
+        self._process_memory_tracer: Optional[ThreadMemoryTracer] = None
+        self._jupyter_process_finder = JupyterProcessFinder(self.jupyter_pids_ttl)
+
+        self.history = MemoryHistory(self.history_size)
+        self._size_cache = SizeCache()
+        self._auto_recorder = AutoMemoryRecorder(self.shell, self.history)
+        self._runner = CodeRunner(self.shell)
+
+    def get_jupyter_pids(self) -> list:
+        """Get Jupyter processes ids, either pinned with the configuration or found automatically.
+
+        The kernel is always included, and the tracer processes are left out.
+        """
+
+        if self.jupyter_pids is not None:
+            jupyter_pids = list(self.jupyter_pids)
+        else:
+            jupyter_pids = self._jupyter_process_finder.get_pids()
+
+        tracer_pids = self.get_tracer_pids()
+        jupyter_pids = [pid for pid in jupyter_pids if pid not in tracer_pids]
+        if os.getpid() not in jupyter_pids:
+            jupyter_pids.append(os.getpid())
+        return jupyter_pids
+
+    def get_memory_tracer(self, backend: str = "process") -> Any:
+        """Get a started memory tracer of the backend, the tracer is reused between calls."""
+
+        memory_tracer = self._memory_tracers.get(backend)
+        if memory_tracer is None:
+            memory_tracer = MEMORY_TRACERS[backend]()
+            self._memory_tracers[backend] = memory_tracer
+        memory_tracer.start()
+
+        return memory_tracer
+
+    def get_process_memory_tracer(self) -> ThreadMemoryTracer:
+        """Get the memory tracer of the current process only, independent of the Jupyter processes tracers.
+
+        The tracer is started when it is armed.
+        """
+
+        if self._process_memory_tracer is None:
+            self._process_memory_tracer = ThreadMemoryTracer([os.getpid()])
+
+        return self._process_memory_tracer
+
+    def get_tracer_pids(self) -> list:
+        """Get the ids of the running tracer processes, which are children of the kernel."""
+
+        memory_tracer = self._memory_tracers.get("process")
+        return [memory_tracer.pid] if memory_tracer is not None and memory_tracer.is_running else []
+
+    def stop_memory_tracers(self) -> None:
+        """Stop all started memory tracers."""
+
+        for memory_tracer in self._memory_tracers.values():
+            memory_tracer.stop()
+        self._memory_tracers.clear()
+
+        if self._process_memory_tracer is not None:
+            self._process_memory_tracer.stop()
+            self._process_memory_tracer = None
+
+    @property
+    def is_memory_auto_on(self) -> bool:
+        return self._auto_recorder.is_on
+
+    def start_memory_auto(
+        self, interval: Union[float, AdaptiveInterval] = 100.0, trace_allocations: bool = False
+    ) -> None:
+        """Start recording the memory usage of every executed cell to the history."""
+
+        self._auto_recorder.start(interval, trace_allocations)
+
+    def stop_memory_auto(self) -> None:
+        """Stop recording the memory usage of the executed cells."""
+
+        self._auto_recorder.stop()
+
     @needs_local_scope
     @no_var_expand
     @line_cell_magic
@@ -33,6 +198,9 @@ class MemoryMagics(Magics):
         - In cell mode, you can trace memory usage of the cell body (a directly
           following statement raises an error).
 
+        Cells with top-level await are supported: they are run on the IPython event loop, or, if it is
+        already running (e.g. in ipykernel), on a new event loop in a separate thread.
+
         This function provides basic functionality. Use the memory_profiler
         module for more control over the measurement.
 
@@ -44,12 +212,68 @@ class MemoryMagics(Magics):
 
         -j <jupyter>: If present, show jupyter memory usage
 
-        —i <interval> Interval in milliseconds for updating memory usage information
+        —i <interval> Interval in milliseconds for updating memory usage information, at least 1, or 'auto'
+          to sample every 1 ms while the memory usage is rising and back off to 100 ms while it is flat,
+          within MemoryMagics.sampling_cpu_budget percents of a CPU core
+
+        -b <backend>: Backend for tracing peak memory usage: 'process' (default) samples from a separate tracer
+          process, 'thread' from a daemon thread of the kernel, which is cheaper but cannot sample while a statement
+          holds the GIL, e.g. a single large allocation, so it may miss the peaks of such statements
+
+        -l <lines>: If present, print memory usage of each line of the cell
+
+        --tasks: If present, print memory usage of each asyncio task created by a cell with top-level await,
+          the memory allocated during every step of a task is attributed to it
+
+        --top <top>: Number of the largest allocation sites to print
+
+        -d <depth>: Number of frames to group the allocation sites by, 1 by default
+
+        -p <peak>: If present, also print the largest allocation sites at the peak memory usage,
+          a snapshot is taken every time the memory usage rises by more than this number of bytes
+          (e.g. 10MiB) above the previous snapshot
+
+        --sample: If present, measure the line/cell memory usage by sampling the kernel RSS
+          every <interval> milliseconds instead of tracing allocations with tracemalloc,
+          which is less precise but does not slow the execution down
+
+        --native: If present, also print the kernel memory usage that is not traced by tracemalloc,
+          e.g. buffers allocated by C extensions, computed from the kernel RSS sampled every <interval>
+          milliseconds, and the memory of NumPy arrays if NumPy is imported, not available with --sample
+
+        --limit <limit>: Interrupt the execution with MemoryError when the kernel memory usage exceeds
+          this number of bytes (e.g. 8GiB) or this percentage of the cgroup memory limit (e.g. 90%),
+          the usage is checked every <interval> milliseconds. If --top is set, the allocation sites
+          at the limit are printed. Defaults to MemoryMagics.memory_limit, 'none' disables it
+
+        -c <children>: If present, also trace the descendant processes of the kernel, e.g. multiprocessing,
+          joblib or Dask workers, every <interval> milliseconds, and print their total memory usage and the total
+          memory usage of the kernel with them. The process tree is re-scanned for new workers every
+          MemoryMagics.children_scan_interval milliseconds
+
+        -v <variables>: If present, also print the memory retained by the variables the line/cell created or rebound,
+          the objects reachable from several variables are counted once as shared. The object graph is walked
+          within MemoryMagics.variables_time_budget seconds, NumPy arrays and pandas objects are measured
+          by the sizes of their buffers
+
+        --metric <metric>: Metric of the process memory usages: 'rss' (default), the resident set size,
+          'pss', the proportional set size, which divides the shared pages between the processes sharing them,
+          so the Jupyter total does not count them several times, or 'uss', the unique set size, the memory
+          that would be freed if the process exited. PSS and USS are slower to read, they are read
+          from /proc/<pid>/smaps_rollup on Linux 4.14+ and with psutil elsewhere
+
+        --timeline: If present, show the kernel RSS and the traced memory sampled every <interval> milliseconds
+          during the execution as a plot in notebooks and as sparklines in terminals
 
         -t <table>: If present, print statistics in a table
 
         —q <quiet>: If present, do not return the output
 
+        -o <output>: If present, return a MemoryResult with the measurements instead of the output, see
+          `memory_magics.MemoryResult`. It holds the current and peak memory usages of the line/cell and of the other
+          scopes, the timing, the backend, and the snapshot with --top and the timeline with --timeline.
+          Nothing is returned if there is no line/cell to execute
+
         Examples
         --------
         ::
@@ -74,155 +298,445 @@ class MemoryMagics(Magics):
            jupyter  | 170.19 MiB  | 202.55 MiB   |
 
           Out [4]: 499999500000
+
+          In [5]: result = %memory -o list(range(10**6))
+          RAM usage: line: 34.33 MiB / 34.33 MiB
+
+          In [6]: assert result.peak < 100 * 2**20
         """
 
         options, line = self._parse_options(line, cell)
-        current_pid = os.getpid()
+        expr = cell if cell else line
+        if not expr:
+            self._print_memory_usage(options, self._get_processes_memory(options))
+            return None
 
-        expr_type = None
-        memory_current = None
-        memory_peak = None
-        memory_notebook = None
-        memory_notebook_peak = None
-        memory_jupyter = None
-        memory_jupyter_peak = None
-        out = None
+        namespace_ids = self._runner.get_namespace_ids() if options.variables else None
+        line_memory_tracer = LineMemoryTracer() if options.lines else None
+        task_memory_tracer = TaskMemoryTracer() if options.tasks else None
+        memory_trace = self._make_memory_trace(options, line_memory_tracer, task_memory_tracer)
+        with self._report_memory_limit(memory_trace, expr, options.top):
+            out = self._trace_memory_usage(expr, local_ns, memory_trace, line_memory_tracer, task_memory_tracer)
 
-        expr = cell if cell else line
-        if expr:
-            (
-                out,
-                compilation_memory,
-                traced_memory,
-                notebooks_memory_peaks,
-                memory_jupyter_peak,
-            ) = self._trace_memory_usage(expr, local_ns, options["trace_notebooks_peaks"], options["interval"])
+        memory_result = memory_trace.memory_result
+        memory_result.scopes.update(self._get_processes_memory(options, memory_trace))
+        self._print_memory_usage(options, memory_result.scopes, memory_result, "cell" if cell else "line")
+        self.history.append(self._make_history_record(expr, memory_result))
+        self._print_details(expr, options, memory_trace, namespace_ids, line_memory_tracer, task_memory_tracer)
 
-            expr_type = "cell" if cell else "line"
-            memory_current = traced_memory[0] + compilation_memory[0]
+        if options.output:
+            return memory_result
+        return None if options.quiet else out
 
-            memory_peak = traced_memory[1] + compilation_memory[0]
-            if memory_peak < compilation_memory[1]:
-                memory_peak = compilation_memory[1]
+    @line_magic
+    def memory_auto(self, line: str = "") -> None:
+        """Record the memory usage of every executed cell in the session.
 
-            memory_notebook_peak = notebooks_memory_peaks.get(current_pid)
+        Usage::
 
-        if options["notebook"]:
-            memory_notebook = psutil.Process(current_pid).memory_info().rss
+          %memory_auto on [-i <interval>] [--tracemalloc]
+          %memory_auto off
+          %memory_auto
 
-        if options["jupyter"]:
-            memory_jupyter = get_jupyter_memory_usage()
+        The kernel RSS increment and peak increment of every cell are recorded without changing the cell,
+        the last MemoryMagics.history_size (1000 by default) cells are kept and shown with %memory_history.
+        Without arguments, the mode status is printed.
 
-        print_memory_usage_info(
-            memory_current=memory_current,
-            memory_peak=memory_peak,
-            memory_notebook=memory_notebook,
-            memory_notebook_peak=memory_notebook_peak,
-            memory_jupyter=memory_jupyter,
-            memory_jupyter_peak=memory_jupyter_peak,
-            expr_type=expr_type,
-            print_table=options["print_table"],
-        )
+        Options:
 
-        if expr and not options["quiet"]:
-            return out
+        -i <interval>: Interval in milliseconds for sampling the kernel RSS, 100 by default, or 'auto'
+          for an adaptive interval. On Linux the peak is taken from the kernel peak RSS, so it does not
+          depend on the interval
 
-    def _compile(self, expr: str) -> Tuple[str, str, Any, Any]:
-        """Compile a Python statement or expression and get the expression value if any."""
+        --tracemalloc: If present, also trace the allocations of every cell with tracemalloc, which is more
+          precise but makes allocation-heavy cells several times slower
+        """
 
-        expr = self.shell.transform_cell(expr)
-        expr_ast = self.shell.compile.ast_parse(expr)
-        expr_ast = self.shell.transform_ast(expr_ast)
+        mode, _, line = line.strip().partition(" ")
+        options, _ = self.parse_options(line, "i:", "interval=", "tracemalloc", posix=False)
 
-        expr_val = None
-        if len(expr_ast.body) == 1 and isinstance(expr_ast.body[0], ast.Expr):
-            mode = "eval"
-            source = "<memory traced eval>"
-            expr_ast = ast.Expression(expr_ast.body[0].value)
-        else:
-            mode = "exec"
-            source = "<memory traced exec>"
-            # multi-line %%memory case
-            if len(expr_ast.body) > 1 and isinstance(expr_ast.body[-1], ast.Expr):
-                expr_val = expr_ast.body[-1]
-                expr_ast = expr_ast.body[:-1]
-                expr_ast = ast.Module(expr_ast, [])
-                expr_val = ast.Expression(expr_val.value)
+        if mode == "on":
+            interval = get_option(options, "i", "interval", "100")
+            self.start_memory_auto(
+                parse_sampling_interval(interval, self.sampling_cpu_budget), "tracemalloc" in options
+            )
+        elif mode == "off":
+            self.stop_memory_auto()
+        elif mode:
+            raise UsageError("usage: %memory_auto [on|off]")  # noqa: WPS323
 
-        code = self.shell.compile(expr_ast, source, mode)
+        status = self._auto_recorder.status
+        n_cells = len(self.history)
+        print(f"Automatic memory tracking: {status}, {n_cells} cells recorded")
 
-        return mode, source, code, expr_val
+    @line_magic
+    def memory_history(self, line: str = "") -> Any:
+        """Show the memory usages of the cells recorded by %memory and %memory_auto.
 
-    def _trace_memory_usage(
-        self, expr: str, local_ns: dict = None, trace_notebooks_peaks: bool = False, interval: float = 10.0
-    ) -> Tuple[Any, tuple, tuple, dict, Optional[int]]:
-        """Trace memory usage of a Python statement or expression execution."""
-
-        tracemalloc.start()
-        mode, source, code, expr_val = self._compile(expr)
-        compilation_memory = tracemalloc.get_traced_memory()
-        tracemalloc.stop()
-
-        glob = self.shell.user_ns
-        jupyter_pids = get_jupyter_pids()
-        notebooks_memory_peaks = {}
-        total_peak = None
-
-        run = eval if mode == "eval" else exec
-
-        if trace_notebooks_peaks:
-            memory_tracer = ContextMemoryTracer(jupyter_pids, interval)
-            with memory_tracer:
-                tracemalloc.start()
-                out = run(code, glob, local_ns)
-                traced_memory = tracemalloc.get_traced_memory()
-                tracemalloc.stop()
-            notebooks_memory_peaks = memory_tracer.memory_usages_peak
-            total_peak = memory_tracer.total_peak
-        else:
-            tracemalloc.start()
-            out = run(code, glob, local_ns)
-            traced_memory = tracemalloc.get_traced_memory()
-            tracemalloc.stop()
-        if expr_val is not None:
-            code_2 = self.shell.compile(expr_val, source, "eval")
-            out = eval(code_2, glob, local_ns)  # noqa: S307
+        Options:
 
-        return out, compilation_memory, traced_memory, notebooks_memory_peaks, total_peak
+        -n <n>: Number of the last recorded cells to print, 20 by default
 
-    def _parse_options(self, line: str = "", cell: Optional[str] = None) -> Tuple[Dict[str, Any], str]:
-        """Parse options from Jupyter magic commands."""
+        --top <top>: Print this number of cells with the largest values of the --by column instead
 
-        long_options = ["notebook", "jupyter", "interval=", "table", "quiet"]
-        options, line = self.parse_options(line, "nji:tq", *long_options, posix=False)
-        parsed_options = {}
+        --by <by>: Column to select the --top cells by, 'cell_peak' by default
 
-        if line and cell:
-            raise UsageError("cannot use statement directly after '%%memory'!")  # noqa: WPS323
+        --export <path>: Write the history to a CSV or Parquet file, depending on the extension,
+          Parquet requires pyarrow
+
+        --pandas: If present, return the history as a pandas DataFrame
+
+        --arrow: If present, return the history as a pyarrow Table
+
+        --clear: If present, clear the history
+        """
+
+        options, _ = self.parse_options(line, "n:", *_HISTORY_OPTIONS, posix=False)
 
-        trace_notebooks_peaks = False
-        if any(key in options.keys() for key in ["n", "notebook", "j", "jupyter"]) and (line or cell):
-            trace_notebooks_peaks = True
-        parsed_options["trace_notebooks_peaks"] = trace_notebooks_peaks
+        if "clear" in options:
+            self.history.clear()
+            return None
 
-        parsed_options["notebook"] = "n" in options or "notebook" in options
-        parsed_options["jupyter"] = "j" in options or "jupyter" in options
+        export_path = options.get("export")
+        if export_path is not None:
+            self._export_history(export_path)
+            return None
+
+        if "pandas" in options:
+            return self.history.to_pandas()
+        if "arrow" in options:
+            return self.history.to_arrow()
 
-        interval = options["i"] if "i" in options else options.get("interval", 10.0)
         try:
-            interval = float(interval)
+            records = self._select_history_records(options)
+        except ValueError as exc:
+            raise UsageError(str(exc)) from None
+
+        print_memory_history(records)
+        return None
+
+    @line_magic
+    def memory_ns(self, line: str = "") -> None:
+        """Print the largest objects in the user namespace by their deep sizes.
+
+        The deep size of an object includes the objects it refers to, except for modules, classes, functions
+        and the namespace itself, NumPy arrays and pandas objects are measured by the sizes of their buffers.
+        The sizes are cached by the object ids along with a cheap signal of their changes, e.g. the length
+        and the ids of a few evenly spaced items of a list or the buffers of a DataFrame, so running it again only
+        measures the objects that were created or changed since. Replacing the other items of a container in place
+        and the changes inside the nested objects, e.g. appending to a list in a dict, are not signalled, use -f
+        to measure all objects again. The objects are measured within MemoryMagics.variables_time_budget seconds.
+
+        Options:
+
+        -n <n>: Number of the largest objects to print, 20 by default
+
+        -f: If present, measure all objects again instead of reusing the cached sizes
+        """
+
+        options, _ = self.parse_options(line, "n:f", "refresh", posix=False)
+        try:
+            n_objects = int(options.get("n", _N_ROWS))
         except ValueError:
-            raise TypeError("interval must be int or float") from None
-        # for performance reasons
-        if interval < 10:
-            raise ValueError("interval must be greater than or equal to 10 milliseconds")
-        parsed_options["interval"] = interval
+            raise UsageError("n must be int") from None
+        if "f" in options or "refresh" in options:
+            self._size_cache.clear()
+
+        user_ns = self.shell.user_ns
+        names = self._runner.get_namespace_ids().keys()
+        names = [name for name in names if not isinstance(user_ns[name], SHARED_TYPES)]
+        user_objects = {name: user_ns[name] for name in names}
+
+        start_counter = time.perf_counter()
+        object_sizes = self._size_cache.get_sizes(user_objects, [user_ns], self.variables_time_budget)
+        duration = time.perf_counter() - start_counter
+
+        type_names = {name: type(user_ns[name]).__name__ for name in names}
+        print_namespace_memory_usage(object_sizes, type_names, n_objects, duration)
+
+    @needs_local_scope
+    @no_var_expand
+    @line_cell_magic
+    def memory_leak(self, line: str = "", cell: Optional[str] = None, local_ns: Optional[dict] = None) -> None:
+        """Find memory leaks of a Python statement or cell by running it repeatedly, like %timeit.
+
+        The allocations of all the runs are traced with tracemalloc, and after every run the garbage is collected
+        and the memory retained by every allocation site is recorded. The sites, which retained memory grows
+        steadily with the number of runs, are printed with the number of bytes every run retains.
+
+        Options:
+
+        -r <repeat>: Number of runs, 20 by default
+
+        -w <warmup>: Number of runs before the first record, 1 by default, to leave out caches filled
+          by the first run
+
+        -d <depth>: Number of frames to group the allocation sites by, 1 by default
+
+        --top <top>: Number of the leaking allocation sites to print, 10 by default
+
+        Examples
+        --------
+        ::
+
+          In [1]: cache = []
 
-        parsed_options["print_table"] = "t" in options or "table" in options
-        parsed_options["quiet"] = "q" in options or "quiet" in options
+          In [2]: %memory_leak -r 10 cache.append(list(range(100)))
+          Retained memory growth over 10 runs: 856 B per run (R² 1.00)
+          Leaking allocation sites:
+           #1: 856 B per run, 8.36 KiB retained (R² 1.00)
+              <cell>:1: cache.append(list(range(100)))
+        """
+
+        options, line = self.parse_options(line, "r:w:d:", "repeat=", "warmup=", "depth=", "top=", posix=False)
+        if line and cell:
+            raise UsageError("cannot use statement directly after '%%memory_leak'!")  # noqa: WPS323
+        expr = cell if cell else line
+        if not expr:
+            raise UsageError("no statement to run")
+
+        repeat, warmup, depth, top = parse_leak_options(options)
+        compiled_code = self._runner.compile(expr)
+        leak_memory_tracer = LeakMemoryTracer(depth)
+        with leak_memory_tracer.trace():
+            for _ in range(warmup):
+                self._runner.run(compiled_code, local_ns)
+            leak_memory_tracer.record()
+            for _ in range(repeat):  # noqa: WPS440
+                self._runner.run(compiled_code, local_ns)
+                leak_memory_tracer.record()
+
+        print_memory_leaks(
+            repeat,
+            leak_memory_tracer.trend(),
+            leak_memory_tracer.leaks()[:top],
+            self.shell.transform_cell(expr).splitlines(),
+        )
+
+    @observe("jupyter_pids_ttl")
+    def _jupyter_pids_ttl_changed(self, change) -> None:
+        self._jupyter_process_finder.ttl = change["new"]
+
+    @observe("history_size")
+    def _history_size_changed(self, change) -> None:
+        self.history.size = change["new"]
+
+    def _export_history(self, path: str) -> None:
+        """Write the history to a CSV or Parquet file, depending on the extension."""
+
+        if path.endswith(".parquet"):
+            self.history.to_parquet(path)
+        elif path.endswith(".csv"):
+            self.history.to_csv(path)
+        else:
+            raise UsageError("history can only be exported to .csv or .parquet files")
+
+    def _select_history_records(self, options: Dict[str, Any]) -> Sequence[CellMemoryUsage]:
+        """Select the last -n records of the history, or the --top ones by the --by column."""
+
+        top = options.get("top")
+        if top is None:
+            return self.history.tail(int(options.get("n", _N_ROWS)))
+        return self.history.top(int(top), options.get("by", "cell_peak"))
+
+    def _make_history_record(self, source: str, memory_result: MemoryResult) -> CellMemoryUsage:
+        """Make a history record of a %memory execution from its result."""
+
+        scopes = memory_result.scopes
+        return CellMemoryUsage(
+            self.shell.execution_count,
+            get_source_hash(source),
+            memory_result.start_time,
+            memory_result.duration,
+            memory_result.mode,
+            memory_result.current,
+            memory_result.peak,
+            *scopes.get("native", (None, None)),
+            *scopes.get("notebook", (None, None)),
+            *scopes.get("jupyter", (None, None)),
+            *scopes.get("children", (None, None)),
+        )
+
+    def _get_processes_memory(
+        self, options: MemoryOptions, memory_trace: Optional[tracing.MemoryTrace] = None
+    ) -> ScopesMemory:
+        """Get the current memory usages of the notebook and of Jupyter requested by the options, and their peaks
+        traced during the execution if it was measured."""
+
+        processes_tracer = memory_trace.processes_tracer if memory_trace is not None else None
+        processes_memory = {}
+        if options.notebook:
+            peak = processes_tracer.memory_usages_peak.get(os.getpid()) if processes_tracer is not None else None
+            processes_memory["notebook"] = (get_memory_usage([os.getpid()], options.trace.metric), peak)
+        if options.jupyter:
+            peak = processes_tracer.total_peak if processes_tracer is not None else None
+            processes_memory["jupyter"] = (
+                get_jupyter_memory_usage(self.get_jupyter_pids(), options.trace.metric),
+                peak,
+            )
+        return processes_memory
+
+    def _make_memory_trace(
+        self,
+        options: MemoryOptions,
+        line_memory_tracer: Optional[LineMemoryTracer] = None,
+        task_memory_tracer: Optional[TaskMemoryTracer] = None,
+    ) -> tracing.MemoryTrace:
+        """Make the measurement of a %memory execution with the parsed options."""
+
+        processes_tracer = self.get_memory_tracer(options.backend) if options.traces_processes else None
+
+        return tracing.MemoryTrace(
+            options.trace,
+            self.get_process_memory_tracer(),
+            processes_tracer,
+            self.get_jupyter_pids() if processes_tracer is not None else (),
+            self.get_tracer_pids,
+            [tracer for tracer in (line_memory_tracer, task_memory_tracer) if tracer is not None],
+        )
+
+    def _trace_memory_usage(
+        self,
+        expr: str,
+        local_ns: Optional[dict],
+        memory_trace: tracing.MemoryTrace,
+        line_memory_tracer: Optional[LineMemoryTracer] = None,
+        task_memory_tracer: Optional[TaskMemoryTracer] = None,
+    ) -> Any:
+        """Execute a Python statement or expression measured by the memory trace, and get its value.
+
+        The memory allocated by the compilation is traced separately and added to the result.
+        """
+
+        compilation_memory = {"current": 0, "peak": 0}
+        with ExitStack() as stack:
+            if not memory_trace.options.sample:
+                compilation_memory = stack.enter_context(tracing.trace_allocations())
+            compiled_code = self._runner.compile(expr)
+
+        with memory_trace.measure():
+            out = self._runner.run(compiled_code, local_ns, line_memory_tracer, task_memory_tracer)
+
+        memory_result = memory_trace.memory_result
+        memory_result.current += compilation_memory["current"]
+        memory_result.peak = max(memory_result.peak + compilation_memory["current"], compilation_memory["peak"])
+        return out
+
+    @contextmanager
+    def _report_memory_limit(self, memory_trace: tracing.MemoryTrace, expr: str, top: int) -> Iterator[None]:
+        """Print the memory usage that exceeded the limit of the memory trace, and the `top` allocation sites
+        at the limit, if the execution of the expression in the context exceeds it."""
+
+        try:
+            yield
+        except MemoryLimitExceeded as exc:
+            limit_memory_tracer = memory_trace.limit_tracer
+            if limit_memory_tracer is None or limit_memory_tracer.exceeded_memory is None:
+                raise
+            source_lines = self.shell.transform_cell(expr).splitlines()
+            lineno = self._runner.get_traced_lineno(exc)
+            print_memory_limit_exceeded(
+                limit_memory_tracer.limit, limit_memory_tracer.exceeded_memory, lineno, source_lines
+            )
+            if memory_trace.snapshot_tracer is not None:
+                statistics = memory_trace.snapshot_tracer.statistics(top)
+                print_top_allocations(statistics, source_lines, title="Top allocations at limit")
+            limit = format_bytes(limit_memory_tracer.limit)
+            # the traceback through the tracers is not useful
+            raise MemoryLimitExceeded(f"memory limit of {limit} exceeded") from None
+
+    def _print_memory_usage(
+        self,
+        options: MemoryOptions,
+        scopes: ScopesMemory,
+        memory_result: Optional[MemoryResult] = None,
+        label: str = "line",
+    ) -> None:
+        """Print the memory usages of the scopes, and of the line/cell with its timeline if it was measured."""
+
+        rows = [(scope, current, peak) for scope, (current, peak) in scopes.items()]
+        measured_by = None
+        if memory_result is not None:
+            rows.insert(0, (label, memory_result.current, memory_result.peak))
+            if options.trace.sample:
+                measured_by = self._get_sampling_description(options.trace.interval, options.trace.metric)
+
+        print_memory_usage_info(
+            rows,
+            show_peaks=memory_result is not None,
+            print_table=options.print_table,
+            measured_by=measured_by,
+            metric=options.trace.metric,
+        )
+        if memory_result is not None and memory_result.timeline is not None:
+            display(memory_result.timeline)
+
+    def _print_details(
+        self,
+        expr: str,
+        options: MemoryOptions,
+        memory_trace: tracing.MemoryTrace,
+        namespace_ids: Optional[Dict[str, int]] = None,
+        line_memory_tracer: Optional[LineMemoryTracer] = None,
+        task_memory_tracer: Optional[TaskMemoryTracer] = None,
+    ) -> None:
+        """Print the memory retained by the variables, the memory usages of the lines and of the tasks,
+        and the top allocation sites of a %memory execution, those that were traced."""
+
+        source_lines = self.shell.transform_cell(expr).splitlines()
+        if namespace_ids is not None:
+            print_variable_sizes(self._runner.get_variable_sizes(namespace_ids, self.variables_time_budget))
+        if line_memory_tracer is not None:
+            print_line_memory_usage(source_lines, line_memory_tracer.line_memory_usages)
+        if task_memory_tracer is not None:
+            print_task_memory_usage(task_memory_tracer.task_memory_usages)
+        if memory_trace.snapshot_tracer is not None:
+            self._print_top_allocations(memory_trace.snapshot_tracer, options.top, source_lines)
+
+    @staticmethod
+    def _print_top_allocations(
+        snapshot_memory_tracer: SnapshotMemoryTracer, top: int, source_lines: Sequence[str]
+    ) -> None:
+        """Print the `top` allocation sites at the peak, if a peak snapshot was taken, and at the end."""
+
+        peak_snapshot = snapshot_memory_tracer.peak_snapshot
+        if peak_snapshot is not None:
+            peak_memory = format_bytes(snapshot_memory_tracer.peak_snapshot_memory)
+            statistics = snapshot_memory_tracer.statistics(top, peak_snapshot)
+            print_top_allocations(statistics, source_lines, title=f"Top allocations at peak ({peak_memory})")
+        print_top_allocations(snapshot_memory_tracer.statistics(top), source_lines)
+
+    @staticmethod
+    def _get_sampling_description(interval: Union[float, AdaptiveInterval], metric: str = "rss") -> str:
+        metric = metric.upper()
+        if isinstance(interval, AdaptiveInterval):
+            interval_range = f"{interval.min_interval:g}-{interval.max_interval:g}"
+            return f"adaptive {metric} sampling every {interval_range} ms"
+        return f"{metric} sampling every {interval:g} ms"
+
+    def _parse_options(self, line: str = "", cell: Optional[str] = None) -> Tuple[MemoryOptions, str]:
+        """Parse options from Jupyter magic commands."""
+
+        options, line = self.parse_options(line, SHORT_OPTIONS, *LONG_OPTIONS, posix=False)
+        if line and cell:
+            raise UsageError("cannot use statement directly after '%%memory'!")  # noqa: WPS323
 
-        return parsed_options, line
+        parser = MemoryOptionsParser(self.memory_limit, self.sampling_cpu_budget, self.children_scan_interval)
+        memory_options = parser.parse(options, cell_mode=bool(cell))
+        return memory_options, line
 
 
 def load_ipython_extension(ipython) -> None:
-    ipython.register_magics(MemoryMagics)
+    # the memory tracers are started on first use, so that loading the extension stays fast
+    magics = MemoryMagics(ipython)
+    ipython.register_magics(magics)
+    ipython.configurables.append(magics)
+
+
+def unload_ipython_extension(ipython) -> None:
+    magics = ipython.magics_manager.registry.get(MemoryMagics.__name__)
+    if magics is not None:
+        magics.stop_memory_auto()
+        magics.stop_memory_tracers()
+        if magics in ipython.configurables:
+            ipython.configurables.remove(magics)
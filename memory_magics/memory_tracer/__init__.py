@@ -0,0 +1,36 @@
+import importlib
+from collections.abc import Mapping
+from typing import Iterator
+
+# the backends are imported on first use, e.g. the process backend imports shared_memory and psutil
+_MEMORY_TRACER_PATHS = {
+    "thread": ("memory_magics.memory_tracer.thread_memory_tracer", "ThreadMemoryTracer"),
+    "process": ("memory_magics.memory_tracer.context_memory_tracer", "ContextMemoryTracer"),
+}
+
+
+class _MemoryTracers(Mapping):
+    """Memory tracer classes by backend name, each class is imported on its first lookup."""
+
+    def __getitem__(self, backend: str) -> type:
+        module_name, class_name = _MEMORY_TRACER_PATHS[backend]
+        return getattr(importlib.import_module(module_name), class_name)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(_MEMORY_TRACER_PATHS)
+
+    def __len__(self) -> int:
+        return len(_MEMORY_TRACER_PATHS)
+
+
+MEMORY_TRACERS = _MemoryTracers()
+
+
+def __getattr__(name: str):
+    for module_name, class_name in _MEMORY_TRACER_PATHS.values():
+        if name == class_name:
+            return getattr(importlib.import_module(module_name), class_name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+__all__ = ["ContextMemoryTracer", "ThreadMemoryTracer", "MEMORY_TRACERS"]
@@ -1,84 +1,535 @@
 """
 Script for tracing peak memory usage of the specified processes.
-The program is running until terminated.
+
+The program is a long-lived daemon controlled through its standard input, one command per line:
+
+- ``arm <interval> <metric> <pid> [<pid> ...]``: reset the peaks and start tracing the processes, the interval is
+  a number of milliseconds or ``auto:<min>:<max>:<cpu budget>`` for an adaptive interval, see `AdaptiveInterval`,
+  the metric is ``rss``, ``pss`` or ``uss``, see `ProcessMemoryReader`,
+  ``armed`` is written to the standard output once the first sample is taken;
+- ``disarm``: stop tracing, ``disarmed`` is written to the standard output once the last sample is taken.
+
+The current and peak memory usages are published on every sample to the shared memory block,
+which name is passed as the only argument, see `PeakMemoryBuffer` for its layout.
+The program exits when its standard input is closed.
 """
 
 import argparse
-from time import sleep
-from typing import Iterable
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from array import array
+from contextlib import ExitStack, suppress
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Set, TextIO, Tuple, Union
 
-import psutil
+if TYPE_CHECKING:
+    from multiprocessing import shared_memory
 
+    import psutil
 
-def parse_args() -> argparse.Namespace:
-    parser = argparse.ArgumentParser(description="Trace the peak memory usage of a process.")
+# psutil and shared_memory are imported on first use, so that loading the extension stays fast
 
-    parser.add_argument(
-        "pids",
-        type=int,
-        nargs="+",
-        help="Ids of the processes to trace peak memory usage of",
-    )
+# maximum number of processes, which memory usages fit in a buffer
+MAX_PIDS = 1024
 
-    parser.add_argument(
-        "output",
-        type=str,
-        help="Output file to save peak memory usage to",
-    )
+# size of the memory pages, which /proc/<pid>/statm counts the memory in
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096  # noqa: WPS432
 
-    parser.add_argument(
-        "--interval",
-        type=float,
-        default=10.0,
-        nargs="?",
-        help="Interval in milliseconds for checking memory usage",
-    )
+# processes, which smaps_rollup cannot be opened for, e.g. on Linux before 4.14 or without the permissions
+SMAPS_ROLLUP_UNAVAILABLE: Set[int] = set()
 
-    return parser.parse_args()
+# memory usage changes smaller than this are considered flat by the adaptive interval
+FLAT_MEMORY_CHANGE = 65536
+
+# latest current and peak memory usages by process id, and the total ones
+PeakMemoryUsages = Tuple[Dict[int, int], Dict[int, int], int, int]
+
+# metric read from /proc/<pid>/statm, the other ones are read from smaps_rollup
+_RSS = "rss"
+
+# type code of the int64 numbers of the buffers
+_INT64 = "q"
+
+# sizes of the buffers that the statm and smaps_rollup files are read into
+_STATM_SIZE = 256
+_SMAPS_ROLLUP_SIZE = 4096
+
+
+class PeakMemoryBuffer:
+    """Fixed-layout array of int64 numbers with the current and peak memory usages of processes.
+
+    The layout is ``[sequence, n_pids, total_current, total_peak, (pid, current, peak) * MAX_PIDS]``.
+    The sequence number is odd while the buffer is being written, so a reader can retry a torn read.
+    """
+
+    header_size = 4
+    slot_size = 3
+    size = (header_size + slot_size * MAX_PIDS) * 8
+
+    def __init__(self, buffer: Optional[memoryview] = None) -> None:
+        if buffer is None:
+            buffer = memoryview(bytearray(self.size))
+        self._view = buffer[: self.size].cast(_INT64)
+
+    def write(
+        self, pids: List[int], currents: List[int], peaks: List[int], total_current: int, total_peak: int
+    ) -> None:
+        """Publish the current and peak memory usages of the processes."""
+
+        view = self._view
+        view[0] += 1
+        view[1] = len(pids)
+        view[2] = total_current
+        view[3] = total_peak
+        for slot_field, numbers in enumerate((pids, currents, peaks)):
+            start = self.header_size + slot_field
+            view[start : start + self.slot_size * len(numbers) : self.slot_size] = array(_INT64, numbers)  # noqa: E203
+        view[0] += 1
+
+    def read(self) -> PeakMemoryUsages:
+        """Read the current and peak memory usages by process id, and the total current and peak memory usages."""
+
+        view = self._view
+        while True:
+            sequence = view[0]
+            if sequence % 2:
+                continue
+            n_pids = view[1]
+            slots = view[self.header_size : self.header_size + self.slot_size * n_pids].tolist()  # noqa: E203
+            total_current, total_peak = view[2], view[3]
+            if view[0] == sequence:
+                break
+
+        pids = slots[:: self.slot_size]
+        currents = dict(zip(pids, slots[1 :: self.slot_size]))  # noqa: E203
+        peaks = dict(zip(pids, slots[2 :: self.slot_size]))  # noqa: E203
+
+        return currents, peaks, total_current, total_peak
+
+    def release(self) -> None:
+        self._view.release()
+
+
+class TimelineBuffer:
+    """Preallocated ring buffer of the sample times, the memory usages of processes and the traced memory.
+
+    Only the last `capacity` samples are kept. The traced memory is 0 if tracemalloc is not tracing.
+    """
+
+    def __init__(self, n_pids: int = 1, capacity: int = 100000) -> None:
+        self.n_pids: int = n_pids
+        self.capacity: int = capacity
+
+        self._times = array("d", bytes(8 * capacity))
+        self._memory_usages = array(_INT64, bytes(8 * capacity * n_pids))
+        self._traced = array(_INT64, bytes(8 * capacity))
+        self._next: int = 0
+        self._count: int = 0
+
+    def append(self, timestamp: float, memory_usages: List[int], traced: int) -> None:
+        index = self._next
+        self._times[index] = timestamp
+        start = index * self.n_pids
+        self._memory_usages[start : start + self.n_pids] = array(_INT64, memory_usages)  # noqa: E203
+        self._traced[index] = traced
+
+        self._next = (index + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+
+    def read(self) -> Tuple[List[float], List[List[int]], List[int]]:
+        """Read the sample times, the memory usages series of every process and the traced memory series."""
+
+        start = self._next - self._count
+        indices = [index % self.capacity for index in range(start, start + self._count)]
+
+        times = [self._times[index] for index in indices]
+        memory_usages = [
+            [self._memory_usages[index * self.n_pids + i] for index in indices]
+            for i in range(self.n_pids)  # noqa: WPS111
+        ]
+        traced = [self._traced[index] for index in indices]
+
+        return times, memory_usages, traced
+
+    def __len__(self) -> int:
+        return self._count
+
+
+class ProcessMemoryReader:
+    """Read the memory usages of processes in batches.
+
+    The metric is 'rss', the resident set size, 'pss', the proportional set size, where every shared page
+    is divided between the processes sharing it, or 'uss', the unique set size, the memory that would be freed
+    if the process exited. PSS and USS are not double-counted across processes, but are slower to read.
+
+    On Linux, `/proc/<pid>/statm` (RSS) or `/proc/<pid>/smaps_rollup` (PSS and USS) files are opened once and
+    re-read from the start into a reusable buffer on every read, so the cost of a read grows with the bytes read
+    rather than with the Python objects created. The files stay open when the reader is reset to other processes
+    or another metric, except the ones that are not read anymore, until the reader is closed. Elsewhere, or if
+    a file cannot be opened, psutil is used, and the processes which `smaps_rollup` cannot be opened for are
+    remembered. The memory usages of the processes that have exited are left unchanged.
+    """
+
+    metrics = (_RSS, "pss", "uss")
+
+    def __init__(self, pids: Iterable[int] = (), metric: str = _RSS) -> None:
+        self.pids: List[int] = []
+        self.metric: str = metric
+
+        self._paths: List[Optional[str]] = []
+        self._fds: List[Optional[int]] = []
+        self._processes: List[Optional["psutil.Process"]] = []
+        self._open_files: Dict[str, int] = {}
+        self._buffer = bytearray()
+        self.reset(pids, metric)
+
+    def reset(self, pids: Iterable[int], metric: Optional[str] = None) -> None:
+        """Read the memory usages of other processes, or with another metric, reusing the files already open."""
+
+        metric = metric if metric is not None else self.metric
+        if metric not in self.metrics:
+            metrics = ", ".join(self.metrics)
+            raise ValueError(f"metric must be one of: {metrics}")
+
+        self.pids = list(pids)
+        self.metric = metric
+
+        self._paths = [self._get_path(pid) for pid in self.pids]
+        for unused_path in self._open_files.keys() - set(self._paths):
+            os.close(self._open_files.pop(unused_path))
+        self._fds = list(map(self._open, self.pids, self._paths))
+        self._processes = [_get_process(pid) if fd is None else None for pid, fd in zip(self.pids, self._fds)]
+        self._buffer = bytearray(_STATM_SIZE if metric == _RSS else _SMAPS_ROLLUP_SIZE)
+
+    def read(self, memory_usages: Optional[List[int]] = None) -> List[int]:
+        """Read the memory usages of the processes into a list, which is updated in place if it is passed."""
+
+        if memory_usages is None:
+            memory_usages = [0] * len(self.pids)
+
+        for index, fd in enumerate(self._fds):
+            if fd is not None:
+                memory_usages[index] = self._read_file(index, memory_usages[index])
+            elif self._processes[index] is not None:
+                memory_usages[index] = self._read_psutil(self._processes[index], memory_usages[index])
+
+        return memory_usages
+
+    def close(self) -> None:
+        for fd in self._open_files.values():
+            os.close(fd)
+        self._open_files = {}
+        self._fds = [None] * len(self.pids)
+        self._processes = [None] * len(self.pids)
+
+    def _get_path(self, pid: int) -> Optional[str]:
+        """Get the path of the file to read the memory usage of a process from, None if psutil is used."""
+
+        if not hasattr(os, "preadv"):
+            return None
+        if self.metric == _RSS:
+            return f"/proc/{pid}/statm"
+        if pid in SMAPS_ROLLUP_UNAVAILABLE:
+            return None
+        return f"/proc/{pid}/smaps_rollup"
+
+    def _open(self, pid: int, path: Optional[str]) -> Optional[int]:
+        """Get the file descriptor of an open file, opening it if it is not open yet."""
 
+        if path is None or path in self._open_files:
+            return self._open_files.get(path)
 
-def trace_peak_memory_usage(
-    pids: Iterable[int],
-    output: str,
-    interval: float = 10.0,
-) -> None:
-    """Trace memory usage of the specified processes and write peak values to a file."""
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            if self.metric != _RSS:
+                SMAPS_ROLLUP_UNAVAILABLE.add(pid)
+            return None
+        self._open_files[path] = fd
+        return fd
 
-    processes = [psutil.Process(pid) for pid in pids]
-    memory_usages_current = [0] * len(processes)
-    memory_usages_peak = [0] * len(processes)
-    total_peak = 0
+    def _read_file(self, index: int, default: int) -> int:
+        """Read the memory usage of the process at the index from its file, `default` if it has exited."""
 
-    line_count = 0
-    while True:
-        for i, process in enumerate(processes):  # noqa: WPS111
-            memory_usages_current[i] = process.memory_info().rss
-        total_current = sum(memory_usages_current)
+        fd = self._fds[index]
+        try:
+            size = os.preadv(fd, [self._buffer], 0)
+        except OSError:
+            # the process has exited, its file may be read at several indices
+            if self._open_files.pop(self._paths[index], None) == fd:
+                os.close(fd)
+            self._fds[index] = None
+            return default
+        return self._parse(size)
 
-        memory_usages_peak = list(map(max, memory_usages_current, memory_usages_peak))  # type: ignore
-        total_peak = max(total_current, total_peak)
-        memory_usage = " ".join(map(str, memory_usages_peak)) + " " + str(total_peak) + "\n"
+    def _parse(self, size: int) -> int:
+        buffer = self._buffer
+        if self.metric == _RSS:
+            # statm fields are separated by single spaces, the second one is the resident set size in pages
+            start = buffer.index(b" ", 0, size) + 1
+            stop = buffer.index(b" ", start, size)
+            return int(buffer[start:stop]) * PAGE_SIZE
+        if self.metric == "pss":
+            return _parse_smaps_field(buffer, size, b"\nPss:")
+        return _parse_smaps_field(buffer, size, b"\nPrivate_Clean:") + _parse_smaps_field(
+            buffer, size, b"\nPrivate_Dirty:"
+        )
 
-        memory_peaks_file = open(output, "a", encoding="utf-8")
-        memory_peaks_file.write(memory_usage)
+    def _read_psutil(self, process: "psutil.Process", default: int) -> int:
+        import psutil  # noqa: WPS433, WPS442
 
-        # clear the file, so it doesn't get infinitely large
-        if line_count > 1000:
-            lines = memory_peaks_file.readlines()[-10:]
-            memory_peaks_file.truncate()
-            memory_peaks_file.seek(0)
-            memory_peaks_file.writelines(lines)
-            line_count = 0
+        try:
+            memory_info = process.memory_info() if self.metric == _RSS else process.memory_full_info()
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            return default
+        # PSS is only available on Linux
+        return getattr(memory_info, self.metric, memory_info.rss)
 
-        memory_peaks_file.close()
 
-        line_count += 1
-        sleep(interval / 1000)
+def _parse_smaps_field(buffer: bytearray, size: int, field: bytes) -> int:
+    """Parse a ``<field>:   <number> kB`` line of a smaps file into a number of bytes."""
+
+    start = buffer.find(field, 0, size)
+    if start == -1:
+        return 0
+    start += len(field)
+    stop = buffer.index(b"kB", start, size)
+    return int(buffer[start:stop]) * 1024
+
+
+class AdaptiveInterval:
+    """Sampling interval adapting to the memory usage changes.
+
+    The interval drops to `min_interval` milliseconds while the memory usage is rising, or changing near its peak,
+    and doubles up to `max_interval` milliseconds on every sample while it is flat or falling. The interval is never
+    shorter than the duration of a sample divided by `cpu_budget`, the fraction of a CPU core the sampler may use.
+    """
+
+    # fraction of the peak memory usage, above which the memory usage is near the peak
+    _near_peak = 0.9
+
+    def __init__(self, min_interval: float = 1.0, max_interval: float = 100.0, cpu_budget: float = 0.02) -> None:
+        if not 0 < min_interval <= max_interval:
+            raise ValueError("intervals must be positive and min_interval must not exceed max_interval")
+        if not 0 < cpu_budget <= 1:
+            raise ValueError("cpu_budget must be in (0, 1]")
+
+        self.min_interval: float = min_interval
+        self.max_interval: float = max_interval
+        self.cpu_budget: float = cpu_budget
+
+        self.interval: float = min_interval
+        self._previous_memory: Optional[int] = None
+
+    @classmethod
+    def from_string(cls, interval: str) -> "AdaptiveInterval":
+        """Parse an interval formatted as ``auto:<min>:<max>:<cpu budget>``."""
+
+        _, *numbers = interval.split(":")
+        return cls(*map(float, numbers))
+
+    def reset(self) -> None:
+        self.interval = self.min_interval
+        self._previous_memory = None
+
+    def update(self, memory_current: int, memory_peak: int, sample_duration: float) -> float:
+        """Get the next interval after a sample of the total current and peak memory usages."""
+
+        if self._previous_memory is not None:
+            change = memory_current - self._previous_memory
+            rising = change > FLAT_MEMORY_CHANGE
+            near_peak = memory_current >= self._near_peak * memory_peak
+            if rising or (near_peak and abs(change) > FLAT_MEMORY_CHANGE):
+                self.interval = self.min_interval
+            else:
+                self.interval = min(self.interval * 2, self.max_interval)
+        self._previous_memory = memory_current
+
+        return max(self.interval, sample_duration * 1000 / self.cpu_budget)
+
+    def __str__(self) -> str:
+        return f"auto:{self.min_interval:g}:{self.max_interval:g}:{self.cpu_budget:g}"
+
+
+def parse_interval(interval: str) -> Union[float, AdaptiveInterval]:
+    """Parse an interval in milliseconds or an adaptive interval."""
+
+    if interval.startswith("auto"):
+        return AdaptiveInterval.from_string(interval)
+    return float(interval)
+
+
+class PeakMemoryTracer:
+    """Trace peak memory usage of processes in a background thread while armed."""
+
+    def __init__(self, buffer: Optional[PeakMemoryBuffer] = None) -> None:
+        self.interval: Union[float, AdaptiveInterval] = 10.0
+        self.metric: str = _RSS
+        self.buffer: PeakMemoryBuffer = buffer if buffer is not None else PeakMemoryBuffer()
+
+        self._pids: List[int] = []
+        self._reader: ProcessMemoryReader = ProcessMemoryReader([])
+        self._memory_usages_current: List[int] = []
+        self._memory_usages_peak: List[int] = []
+        self._total_peak: int = 0
+        self._timeline: Optional[TimelineBuffer] = None
+        self._next_interval: float = 10.0
+
+        self._lock = threading.Lock()
+        self._armed = threading.Event()
+        self._disarmed = threading.Event()
+        self._disarmed.set()
+        self._stopped = False
+
+        self._thread = threading.Thread(target=self._run, name="memory-tracer", daemon=True)
+        self._thread.start()
+
+    def arm(
+        self,
+        pids: Iterable[int],
+        interval: Union[float, AdaptiveInterval],
+        timeline: Optional[TimelineBuffer] = None,
+        metric: str = _RSS,
+    ) -> None:
+        """Reset the peaks and start tracing, the samples are also appended to the timeline if it is set.
+
+        The interval is a number of milliseconds or an adaptive interval, the metric is one of
+        `ProcessMemoryReader.metrics`.
+        """
+
+        pids = list(pids)
+        if len(pids) > MAX_PIDS:
+            raise ValueError(f"cannot trace more than {MAX_PIDS} processes")
+        if timeline is not None and timeline.n_pids != len(pids):
+            raise ValueError("timeline must have a column for every traced process")
+
+        with self._lock:
+            self.interval = interval
+            self.metric = metric
+            if isinstance(interval, AdaptiveInterval):
+                interval.reset()
+            self._pids = pids
+            # the files of the processes traced again are kept open
+            self._reader.reset(pids, metric)
+            self._memory_usages_current = [0] * len(pids)
+            self._memory_usages_peak = [0] * len(pids)
+            self._total_peak = 0
+            self._timeline = timeline
+            self._sample()
+
+        self._disarmed.clear()
+        self._armed.set()
+
+    def disarm(self) -> None:
+        self._armed.clear()
+        self._disarmed.set()
+
+        with self._lock:
+            self._sample()
+
+    def stop(self) -> None:
+        self._stopped = True
+        self._disarmed.set()
+        self._armed.set()
+        self._thread.join()
+        self._reader.close()
+
+    def _run(self) -> None:
+        while True:
+            self._armed.wait()
+            if self._stopped:
+                return
+            if self._disarmed.wait(self._next_interval / 1000):
+                continue
+            with self._lock:
+                if self._armed.is_set():
+                    self._sample()
+
+    def _sample(self) -> None:
+        sample_start = time.perf_counter()
+        self._reader.read(self._memory_usages_current)
+        total_current = sum(self._memory_usages_current)
+
+        self._memory_usages_peak = list(map(max, self._memory_usages_current, self._memory_usages_peak))
+        self._total_peak = max(total_current, self._total_peak)
+
+        self.buffer.write(
+            self._pids, self._memory_usages_current, self._memory_usages_peak, total_current, self._total_peak
+        )
+        if self._timeline is not None:
+            traced = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+            self._timeline.append(time.perf_counter(), self._memory_usages_current, traced)
+
+        if isinstance(self.interval, AdaptiveInterval):
+            sample_duration = time.perf_counter() - sample_start
+            self._next_interval = self.interval.update(total_current, self._total_peak, sample_duration)
+        else:
+            self._next_interval = self.interval
+
+
+def _get_process(pid: int) -> Optional["psutil.Process"]:
+    import psutil  # noqa: WPS433, WPS442
+
+    with suppress(psutil.NoSuchProcess, psutil.AccessDenied):
+        return psutil.Process(pid)
+    return None
+
+
+def attach_shared_memory(name: str) -> "shared_memory.SharedMemory":
+    """Attach to a shared memory block owned by another process."""
+
+    from multiprocessing import resource_tracker, shared_memory  # noqa: WPS433, WPS442
+
+    memory = shared_memory.SharedMemory(name=name)
+    # the block is owned and unlinked by the process that created it
+    resource_tracker.unregister(memory._name, "shared_memory")  # noqa: WPS437
+    return memory
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Trace the peak memory usage of processes.")
+
+    parser.add_argument(
+        "shared_memory",
+        type=str,
+        help="Name of the shared memory block to publish memory usages to",
+    )
+
+    return parser.parse_args()
+
+
+def serve(stdin: TextIO, stdout: TextIO, buffer: PeakMemoryBuffer) -> None:
+    """Execute commands from the standard input until it is closed."""
+
+    tracer = PeakMemoryTracer(buffer)
+
+    for line in stdin:
+        command, *args = line.split()
+        if command == "arm":
+            interval, metric, *pids = args
+            tracer.arm(map(int, pids), parse_interval(interval), metric=metric)
+            stdout.write("armed\n")
+        elif command == "disarm":
+            tracer.disarm()
+            stdout.write("disarmed\n")
+        else:
+            raise ValueError(f"unknown command: {command}")
+        stdout.flush()
+
+    tracer.stop()
 
 
 def main() -> None:
     args = parse_args()
-    trace_peak_memory_usage(**vars(args))
+
+    with ExitStack() as stack:
+        memory = attach_shared_memory(args.shared_memory)
+        stack.callback(memory.close)
+        buffer = PeakMemoryBuffer(memory.buf)
+        stack.callback(buffer.release)
+        serve(sys.stdin, sys.stdout, buffer)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,139 @@
+"""Memory tracer of the descendant processes of a process."""
+
+from __future__ import annotations
+
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager, suppress
+from typing import Iterable, Iterator
+
+from memory_magics.memory_tracer._memory_tracer import ProcessMemoryReader
+
+
+class ChildrenMemoryTracer:
+    """Trace the memory usage of a process and of its descendants, e.g. multiprocessing, joblib or Dask workers.
+
+    The memory usages are sampled from a thread every `interval` milliseconds, and the process tree is re-scanned
+    every `scan_interval` milliseconds to pick up the new workers, so a worker that lives shorter than
+    the scan interval may be missed, and an exited worker is counted until the next scan.
+    The processes in `excluded_pids`, e.g. tracer processes, and their descendants are not traced, nor
+    the multiprocessing resource tracker of the current process, which is started by the shared memory of the tracers.
+    """
+
+    def __init__(
+        self,
+        pid: int | None = None,
+        interval: float = 10.0,
+        scan_interval: float = 100.0,
+        metric: str = "rss",
+        excluded_pids: Iterable[int] = (),
+    ) -> None:
+        self.pid: int = pid if pid is not None else os.getpid()
+        self.interval: float = interval
+        self.scan_interval: float = scan_interval
+        self.metric: str = metric
+        self.excluded_pids: set[int] = set(excluded_pids)
+
+        self.children_current: int = 0
+        self.children_peak: int = 0
+        self.tree_current: int = 0
+        self.tree_peak: int = 0
+        self.children_count_peak: int = 0
+
+        self._children_pids: list[int] = []
+        self._reader: ProcessMemoryReader | None = None
+        self._memory_usages: list[int] = []
+        self._stop_event = threading.Event()
+
+    @contextmanager
+    def watch(self) -> Iterator[None]:
+        """Trace the process tree while in the context."""
+
+        self._start()
+        thread = threading.Thread(target=self._watch, name="memory-children", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            self._stop_event.set()
+            thread.join()
+            # the workers could be started or stopped after the last scan
+            self._scan()
+            self._sample()
+            self._reader.close()
+            self._reader = None
+
+    def _start(self) -> None:
+        """Reset the memory usages and take the first sample of the process tree."""
+
+        self.children_current = 0
+        self.children_peak = 0
+        self.tree_current = 0
+        self.tree_peak = 0
+        self.children_count_peak = 0
+        self._stop_event.clear()
+
+        self._scan()
+        self._sample()
+
+    def _watch(self) -> None:
+        next_scan = time.monotonic() + self.scan_interval / 1000
+        while not self._stop_event.wait(self.interval / 1000):
+            if time.monotonic() >= next_scan:
+                self._scan()
+                next_scan = time.monotonic() + self.scan_interval / 1000
+            self._sample()
+
+    def _scan(self) -> None:
+        import psutil  # noqa: WPS433
+
+        children = []
+        with suppress(psutil.NoSuchProcess, psutil.AccessDenied):
+            children = psutil.Process(self.pid).children(recursive=True)
+        excluded_pids = self._get_excluded_pids(children)
+        children_pids = [child.pid for child in children if child.pid not in excluded_pids]
+
+        if self._reader is not None and children_pids == self._children_pids:
+            return
+        if self._reader is None:
+            self._reader = ProcessMemoryReader(metric=self.metric)
+        self._children_pids = children_pids
+        self._reader.reset([self.pid, *children_pids])
+        self._memory_usages = [0] * (len(children_pids) + 1)
+
+    def _get_excluded_pids(self, children: list) -> set[int]:
+        import psutil  # noqa: WPS433
+
+        excluded_pids = set(self.excluded_pids)
+        resource_tracker_pid = get_resource_tracker_pid() if self.pid == os.getpid() else None
+        if resource_tracker_pid is not None:
+            excluded_pids.add(resource_tracker_pid)
+        if excluded_pids.isdisjoint(child.pid for child in children):
+            return excluded_pids
+
+        # the descendants are listed after their parents, so the excluded subtrees are found in one pass
+        for child in children:
+            with suppress(psutil.NoSuchProcess, psutil.AccessDenied):
+                if child.ppid() in excluded_pids:
+                    excluded_pids.add(child.pid)
+        return excluded_pids
+
+    def _sample(self) -> None:
+        process_memory, *children_memory = self._reader.read(self._memory_usages)
+
+        self.children_current = sum(children_memory)
+        self.children_peak = max(self.children_peak, self.children_current)
+        self.tree_current = process_memory + self.children_current
+        self.tree_peak = max(self.tree_peak, self.tree_current)
+        self.children_count_peak = max(self.children_count_peak, len(children_memory))
+
+
+def get_resource_tracker_pid() -> int | None:
+    """Get the id of the multiprocessing resource tracker process of the current process, None if not started."""
+
+    resource_tracker = sys.modules.get("multiprocessing.resource_tracker")
+    if resource_tracker is None:
+        return None
+    return resource_tracker._resource_tracker._pid  # noqa: WPS437
@@ -2,67 +2,152 @@
 
 from __future__ import annotations
 
-import os
 import subprocess
-from tempfile import mkstemp
-from time import sleep
+import sys
+import weakref
+from multiprocessing import shared_memory
 from typing import Iterable
 
 from memory_magics.memory_tracer import _memory_tracer
-from memory_magics.utils.jupyter import get_last_line
 
 
 class ContextMemoryTracer:
-    """Context Manager to trace Jupyter notebook peak memory usage."""
+    """Context Manager to trace Jupyter notebook peak memory usage.
 
-    def __init__(self, pids: Iterable[int], interval: float = 10.0) -> None:
-        self.pids: Iterable[int] = pids
-        self.interval: float = interval
+    The tracing is done by a long-lived tracer process, which is started once
+    and then armed on enter and disarmed on exit through its standard input.
+    The tracer process publishes memory usages to a shared memory block.
+    If the tracer is not stopped, e.g. the kernel exits without unloading the extension, the process is stopped
+    and the block is unlinked when the tracer is garbage collected or at the interpreter exit.
+    """
 
+    backend = "process"
+
+    def __init__(
+        self, pids: Iterable[int] = (), interval: float | _memory_tracer.AdaptiveInterval = 10.0, metric: str = "rss"
+    ) -> None:
+        self.pids: list[int] = list(pids)
+        self.interval: float | _memory_tracer.AdaptiveInterval = interval
+        self.metric: str = metric
+
+        self.memory_usages_current: dict[int, int] = {}
         self.memory_usages_peak: dict[int, int] = {}
         self.total_peak: int | None = None
 
-        self._file_handle: int | None = None
-        self._file_path: str | None = None
         self._process: subprocess.Popen | None = None
+        self._shared_memory: shared_memory.SharedMemory | None = None
+        self._buffer: _memory_tracer.PeakMemoryBuffer | None = None
+        self._finalizer: weakref.finalize | None = None
 
-    def __enter__(self) -> None:
-        file_handle, file_path = mkstemp()
+    @property
+    def is_running(self) -> bool:
+        return self._process is not None and self._process.poll() is None
+
+    @property
+    def pid(self) -> int | None:
+        """Process id of the tracer process if it is running."""
 
-        self._file_handle = file_handle
-        self._file_path = file_path
+        return self._process.pid if self.is_running else None
 
-        cmdline = [
-            "python",
-            _memory_tracer.__file__,
-            *map(str, self.pids),
-            file_path,
-            "--interval",
-            str(self.interval),
-        ]
+    def start(self) -> None:
+        """Start the tracer process if it is not running."""
+
+        if self.is_running:
+            return
+        if self._shared_memory is None:
+            self._shared_memory = shared_memory.SharedMemory(create=True, size=_memory_tracer.PeakMemoryBuffer.size)
+            self._buffer = _memory_tracer.PeakMemoryBuffer(self._shared_memory.buf)
 
         self._process = subprocess.Popen(
-            cmdline,
+            [sys.executable, _memory_tracer.__file__, self._shared_memory.name],
+            stdin=subprocess.PIPE,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
+            text=True,
         )
-        sleep(0.1)  # for script to load
+
+        # the finalizer of an exited process still holds the block, it is replaced
+        if self._finalizer is not None:
+            self._finalizer.detach()
+        self._finalizer = weakref.finalize(self, _stop_tracer, self._process, self._shared_memory, self._buffer)
+
+    def stop(self) -> None:
+        """Stop the tracer process."""
+
+        if self._finalizer is not None:
+            self._finalizer()
+            self._finalizer = None
+        self._process = None
+        self._shared_memory = None
+        self._buffer = None
+
+    def arm(
+        self,
+        pids: Iterable[int] | None = None,
+        interval: float | _memory_tracer.AdaptiveInterval | None = None,
+        metric: str | None = None,
+    ) -> None:
+        """Reset the peaks and start tracing."""
+
+        if pids is not None:
+            self.pids = list(pids)
+        if interval is not None:
+            self.interval = interval
+        if metric is not None:
+            self.metric = metric
+
+        self.start()
+        pids = " ".join(map(str, self.pids))
+        self._send(f"arm {self.interval} {self.metric} {pids}")
+
+    def disarm(self) -> None:
+        """Stop tracing and read the peaks."""
+
+        self._send("disarm")
+        current, peak, _, total_peak = self.read()
+        self.memory_usages_current = current
+        self.memory_usages_peak = peak
+        self.total_peak = total_peak
+
+    def read(self) -> _memory_tracer.PeakMemoryUsages:
+        """Read the latest current and peak memory usages by process id, and the total ones, while armed."""
+
+        return self._buffer.read()
+
+    def __enter__(self) -> None:
+        self.arm()
 
     def __exit__(self, exc_type, exc_val, exc_tb) -> None:
-        self._process.terminate()
+        self.disarm()
 
-        stream = self._process.communicate()
-        return_code = self._process.returncode
+    def _send(self, command: str) -> str:
+        """Send a command to the tracer process and return its response."""
 
-        if return_code != -15:
-            raise NotImplementedError(stream[-1])
+        self._process.stdin.write(command + "\n")
+        self._process.stdin.flush()
 
-        memory_usages_peak = get_last_line(self._file_path, skip_empty=True).split()
-        memory_usages_peak = list(map(int, memory_usages_peak))
-        memory_usages_peak, total_peak = memory_usages_peak[:-1], memory_usages_peak[-1]
+        response = self._process.stdout.readline()
+        if not response:
+            stderr = self._process.communicate()[-1]
+            self._process = None
+            raise RuntimeError(f"memory tracer process exited unexpectedly:\n{stderr}")
 
-        os.close(self._file_handle)
-        os.remove(self._file_path)
+        return response
 
-        self.memory_usages_peak = dict(zip(self.pids, memory_usages_peak))
-        self.total_peak = total_peak
+
+def _stop_tracer(
+    process: subprocess.Popen, memory: shared_memory.SharedMemory, buffer: _memory_tracer.PeakMemoryBuffer
+) -> None:
+    """Stop a tracer process if it is running, and release and unlink its shared memory block."""
+
+    if process.poll() is None:
+        process.stdin.close()
+        try:
+            process.wait(timeout=1)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+    buffer.release()
+    memory.close()
+    memory.unlink()
@@ -0,0 +1,148 @@
+"""Memory tracer finding the allocation sites leaking across repeated executions."""
+
+from __future__ import annotations
+
+import gc
+import operator
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import dataclass
+from itertools import repeat
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+from memory_magics.memory_tracer.snapshot_memory_tracer import group_traces, is_excluded_traceback
+
+# sites, which retained size fits a line worse than this, are not leaking steadily
+MIN_R_SQUARED = 0.8
+
+# runs, after which the retained size of a site changed, and the new sizes
+SizeChanges = List[Tuple[int, int]]
+SiteSizes = Tuple[tuple, List[int]]
+
+
+@dataclass
+class LeakSite:
+    """Allocation site, which retained size grows with the number of runs.
+
+    `size` is the size retained by the site after the last run, `growth` is its increment since the first run,
+    `slope` is the number of bytes retained by every run and `r_squared` is how well a line fits the retained sizes.
+    """
+
+    traceback: tracemalloc.Traceback
+    size: int
+    growth: int
+    slope: float
+    r_squared: float
+
+
+class LeakMemoryTracer:
+    """Find allocation sites, which retained memory grows steadily with the number of runs of a code.
+
+    The allocations are traced with tracemalloc while in `trace`. After every run the garbage is collected,
+    a snapshot is taken and its traces are grouped into the retained sizes of the sites of the `depth` most recent
+    frames. Each grouping is compared with the previous one only, and only the sizes that changed are kept,
+    so a run costs a single pass over the traces retained since the tracing started rather than a full snapshot
+    diff, and the sites allocated by IPython and this library are filtered out at the end. A least-squares line
+    is fitted to the retained sizes of every site that changed: the sites with a positive slope and a good fit
+    are leaking.
+    """
+
+    def __init__(self, depth: int = 1) -> None:
+        if depth < 1:
+            raise ValueError("depth must be greater than or equal to 1")
+
+        self.depth: int = depth
+        self.runs: int = 0
+
+        self._sizes: dict[tuple, int] = {}
+        self._changes: Dict[tuple, SizeChanges] = {}
+
+    @contextmanager
+    def trace(self) -> Iterator[None]:
+        """Trace the allocations while in the context, the runs are recorded with `record`."""
+
+        self.runs = 0
+        self._sizes = {}
+        self._changes = {}
+
+        tracemalloc.start(self.depth)
+        try:
+            yield
+        finally:
+            tracemalloc.stop()
+
+    def record(self) -> None:
+        """Record the retained sizes of the allocation sites after a run, the first record is the baseline."""
+
+        gc.collect()
+        snapshot = tracemalloc.take_snapshot()
+        groups = group_traces(snapshot, self.depth)
+        del snapshot  # noqa: WPS420
+        sizes = {traceback: size for traceback, (size, _) in groups.items()}
+
+        for traceback, size in sizes.items():
+            if self._sizes.get(traceback, 0) != size:
+                self._changes.setdefault(traceback, []).append((self.runs, size))
+        for freed_traceback in self._sizes.keys() - sizes.keys():
+            self._changes[freed_traceback].append((self.runs, 0))
+
+        self._sizes = sizes
+        self.runs += 1
+
+    def trend(self) -> tuple[float, float]:
+        """Get the number of bytes retained by every run in total, and how well a line fits the retained sizes."""
+
+        retained = list(repeat(0, self.runs))
+        for _, sizes in self._iter_sizes():
+            retained = [total + size for total, size in zip(retained, sizes)]
+        return fit_line(retained)
+
+    def leaks(self) -> list[LeakSite]:
+        """Get the leaking allocation sites, ordered by the number of bytes retained by every run."""
+
+        sites = []
+        for traceback, sizes in self._iter_sizes():
+            slope, r_squared = fit_line(sizes)
+            size = sizes[-1]
+            growth = size - sizes[0]
+            if slope > 0 and r_squared >= MIN_R_SQUARED and growth > 0:
+                sites.append(LeakSite(tracemalloc.Traceback(traceback), size, growth, slope, r_squared))
+
+        return sorted(sites, key=lambda site: site.slope, reverse=True)
+
+    def _iter_sizes(self) -> Iterator[SiteSizes]:
+        """Iterate over the retained sizes of the sites after every run, the sites that never changed are skipped.
+
+        The sites are filtered out after the tracing, so that the caches of the filter are not traced.
+        """
+
+        for traceback, changes in self._changes.items():
+            first_run = changes[0][0]
+            if (len(changes) < 2 and first_run == 0) or is_excluded_traceback(traceback):
+                continue
+
+            next_runs = [run for run, _ in changes[1:]]
+            sizes = list(repeat(0, first_run))
+            for (run, size), next_run in zip(changes, [*next_runs, self.runs]):
+                sizes.extend(repeat(size, next_run - run))
+            yield traceback, sizes
+
+
+def fit_line(sizes: Sequence[int]) -> tuple[float, float]:
+    """Fit a least-squares line to sizes against their indices, get its slope and coefficient of determination."""
+
+    n_sizes = len(sizes)
+    if n_sizes < 2:
+        return 0, 0
+
+    mean_index = (n_sizes - 1) / 2
+    mean_size = sum(sizes) / n_sizes
+    index_deviations = [index - mean_index for index in range(n_sizes)]
+    size_deviations = [size - mean_size for size in sizes]
+    index_variance = sum(deviation**2 for deviation in index_deviations)
+    size_variance = sum(deviation**2 for deviation in size_deviations)
+    if not size_variance:
+        return 0, 0
+
+    covariance = sum(map(operator.mul, index_deviations, size_deviations))
+    return covariance / index_variance, covariance**2 / (index_variance * size_variance)
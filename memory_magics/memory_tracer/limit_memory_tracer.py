@@ -0,0 +1,78 @@
+"""Memory tracer interrupting the execution when the memory usage exceeds a limit."""
+
+from __future__ import annotations
+
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+
+class MemoryLimitExceeded(MemoryError):
+    """Raised in the executing thread when its process memory usage exceeds the limit."""
+
+
+class LimitMemoryTracer:
+    """Interrupt the execution when the memory usage of the current process exceeds a limit.
+
+    The memory usage is read with `get_memory` (e.g. the latest RSS sample of a memory tracer armed with
+    the current process) and from tracemalloc if it is tracing, every `interval` milliseconds.
+    Once the limit is exceeded, `on_exceed` is called from the watching thread, e.g. to take a tracemalloc snapshot,
+    and `MemoryLimitExceeded` is raised asynchronously in the thread that entered `watch`. The exception
+    is delivered between bytecodes, so a long call into a C extension is only interrupted once it returns.
+    """
+
+    def __init__(self, limit: int, interval: float = 10.0, on_exceed: Callable[[], None] | None = None) -> None:
+        self.limit: int = limit
+        self.interval: float = interval
+        self.on_exceed: Callable[[], None] | None = on_exceed
+
+        self.exceeded_memory: int | None = None
+
+        self._thread_id: int | None = None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+    @contextmanager
+    def watch(self, get_memory: Callable[[], int]) -> Iterator[None]:
+        """Watch the memory usage while in the context."""
+
+        self.exceeded_memory = None
+        self._thread_id = threading.get_ident()
+        self._stop_event.clear()
+
+        thread = threading.Thread(target=self._watch, args=(get_memory,), name="memory-limit", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._stop_event.set()
+                if self.exceeded_memory is not None:
+                    # the exception may still be pending if the execution finished right after the limit was exceeded
+                    _set_async_exception(self._thread_id, None)
+            thread.join()
+
+    def _watch(self, get_memory: Callable[[], int]) -> None:
+        while not self._stop_event.wait(self.interval / 1000):
+            memory = get_memory()
+            if tracemalloc.is_tracing():
+                memory = max(memory, tracemalloc.get_traced_memory()[0])
+            if memory <= self.limit:
+                continue
+
+            if self.on_exceed is not None:
+                self.on_exceed()
+            with self._lock:
+                if not self._stop_event.is_set():
+                    self.exceeded_memory = memory
+                    _set_async_exception(self._thread_id, MemoryLimitExceeded)
+            return
+
+
+def _set_async_exception(thread_id: int, exception: type[BaseException] | None) -> None:
+    import ctypes  # noqa: WPS433
+
+    # a NULL exception clears the pending one
+    exception_object = ctypes.py_object(exception) if exception is not None else ctypes.py_object()
+    ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_ulong(thread_id), exception_object)
@@ -0,0 +1,97 @@
+"""Line-by-line memory tracer based on tracemalloc."""
+
+from __future__ import annotations
+
+import sys
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import dataclass
+from types import FrameType
+from typing import Any, Callable, Iterator, Optional
+
+CAN_RESET_PEAK = hasattr(tracemalloc, "reset_peak")
+
+
+@dataclass
+class LineMemoryUsage:
+    """Memory usage statistics of a source line."""
+
+    increment: int = 0
+    peak: int = 0
+    occurrences: int = 0
+
+
+class LineMemoryTracer:
+    """Attribute traced memory allocations to the source lines of a compiled code.
+
+    Memory allocated between two line events is attributed to the line executed first, including
+    allocations made by functions called from the line, unless they are defined in the same code.
+    The peak of a line is the highest traced memory usage during its execution above the memory usage
+    at its start. Peaks of separate lines are only available in Python 3.9+, where tracemalloc peak
+    can be reset, in older versions they are approximated by increments.
+
+    tracemalloc must be tracing when the tracer is used.
+    """
+
+    def __init__(self) -> None:
+        self.line_memory_usages: dict[int, LineMemoryUsage] = {}
+        self.peak: int = 0
+
+        self._filename: str | None = None
+        self._line: int | None = None
+        self._line_start_memory: int = 0
+        self._caller_lines: list[int | None] = []
+
+    @contextmanager
+    def trace(self, filename: str) -> Iterator[None]:
+        """Trace lines of the code compiled with the filename."""
+
+        self._filename = filename
+        self._line = None
+        self._caller_lines = []
+
+        previous_trace = sys.gettrace()
+        sys.settrace(self._global_trace)
+        try:
+            yield
+        finally:
+            sys.settrace(previous_trace)
+            self._finish_line()
+
+    def _global_trace(self, frame: FrameType, event: str, arg: Any) -> Optional[Callable]:
+        if frame.f_code.co_filename != self._filename:
+            return None
+
+        self._finish_line()
+        self._caller_lines.append(self._line)
+        self._line = None
+
+        return self._local_trace
+
+    def _local_trace(self, frame: FrameType, event: str, arg: Any) -> Optional[Callable]:
+        if event == "line":
+            self._finish_line()
+            self._line = frame.f_lineno
+            self.line_memory_usages.setdefault(self._line, LineMemoryUsage()).occurrences += 1
+        elif event == "return":
+            self._finish_line()
+            self._line = self._caller_lines.pop() if self._caller_lines else None
+        return self._local_trace
+
+    def _finish_line(self) -> None:
+        """Attribute memory allocated since the previous line event to the previous line."""
+
+        current, peak = tracemalloc.get_traced_memory()
+        self.peak = max(self.peak, peak)
+        if not CAN_RESET_PEAK:
+            peak = current
+
+        if self._line is not None:
+            line_memory_usage = self.line_memory_usages.setdefault(self._line, LineMemoryUsage())
+            line_memory_usage.increment += current - self._line_start_memory
+            line_memory_usage.peak = max(line_memory_usage.peak, peak - self._line_start_memory)
+
+        if CAN_RESET_PEAK:
+            tracemalloc.reset_peak()
+        # do not attribute the tracer own allocations to the next line
+        self._line_start_memory = tracemalloc.get_traced_memory()[0]
@@ -0,0 +1,179 @@
+"""Memory tracer taking tracemalloc snapshots of the allocation sites."""
+
+from __future__ import annotations
+
+import contextlib
+import fnmatch
+import heapq
+import os
+import sys
+import threading
+import tracemalloc
+from importlib.util import find_spec
+from typing import Iterator
+
+
+def get_package_dir(name: str) -> str:
+    """Get the directory of a top-level package without importing it."""
+
+    spec = find_spec(name)
+    if spec is None or spec.origin is None:
+        return name
+    return os.path.dirname(spec.origin)
+
+
+# allocations made by these files are not reported, the standard library modules and psutil are used by the tracers
+EXCLUDED_FILES = (
+    os.path.join(get_package_dir("IPython"), "*"),
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "*"),
+    os.path.join(get_package_dir("psutil"), "*"),
+    tracemalloc.__file__,
+    threading.__file__,
+    contextlib.__file__,
+    "<frozen importlib._bootstrap>",
+    "<frozen importlib._bootstrap_external>",
+    "<unknown>",
+)
+
+
+def get_numpy_tracemalloc_domain() -> int | None:
+    """Get the tracemalloc domain of NumPy arrays data if NumPy is imported."""
+
+    numpy = sys.modules.get("numpy")
+    if numpy is None:
+        return None
+    return getattr(numpy.lib, "tracemalloc_domain", None)
+
+
+def is_excluded_file(filename: str) -> bool:
+    return any(fnmatch.fnmatch(filename, pattern) for pattern in EXCLUDED_FILES)
+
+
+_excluded_files: dict[str, bool] = {}
+
+
+def is_excluded_traceback(traceback: tuple) -> bool:
+    """Check whether the most recent frame of a raw traceback belongs to an excluded file, cached by file name."""
+
+    filename = traceback[0][0] if traceback else "<unknown>"
+    excluded = _excluded_files.get(filename)
+    if excluded is None:
+        excluded = is_excluded_file(filename)
+        _excluded_files[filename] = excluded
+    return excluded
+
+
+def group_traces(snapshot: tracemalloc.Snapshot, depth: int) -> dict[tuple, list[int]]:
+    """Group the raw traces of a snapshot by their `depth` most recent frames into their total sizes and counts.
+
+    The raw trace tuples are iterated over, as they are much cheaper than Trace objects.
+    """
+
+    sizes: dict[tuple, list[int]] = {}
+    for trace in snapshot.traces._traces:  # noqa: WPS437
+        traceback = trace[2]
+        if len(traceback) > depth:
+            traceback = traceback[:depth]
+        size_count = sizes.get(traceback)
+        if size_count is None:
+            sizes[traceback] = [trace[1], 1]
+        else:
+            size_count[0] += trace[1]
+            size_count[1] += 1
+    return sizes
+
+
+class SnapshotMemoryTracer:
+    """Take tracemalloc snapshots and group their allocations by the allocation sites.
+
+    Allocations are grouped by the `depth` most recent frames in a single pass over the raw snapshot traces,
+    then the sites allocated by IPython and this library are filtered out before selecting the largest ones,
+    so the cost stays low for code that allocates millions of small objects.
+
+    If `peak_threshold` is set, the traced memory is watched from a thread during `watch_peak`,
+    and a snapshot is taken whenever the memory usage rises by more than the threshold above
+    the memory usage at the previous such snapshot, so the last one shows what was allocated
+    around the high-water mark, even if it is freed by the end of the execution.
+
+    tracemalloc must be tracing with at least `depth` frames when a snapshot is taken.
+    """
+
+    def __init__(self, depth: int = 1, peak_threshold: int | None = None, interval: float = 10.0) -> None:
+        if depth < 1:
+            raise ValueError("depth must be greater than or equal to 1")
+
+        self.depth: int = depth
+        self.peak_threshold: int | None = peak_threshold
+        self.interval: float = interval
+
+        self.snapshot: tracemalloc.Snapshot | None = None
+        self.peak_snapshot: tracemalloc.Snapshot | None = None
+        self.peak_snapshot_memory: int = 0
+
+        self._stop_event = threading.Event()
+
+    @contextlib.contextmanager
+    def watch_peak(self) -> Iterator[None]:
+        """Take snapshots at the rises of the traced memory while in the context."""
+
+        if self.peak_threshold is None:
+            yield
+            return
+
+        self.peak_snapshot = None
+        self.peak_snapshot_memory = 0
+        self._stop_event.clear()
+
+        thread = threading.Thread(target=self._watch_peak, name="memory-peak-snapshot", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            self._stop_event.set()
+            thread.join()
+            # the peak could be reached after the last check
+            self._check_peak()
+
+    def take_snapshot(self) -> tracemalloc.Snapshot:
+        """Take a snapshot of the traced allocations and keep it as the latest snapshot."""
+
+        self.snapshot = tracemalloc.take_snapshot()
+        return self.snapshot
+
+    def statistics(self, limit: int, snapshot: tracemalloc.Snapshot | None = None) -> list[tracemalloc.Statistic]:
+        """Get the allocation sites with the largest allocated size."""
+
+        snapshot = snapshot if snapshot is not None else self.snapshot
+        if snapshot is None:
+            return []
+
+        sizes = group_traces(snapshot, self.depth)
+        sites = [
+            (traceback, size_count) for traceback, size_count in sizes.items() if not is_excluded_traceback(traceback)
+        ]
+        sites = heapq.nlargest(limit, sites, key=lambda site: site[1][0])
+
+        return [
+            tracemalloc.Statistic(tracemalloc.Traceback(traceback), size, count) for traceback, (size, count) in sites
+        ]
+
+    def domain_size(self, domain: int, snapshot: tracemalloc.Snapshot | None = None) -> int:
+        """Get the total size of the allocations traced in the domain."""
+
+        snapshot = snapshot if snapshot is not None else self.snapshot
+        if snapshot is None:
+            return 0
+
+        traces = snapshot.traces._traces  # noqa: WPS437
+        return sum(trace[1] for trace in traces if trace[0] == domain)
+
+    def _watch_peak(self) -> None:
+        while not self._stop_event.wait(self.interval / 1000):
+            self._check_peak()
+
+    def _check_peak(self) -> None:
+        current, peak = tracemalloc.get_traced_memory()
+        threshold = self.peak_snapshot_memory + self.peak_threshold
+        if peak >= threshold and current >= threshold:
+            self.peak_snapshot = tracemalloc.take_snapshot()
+            self.peak_snapshot_memory = current
@@ -0,0 +1,133 @@
+"""Memory tracer attributing traced allocations to asyncio tasks."""
+
+from __future__ import annotations
+
+import asyncio
+import tracemalloc
+from collections.abc import Coroutine
+from dataclasses import dataclass
+from functools import partial
+from typing import Any, Callable, Hashable
+
+from memory_magics.memory_tracer.line_memory_tracer import CAN_RESET_PEAK
+
+
+@dataclass
+class TaskMemoryUsage:
+    """Memory usage statistics of an asyncio task."""
+
+    increment: int = 0
+    peak: int = 0
+    steps: int = 0
+
+
+class TaskMemoryTracer:
+    """Attribute traced memory allocations to the asyncio tasks created by a coroutine.
+
+    The coroutine of every task created while the traced coroutine runs is wrapped, and memory allocated
+    during every step of a task, from its resumption by the event loop to its next suspension, is attributed
+    to the task. Steps of tasks of one event loop never overlap, so the attribution does not depend on sampling,
+    memory allocated by other threads is attributed to the running task though. Memory allocated by the traced
+    coroutine itself is attributed to `name`. The peak of a task is the highest traced memory usage during its steps
+    above the memory usage at its start, ignoring the steps of other tasks.
+
+    tracemalloc must be tracing when the tracer is used.
+    """
+
+    def __init__(self, name: str = "<cell>") -> None:
+        self.name: str = name
+        self.task_memory_usages: dict[str, TaskMemoryUsage] = {}
+        self.peak: int = 0
+
+        self._memory_usages: dict[Hashable, TaskMemoryUsage] = {}
+
+    async def trace(self, coroutine: Coroutine) -> Any:
+        """Run a coroutine, tracing the tasks it creates on the running event loop."""
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            raise RuntimeError("task memory tracing requires an asyncio event loop") from None
+
+        self._memory_usages = {}
+        previous_task_factory = loop.get_task_factory()
+        loop.set_task_factory(partial(self._create_task, previous_task_factory))
+        try:
+            return await _TracedCoroutine(coroutine, self, self.name)
+        finally:
+            loop.set_task_factory(previous_task_factory)
+            # tasks may be renamed after they are created
+            self.task_memory_usages = {
+                key if isinstance(key, str) else key.get_name(): memory_usage
+                for key, memory_usage in self._memory_usages.items()
+            }
+
+    def _create_task(
+        self,
+        previous_task_factory: Callable | None,
+        loop: asyncio.AbstractEventLoop,
+        coroutine: Coroutine,
+        **kwargs: Any,
+    ) -> asyncio.Future:
+        """Create a task of a traced coroutine with the task factory set before the tracing, if any."""
+
+        traced_coroutine = _TracedCoroutine(coroutine, self)
+        if previous_task_factory is not None:
+            return previous_task_factory(loop, traced_coroutine, **kwargs)
+        return asyncio.Task(traced_coroutine, loop=loop, **kwargs)
+
+    def _step(self, key: Hashable | None, method: Callable, *args: Any) -> Any:
+        """Advance a coroutine by a step and attribute the memory allocated during the step to its task."""
+
+        if key is None:
+            key = asyncio.current_task()
+        memory_usage = self._memory_usages.get(key)
+        if memory_usage is None:
+            memory_usage = TaskMemoryUsage()
+            self._memory_usages[key] = memory_usage
+
+        self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+        if CAN_RESET_PEAK:
+            tracemalloc.reset_peak()
+        step_start_memory = tracemalloc.get_traced_memory()[0]
+        try:
+            return method(*args)
+        finally:
+            current, peak = tracemalloc.get_traced_memory()
+            self.peak = max(self.peak, peak)
+            if not CAN_RESET_PEAK:
+                peak = current
+
+            memory_usage.peak = max(memory_usage.peak, memory_usage.increment + peak - step_start_memory)
+            memory_usage.increment += current - step_start_memory
+            memory_usage.steps += 1
+
+
+class _TracedCoroutine(Coroutine):
+    """Coroutine wrapper reporting every step of the wrapped coroutine to a task memory tracer.
+
+    The steps are attributed to `key`, or to the running task if it is not set.
+    """
+
+    def __init__(self, coroutine: Coroutine, tracer: TaskMemoryTracer, key: Hashable | None = None) -> None:
+        self._coroutine = coroutine
+        self._tracer = tracer
+        self._key = key
+
+    def __await__(self) -> _TracedCoroutine:
+        return self
+
+    def __iter__(self) -> _TracedCoroutine:
+        return self
+
+    def __next__(self) -> Any:
+        return self.send(None)
+
+    def send(self, sent: Any) -> Any:
+        return self._tracer._step(self._key, self._coroutine.send, sent)  # noqa: WPS437
+
+    def throw(self, *args: Any) -> Any:
+        return self._tracer._step(self._key, self._coroutine.throw, *args)  # noqa: WPS437
+
+    def close(self) -> None:
+        self._coroutine.close()
@@ -0,0 +1,91 @@
+"""In-process memory tracer running in a daemon thread."""
+
+from __future__ import annotations
+
+from typing import Iterable
+
+from memory_magics.memory_tracer._memory_tracer import (
+    AdaptiveInterval,
+    PeakMemoryTracer,
+    PeakMemoryUsages,
+    TimelineBuffer,
+)
+
+
+class ThreadMemoryTracer:
+    """Context Manager to trace Jupyter notebook peak memory usage from a thread of the current process.
+
+    The tracing thread is started once and then armed on enter and disarmed on exit,
+    it does not take any samples while disarmed.
+    """
+
+    backend = "thread"
+
+    def __init__(
+        self, pids: Iterable[int] = (), interval: float | AdaptiveInterval = 10.0, metric: str = "rss"
+    ) -> None:
+        self.pids: list[int] = list(pids)
+        self.interval: float | AdaptiveInterval = interval
+        self.metric: str = metric
+
+        self.memory_usages_current: dict[int, int] = {}
+        self.memory_usages_peak: dict[int, int] = {}
+        self.total_peak: int | None = None
+
+        self._tracer: PeakMemoryTracer | None = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._tracer is not None
+
+    def start(self) -> None:
+        """Start the tracing thread if it is not running."""
+
+        if not self.is_running:
+            self._tracer = PeakMemoryTracer()
+
+    def stop(self) -> None:
+        """Stop the tracing thread."""
+
+        if self.is_running:
+            self._tracer.stop()
+            self._tracer = None
+
+    def arm(
+        self,
+        pids: Iterable[int] | None = None,
+        interval: float | AdaptiveInterval | None = None,
+        timeline: TimelineBuffer | None = None,
+        metric: str | None = None,
+    ) -> None:
+        """Reset the peaks and start tracing, the samples are also appended to the timeline if it is set."""
+
+        if pids is not None:
+            self.pids = list(pids)
+        if interval is not None:
+            self.interval = interval
+        if metric is not None:
+            self.metric = metric
+
+        self.start()
+        self._tracer.arm(self.pids, self.interval, timeline, self.metric)
+
+    def disarm(self) -> None:
+        """Stop tracing and read the peaks."""
+
+        self._tracer.disarm()
+        current, peak, _, total_peak = self.read()
+        self.memory_usages_current = current
+        self.memory_usages_peak = peak
+        self.total_peak = total_peak
+
+    def read(self) -> PeakMemoryUsages:
+        """Read the latest current and peak memory usages by process id, and the total ones, while armed."""
+
+        return self._tracer.buffer.read()
+
+    def __enter__(self) -> None:
+        self.arm()
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.disarm()
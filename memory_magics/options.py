@@ -0,0 +1,229 @@
+"""Options of the %memory magic, parsed from the options of the magic line."""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Any, Iterable, Mapping
+
+from IPython.core.error import UsageError
+
+from memory_magics.memory_tracer import MEMORY_TRACERS
+from memory_magics.memory_tracer._memory_tracer import AdaptiveInterval, ProcessMemoryReader
+from memory_magics.tracing import TraceOptions
+from memory_magics.utils.print import parse_bytes
+from memory_magics.utils.proc import get_cgroup_memory_limit
+
+SHORT_OPTIONS = "nji:b:ld:p:cvtqo"
+LONG_OPTIONS = (
+    "notebook",
+    "jupyter",
+    "interval=",
+    "backend=",
+    "lines",
+    "tasks",
+    "top=",
+    "depth=",
+    "peak=",
+    "sample",
+    "native",
+    "limit=",
+    "timeline",
+    "children",
+    "variables",
+    "metric=",
+    "table",
+    "quiet",
+    "output",
+)
+
+# number of the allocation sites printed at the peaks if --top is not set
+_PEAK_TOP = 10
+# number of the runs of %memory_leak
+_LEAK_REPEAT = 20
+
+
+@dataclass
+class MemoryOptions:
+    """Options of a %memory execution, the measurement is configured by the `trace` options.
+
+    `top` is the number of the allocation sites to print, the other options select what is printed
+    and returned, see `MemoryMagics.memory`.
+    """
+
+    trace: TraceOptions = field(default_factory=TraceOptions)
+    notebook: bool = False
+    jupyter: bool = False
+    backend: str = "process"
+    lines: bool = False
+    tasks: bool = False
+    top: int = 0
+    variables: bool = False
+    print_table: bool = False
+    quiet: bool = False
+    output: bool = False
+
+    @property
+    def traces_processes(self) -> bool:
+        """Whether the peaks of the kernel and Jupyter processes are traced by the backend."""
+
+        return self.notebook or self.jupyter
+
+
+def get_option(options: Mapping[str, Any], short_name: str, long_name: str, default: Any = None) -> Any:
+    """Get the value of an option given by its short or long name, the short one takes precedence."""
+
+    return options.get(short_name, options.get(long_name, default))
+
+
+def has_option(options: Mapping[str, Any], short_name: str, long_name: str) -> bool:
+    """Check whether a flag is given by its short or long name."""
+
+    return short_name in options or long_name in options
+
+
+def parse_sampling_interval(interval: str, cpu_budget: float = 2.0) -> float | AdaptiveInterval:
+    """Parse an RSS sampling interval in milliseconds, or 'auto' for an adaptive interval within the CPU budget
+    in percents of a CPU core."""
+
+    if interval == "auto":
+        return AdaptiveInterval(cpu_budget=cpu_budget / 100)
+
+    try:
+        interval = float(interval)
+    except ValueError:
+        raise TypeError("interval must be int, float or 'auto'") from None
+    # for performance reasons
+    if interval < 1:
+        raise ValueError("interval must be greater than or equal to 1 millisecond")
+
+    return interval
+
+
+def parse_memory_limit(limit: str) -> int | None:
+    """Parse a memory limit in bytes, or in percents of the cgroup memory limit or of the total memory,
+    None if it is 'none'."""
+
+    if limit.lower() == "none":
+        return None
+    if not limit.endswith("%"):
+        return parse_bytes(limit)
+
+    import psutil  # noqa: WPS433
+
+    total_memory = get_cgroup_memory_limit() or psutil.virtual_memory().total
+    return int(total_memory * float(limit[:-1]) / 100)
+
+
+def parse_leak_options(options: Mapping[str, Any]) -> tuple[int, int, int, int]:
+    """Parse the number of runs, of warm-up runs, of frames to group the allocation sites by, and of the sites
+    to print of a %memory_leak execution."""
+
+    leak_options = (
+        get_option(options, "r", "repeat", _LEAK_REPEAT),
+        get_option(options, "w", "warmup", 1),
+        get_option(options, "d", "depth", 1),
+        options.get("top", _PEAK_TOP),
+    )
+    try:
+        repeat, warmup, depth, top = map(int, leak_options)
+    except ValueError:
+        raise UsageError("repeat, warmup, depth and top must be int") from None
+    if repeat < 2 or warmup < 0 or depth < 1 or top < 0:
+        raise UsageError("repeat must be at least 2, depth positive, and warmup and top non-negative")
+    return repeat, warmup, depth, top
+
+
+class MemoryOptionsParser:
+    """Parser of the options of the %memory magic, see `MemoryMagics.memory`.
+
+    The defaults of the memory limit, of the CPU budget of the adaptive interval and of the children scan interval
+    are taken from the configuration of the magics. `UsageError` is raised for the invalid options.
+    """
+
+    def __init__(
+        self, memory_limit: str | None = None, sampling_cpu_budget: float = 2.0, children_scan_interval: float = 100.0
+    ) -> None:
+        self.memory_limit: str | None = memory_limit
+        self.sampling_cpu_budget: float = sampling_cpu_budget
+        self.children_scan_interval: float = children_scan_interval
+
+    def parse(self, options: Mapping[str, Any], cell_mode: bool = False) -> MemoryOptions:
+        """Parse the options of a %memory execution from the options of the magic line."""
+
+        top, depth, peak_threshold = self._parse_allocations_options(options)
+        memory_options = MemoryOptions(
+            self._parse_trace_options(options, depth, peak_threshold, snapshot=bool(top)),
+            notebook=has_option(options, "n", "notebook"),
+            jupyter=has_option(options, "j", "jupyter"),
+            backend=self._parse_choice(get_option(options, "b", "backend", "process"), MEMORY_TRACERS, "backend"),
+            lines=has_option(options, "l", "lines"),
+            tasks="tasks" in options,
+            top=top,
+            variables=has_option(options, "v", "variables"),
+            print_table=has_option(options, "t", "table"),
+            quiet=has_option(options, "q", "quiet"),
+            output=has_option(options, "o", "output"),
+        )
+
+        if memory_options.lines and not cell_mode:
+            raise UsageError("line-by-line memory usage is only available in '%%memory' cell mode")  # noqa: WPS323
+        if memory_options.trace.sample and (memory_options.lines or memory_options.top or memory_options.tasks):
+            raise UsageError("line-by-line, task memory usage and allocation sites are not available with sampling")
+        return memory_options
+
+    def _parse_trace_options(
+        self, options: Mapping[str, Any], depth: int, peak_threshold: int | None, snapshot: bool
+    ) -> TraceOptions:
+        if "sample" in options and "native" in options:
+            raise UsageError("the native memory usage is not available with sampling")
+
+        interval = get_option(options, "i", "interval", "10")
+        metric = options.get("metric", "rss").lower()
+        return TraceOptions(
+            sample="sample" in options,
+            native="native" in options,
+            children=has_option(options, "c", "children"),
+            snapshot=snapshot,
+            depth=depth,
+            peak_threshold=peak_threshold,
+            limit=self._parse_memory_limit(options.get("limit", self.memory_limit)),
+            interval=parse_sampling_interval(interval, self.sampling_cpu_budget),
+            metric=self._parse_choice(metric, ProcessMemoryReader.metrics, "metric"),
+            timeline="timeline" in options,
+            scan_interval=self.children_scan_interval,
+        )
+
+    @staticmethod
+    def _parse_allocations_options(options: Mapping[str, Any]) -> tuple[int, int, int | None]:
+        """Parse the number of the allocation sites to print, the number of frames to group them by,
+        and the threshold of the peak snapshots."""
+
+        top = options.get("top", 0)
+        depth = get_option(options, "d", "depth", 1)
+        try:
+            top, depth = int(top), int(depth)
+        except ValueError:
+            raise TypeError("top and depth must be int") from None
+        if top < 0 or depth < 1:
+            raise ValueError("top must be non-negative and depth must be positive")
+
+        peak_threshold = get_option(options, "p", "peak")
+        if peak_threshold is None:
+            return top, depth, None
+        return top or _PEAK_TOP, depth, parse_bytes(peak_threshold)
+
+    @staticmethod
+    def _parse_memory_limit(limit: str | None) -> int | None:
+        if limit is None:
+            return None
+        try:
+            return parse_memory_limit(limit)
+        except ValueError:
+            raise UsageError(f"invalid memory limit: {limit!r}") from None
+
+    @staticmethod
+    def _parse_choice(choice: str, choices: Iterable[str], name: str) -> str:
+        if choice not in choices:
+            choices_list = ", ".join(choices)
+            raise UsageError(f"{name} must be one of: {choices_list}")
+        return choice
@@ -0,0 +1,130 @@
+"""Recorder of the memory usage of every executed cell, the engine of the %memory_auto magic."""
+
+from __future__ import annotations
+
+import os
+import time
+import tracemalloc
+from contextlib import ExitStack
+from typing import Any
+
+from memory_magics.memory_tracer._memory_tracer import AdaptiveInterval
+from memory_magics.memory_tracer.thread_memory_tracer import ThreadMemoryTracer
+from memory_magics.tracing import get_native_memory, sample_process_memory
+from memory_magics.utils.history import CellMemoryUsage, MemoryHistory, get_source_hash
+
+
+class AutoMemoryRecorder:
+    """Record the memory usage of every cell executed by the IPython shell to the history.
+
+    The kernel RSS of a cell is sampled by a tracer of the recorder, which the %memory executions in the cell
+    do not re-arm, and the allocations are also traced with tracemalloc if `trace_allocations` is set.
+    """
+
+    def __init__(self, shell: Any, history: MemoryHistory) -> None:
+        self.shell = shell
+        self.history: MemoryHistory = history
+        self.interval: float | AdaptiveInterval | None = None
+        self.trace_allocations: bool = False
+
+        self._memory_tracer: ThreadMemoryTracer | None = None
+        self._exit_stack: ExitStack | None = None
+        self._process_memory: dict[str, int] = {}
+        self._source_hash = 0
+        self._start_time: float = 0
+        self._start_counter: float = 0
+
+    @property
+    def is_on(self) -> bool:
+        return self.interval is not None
+
+    @property
+    def status(self) -> str:
+        """Description of the recording mode, e.g. 'on (RSS)'."""
+
+        if not self.is_on:
+            return "off"
+        return "on (RSS and tracemalloc)" if self.trace_allocations else "on (RSS)"
+
+    def start(self, interval: float | AdaptiveInterval = 100.0, trace_allocations: bool = False) -> None:
+        """Start recording the executed cells, the RSS is sampled every `interval` milliseconds."""
+
+        self.stop()
+        self.interval = interval
+        self.trace_allocations = trace_allocations
+        self._memory_tracer = ThreadMemoryTracer([os.getpid()])
+        self._memory_tracer.start()
+        self.shell.events.register("pre_run_cell", self._pre_run_cell)
+        self.shell.events.register("post_run_cell", self._post_run_cell)
+
+    def stop(self) -> None:
+        """Stop recording the executed cells."""
+
+        if not self.is_on:
+            return
+
+        self.shell.events.unregister("pre_run_cell", self._pre_run_cell)
+        self.shell.events.unregister("post_run_cell", self._post_run_cell)
+        # the cell turning the recording off was started with the recording on
+        self._finish_cell()
+        self.interval = None
+        self._memory_tracer.stop()
+        self._memory_tracer = None
+
+    def _pre_run_cell(self, cell_info: Any = None) -> None:
+        self._finish_cell()
+
+        self._source_hash = get_source_hash(cell_info.raw_cell if cell_info is not None else "")
+        self._start_time = time.time()
+        self._start_counter = time.perf_counter()
+        self._exit_stack = ExitStack()
+        if self.trace_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._exit_stack.callback(tracemalloc.stop)
+        self._process_memory = self._exit_stack.enter_context(sample_process_memory(self._memory_tracer, self.interval))
+
+    def _post_run_cell(self, execution_result: Any) -> None:
+        traced_memory = self._finish_cell()
+        if traced_memory is None:
+            # the cell turning the recording on
+            return
+        duration = time.perf_counter() - self._start_counter
+
+        process_memory = self._process_memory
+        mode = "rss"
+        cell_memory = (process_memory["current"], max(process_memory["peak"], process_memory["current"], 0))
+        native_memory = (None, None)
+        if traced_memory:
+            mode = "tracemalloc"
+            cell_memory = traced_memory[:2]
+            native_memory = get_native_memory(process_memory, cell_memory, traced_memory[2])
+        self.history.append(
+            CellMemoryUsage(
+                execution_result.execution_count,
+                self._source_hash,
+                self._start_time,
+                duration,
+                mode,
+                *cell_memory,
+                *native_memory,
+            )
+        )
+
+    def _finish_cell(self) -> tuple | None:
+        """Stop measuring the memory usage of the current cell.
+
+        Return None if it was not measured, otherwise the traced current and peak memory usages,
+        and the memory used by tracemalloc, if it was traced.
+        """
+
+        if self._exit_stack is None:
+            return None
+
+        traced_memory = ()
+        # cells measured with %memory stop tracemalloc
+        if self.trace_allocations and tracemalloc.is_tracing():
+            traced_memory = (*tracemalloc.get_traced_memory(), tracemalloc.get_tracemalloc_memory())
+        self._exit_stack.close()
+        self._exit_stack = None
+
+        return traced_memory
@@ -0,0 +1,171 @@
+"""Result of a memory usage measurement."""
+
+from __future__ import annotations
+
+import html
+import json
+import tracemalloc
+from itertools import starmap
+from typing import Any
+
+from memory_magics.memory_tracer.snapshot_memory_tracer import SnapshotMemoryTracer
+from memory_magics.utils.print import format_bytes
+from memory_magics.utils.timeline import MemoryTimeline
+
+
+class MemoryResult:
+    """Memory usage of an execution.
+
+    `current` and `peak` are the memory usage increment at the end and the peak increment of the execution, measured
+    as `mode`: 'tracemalloc' traces the allocations, 'rss', 'pss' or 'uss' sample the process memory usage.
+    `scopes` maps other scopes, e.g. 'native', 'children' or 'notebook', to their current and peak memory usages,
+    a peak may be None if it is not measured. `duration` is the wall-clock time of the execution in seconds and
+    `start_time` its start as a Unix timestamp, `backend` is the backend of the sampling thread or process, if any.
+    `snapshot` is the tracemalloc snapshot taken at the end of the execution and `timeline` the memory usage timeline,
+    if any.
+
+    The results are equal if their modes, memory usages and backends are equal, the timings, snapshots and timelines
+    are not compared. The results are mutable, so they are not hashable.
+    """
+
+    __slots__ = ("mode", "current", "peak", "duration", "scopes", "snapshot", "backend", "start_time", "timeline")
+
+    __hash__ = None
+
+    def __init__(
+        self,
+        mode: str = "tracemalloc",
+        current: int = 0,
+        peak: int = 0,
+        duration: float = 0,
+        scopes: dict[str, tuple[int, int | None]] | None = None,
+        snapshot: tracemalloc.Snapshot | None = None,
+        backend: str | None = None,
+        start_time: float | None = None,
+        timeline: MemoryTimeline | None = None,
+    ) -> None:
+        self.mode: str = mode
+        self.current: int = current
+        self.peak: int = peak
+        self.duration: float = duration
+        self.scopes: dict[str, tuple[int, int | None]] = scopes if scopes is not None else {}
+        self.snapshot: tracemalloc.Snapshot | None = snapshot
+        self.backend: str | None = backend
+        self.start_time: float | None = start_time
+        self.timeline: MemoryTimeline | None = timeline
+
+    def top_allocations(self, limit: int = 10, depth: int = 1) -> list[tracemalloc.Statistic]:
+        """Get the allocation sites with the largest allocated size from the snapshot, grouped by `depth` frames."""
+
+        return SnapshotMemoryTracer(depth).statistics(limit, self.snapshot)
+
+    def compare(self, baseline: MemoryResult) -> MemoryResult:
+        """Get the differences of the memory usages and the duration from a baseline result of the same mode.
+
+        The differences of the scopes measured by both results are kept, a peak difference is None if either peak is.
+        """
+
+        if self.mode != baseline.mode:
+            raise ValueError(f"cannot compare a {self.mode} result with a {baseline.mode} result")
+
+        scopes = {}
+        for label, (current, peak) in self.scopes.items():
+            if label not in baseline.scopes:
+                continue
+            baseline_current, baseline_peak = baseline.scopes[label]
+            peak_difference = peak - baseline_peak if peak is not None and baseline_peak is not None else None
+            scopes[label] = (current - baseline_current, peak_difference)
+
+        return MemoryResult(
+            self.mode,
+            self.current - baseline.current,
+            self.peak - baseline.peak,
+            self.duration - baseline.duration,
+            scopes,
+            backend=self.backend,
+        )
+
+    def to_dict(self) -> dict[str, Any]:
+        """Get the result as a JSON-serializable dict, the snapshot is not included."""
+
+        return {
+            "mode": self.mode,
+            "current": self.current,
+            "peak": self.peak,
+            "duration": self.duration,
+            "start_time": self.start_time,
+            "backend": self.backend,
+            "scopes": {label: list(usage) for label, usage in self.scopes.items()},
+            "timeline": self.timeline.to_dict() if self.timeline is not None else None,
+        }
+
+    @classmethod
+    def from_dict(cls, result_dict: dict[str, Any]) -> MemoryResult:
+        """Make a result from a dict made by `to_dict`."""
+
+        timeline = result_dict.get("timeline")
+        return cls(
+            result_dict["mode"],
+            result_dict["current"],
+            result_dict["peak"],
+            result_dict["duration"],
+            {label: tuple(usage) for label, usage in result_dict.get("scopes", {}).items()},
+            backend=result_dict.get("backend"),
+            start_time=result_dict.get("start_time"),
+            timeline=MemoryTimeline.from_dict(timeline) if timeline is not None else None,
+        )
+
+    def to_json(self, **kwargs: Any) -> str:
+        """Serialize the result to JSON, the keyword arguments are passed to `json.dumps`."""
+
+        return json.dumps(self.to_dict(), **kwargs)
+
+    @classmethod
+    def from_json(cls, text: str) -> MemoryResult:
+        """Make a result from JSON made by `to_json`."""
+
+        return cls.from_dict(json.loads(text))
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, MemoryResult):
+            return NotImplemented
+        return self._key() == other._key()  # noqa: WPS437
+
+    def __repr__(self) -> str:
+        scopes = "".join(f", {label}={current}/{peak}" for label, (current, peak) in self.scopes.items())
+        return f"<MemoryResult {self.mode}: current={self.current}, peak={self.peak}{scopes}>"
+
+    def _repr_pretty_(self, printer: Any, cycle: bool) -> None:  # noqa: WPS120
+        rows = self._rows()
+        label_width = max(len(label) for label, _, _ in rows)
+        lines = [f"MemoryResult {self.mode} in {self.duration:.3f} s"]
+        for label, current, peak in rows:
+            padded_label = label.ljust(label_width)
+            current_text = format_bytes(current)
+            peak_text = " / " + format_bytes(peak) if peak is not None else ""
+            lines.append(f"  {padded_label}  {current_text}{peak_text}")
+        printer.text("\n".join(lines))
+
+    def _repr_html_(self) -> str:  # noqa: WPS120
+        rows = "".join(starmap(_format_html_row, self._rows()))
+        mode = html.escape(self.mode)
+        caption = f"<caption>MemoryResult {mode} in {self.duration:.3f} s</caption>"
+        table = f"<table>{caption}<tr><th></th><th>current</th><th>peak</th></tr>{rows}</table>"
+        if self.timeline is not None:
+            table += self.timeline._repr_svg_()  # noqa: WPS437
+        return table
+
+    def _key(self) -> tuple:
+        return self.mode, self.current, self.peak, self.scopes, self.backend
+
+    def _rows(self) -> list[tuple[str, int, int | None]]:
+        rows = [("execution", self.current, self.peak)]
+        rows.extend((label, current, peak) for label, (current, peak) in self.scopes.items())
+        return rows
+
+
+def _format_html_row(label: str, current: int, peak: int | None) -> str:
+    escaped_label = html.escape(label)
+    current_text = format_bytes(current)
+    peak_text = format_bytes(peak) if peak is not None else ""
+    return f"<tr><th>{escaped_label}</th><td>{current_text}</td><td>{peak_text}</td></tr>"
@@ -0,0 +1,131 @@
+"""Runner of the code measured by the magics in the namespace of the IPython shell."""
+
+from __future__ import annotations
+
+import ast
+import inspect
+from contextlib import nullcontext
+from dataclasses import dataclass
+from typing import Any, Callable
+
+from memory_magics.memory_tracer.line_memory_tracer import LineMemoryTracer
+from memory_magics.memory_tracer.task_memory_tracer import TaskMemoryTracer
+from memory_magics.utils.coroutine import run_coroutine
+from memory_magics.utils.sizeof import RetainedSizes, get_retained_sizes
+
+# prefix of the file names of the compiled code, to find its frames in the tracebacks
+_SOURCE_PREFIX = "<memory traced"
+_EVAL = "eval"
+_EXEC = "exec"
+
+
+@dataclass
+class CompiledCode:
+    """Compiled Python statement or expression, and its trailing expression evaluated for the value if any.
+
+    `mode` is 'eval' if the code is a single expression, otherwise 'exec'.
+    """
+
+    mode: str
+    code: Any
+    expression: Any = None
+
+
+class CodeRunner:
+    """Compile and run Python statements or expressions in the user namespace of the shell, like IPython does
+    for cells, and find the user variables they created or rebound."""
+
+    def __init__(self, shell: Any) -> None:
+        self.shell = shell
+
+    def compile(self, expr: str) -> CompiledCode:
+        """Compile a Python statement or expression and its trailing expression if any."""
+
+        module = self.shell.compile.ast_parse(self.shell.transform_cell(expr))
+        statements = self.shell.transform_ast(module).body
+        if len(statements) == 1 and isinstance(statements[0], ast.Expr):
+            return CompiledCode(_EVAL, self._compile_ast(ast.Expression(statements[0].value), _EVAL))
+
+        expression = None
+        # multi-line %%memory case, the trailing expression is a line of the code
+        if len(statements) > 1 and isinstance(statements[-1], ast.Expr):
+            expression = self._compile_ast(ast.Expression(statements.pop().value), _EXEC, _EVAL)
+        return CompiledCode(_EXEC, self._compile_ast(ast.Module(statements, []), _EXEC), expression)
+
+    def run(
+        self,
+        compiled_code: CompiledCode,
+        local_ns: dict | None = None,
+        line_memory_tracer: LineMemoryTracer | None = None,
+        task_memory_tracer: TaskMemoryTracer | None = None,
+    ) -> Any:
+        """Execute a compiled code and evaluate the trailing expression value if any."""
+
+        code = compiled_code.code
+        trace_lines = line_memory_tracer.trace(code.co_filename) if line_memory_tracer is not None else nullcontext()
+
+        with trace_lines:
+            run = eval if compiled_code.mode == _EVAL else exec
+            out = self._run_code(run, code, local_ns, task_memory_tracer)
+            if compiled_code.expression is not None:
+                out = self._run_code(eval, compiled_code.expression, local_ns, task_memory_tracer)
+
+        return out
+
+    def get_namespace_ids(self) -> dict[str, int]:
+        """Get the ids of the values of the user variables, hidden and underscored ones are left out."""
+
+        hidden = self.shell.user_ns_hidden
+        user_ns = self.shell.user_ns
+        names = [name for name in user_ns if not name.startswith("_") and name not in hidden]
+        return {name: id(user_ns[name]) for name in names}
+
+    def get_variable_sizes(self, namespace_ids: dict[str, int], time_budget: float | None = None) -> RetainedSizes:
+        """Get the memory retained by the user variables created or rebound since the ids were taken."""
+
+        user_ns = self.shell.user_ns
+        changed_ids = self.get_namespace_ids().items() - namespace_ids.items()
+        changed = {name: user_ns[name] for name, _ in changed_ids}
+        # the objects held by the other variables are not freed by deleting the changed ones
+        unchanged = [user_ns[name] for name in user_ns if name not in changed]
+
+        return get_retained_sizes(changed, [user_ns, *unchanged], time_budget)
+
+    @staticmethod
+    def get_traced_lineno(exc: BaseException) -> int | None:
+        """Get the line of the compiled code that was executed when the exception was raised."""
+
+        lineno = None
+        traceback = exc.__traceback__
+        while traceback is not None:
+            if traceback.tb_frame.f_code.co_filename.startswith(_SOURCE_PREFIX):
+                lineno = traceback.tb_lineno
+            traceback = traceback.tb_next
+
+        return lineno
+
+    def _compile_ast(self, node: ast.AST, source_mode: str, mode: str | None = None) -> Any:
+        """Compile an AST, allowing top-level await if IPython autoawait is on, like IPython does for cells.
+
+        The file name of the code is given by the mode of the whole source, and the AST is compiled in `mode`,
+        the same by default.
+        """
+
+        filename = f"{_SOURCE_PREFIX} {source_mode}>"
+        flags = ast.PyCF_ALLOW_TOP_LEVEL_AWAIT if self.shell.autoawait else 0
+        with self.shell.compile.extra_flags(flags):
+            return self.shell.compile(node, filename, mode or source_mode)
+
+    def _run_code(
+        self, run: Callable, code: Any, local_ns: dict | None = None, task_memory_tracer: TaskMemoryTracer | None = None
+    ) -> Any:
+        """Execute a compiled code, code with top-level await is run to completion as a coroutine."""
+
+        glob = self.shell.user_ns
+        if not code.co_flags & inspect.CO_COROUTINE:
+            return run(code, glob, local_ns)
+
+        coroutine = eval(code, glob, local_ns)  # noqa: S307
+        if task_memory_tracer is not None:
+            coroutine = task_memory_tracer.trace(coroutine)
+        return run_coroutine(coroutine, self.shell.loop_runner)
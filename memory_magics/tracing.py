@@ -0,0 +1,402 @@
+"""Memory usage measurement engine, shared by the magics and the programmatic API, see `MemoryTrace`.
+
+The programmatic API measures the memory usage of code outside IPython, e.g. in scripts, tests or workers::
+
+    with memory_magics.trace(native=True) as result:
+        x = list(range(10**6))
+    print(result.peak, result.scopes["native"])
+
+    @memory_magics.traced(callback=lambda result: metrics.gauge("peak", result.peak))
+    def job():
+        ...
+"""
+
+from __future__ import annotations
+
+import functools
+import inspect
+import os
+import time
+import tracemalloc
+from contextlib import ExitStack, contextmanager, nullcontext
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Callable, ContextManager, Dict, Iterable, Iterator
+
+from memory_magics.memory_tracer._memory_tracer import AdaptiveInterval, TimelineBuffer
+from memory_magics.memory_tracer.children_memory_tracer import ChildrenMemoryTracer
+from memory_magics.memory_tracer.limit_memory_tracer import LimitMemoryTracer
+from memory_magics.memory_tracer.snapshot_memory_tracer import SnapshotMemoryTracer, get_numpy_tracemalloc_domain
+from memory_magics.memory_tracer.thread_memory_tracer import ThreadMemoryTracer
+from memory_magics.result import MemoryResult
+from memory_magics.utils.proc import get_peak_rss, reset_peak_rss
+from memory_magics.utils.timeline import MemoryTimeline
+
+if TYPE_CHECKING:
+    from memory_magics.memory_tracer.context_memory_tracer import ContextMemoryTracer
+    from memory_magics.memory_tracer.line_memory_tracer import LineMemoryTracer
+    from memory_magics.memory_tracer.task_memory_tracer import TaskMemoryTracer
+
+# peak RSS (VmHWM) of the process before it was reset by the nested measurements, by the measurements in progress
+_peak_rss_floors: list[int] = []
+
+# interval in milliseconds of the checks, which are not adaptive, with an adaptive sampling interval
+_CHECK_INTERVAL = 10.0
+
+# memory usages by their names, e.g. the current and peak ones
+MemoryUsages = Dict[str, int]
+
+
+@contextmanager
+def trace_allocations(snapshot_memory_tracer: SnapshotMemoryTracer | None = None) -> Iterator[dict[str, int]]:
+    """Trace allocations with tracemalloc while in the context, put the current and peak traced memory to the yielded
+    dict, and the memory used by tracemalloc itself to store the traces.
+
+    If `snapshot_memory_tracer` is set, its peak snapshots are taken while in the context, and a snapshot is taken
+    at the end. tracemalloc is started on enter and stopped on exit.
+    """
+
+    traced_memory: MemoryUsages = {}
+    watch_peak = nullcontext()
+    if snapshot_memory_tracer is not None:
+        watch_peak = snapshot_memory_tracer.watch_peak()
+
+    tracemalloc.start(snapshot_memory_tracer.depth if snapshot_memory_tracer is not None else 1)
+    with ExitStack() as stack:
+        stack.callback(tracemalloc.stop)
+        with watch_peak:
+            yield traced_memory
+        current, peak = tracemalloc.get_traced_memory()
+        traced_memory.update(current=current, peak=peak, tracemalloc=tracemalloc.get_tracemalloc_memory())
+        if snapshot_memory_tracer is not None:
+            snapshot_memory_tracer.take_snapshot()
+
+
+@contextmanager
+def sample_process_memory(
+    memory_tracer: ThreadMemoryTracer,
+    interval: float | AdaptiveInterval = 10.0,
+    limit_memory_tracer: LimitMemoryTracer | None = None,
+    timeline_buffer: TimelineBuffer | None = None,
+    metric: str = "rss",
+) -> Iterator[MemoryUsages]:
+    """Sample the current process memory usage while in the context, put its current and peak increments to
+    the yielded dict.
+
+    The samples are taken by `memory_tracer`. If the metric is the RSS, the peak is also taken from the kernel
+    peak RSS (VmHWM) if it can be reset before the execution, the contexts can be nested, e.g. a %memory execution
+    in a cell measured by %memory_auto. The samples are also checked against the memory limit
+    of `limit_memory_tracer` if it is set, and appended to `timeline_buffer` if it is set.
+    """
+
+    pid = os.getpid()
+
+    peak_rss_reset = metric == "rss" and _push_peak_rss()
+    memory_tracer.arm([pid], interval, timeline_buffer, metric)
+    memory_before = memory_tracer.read()[0][pid]
+
+    process_memory: MemoryUsages = {}
+    watch_limit = nullcontext()
+    if limit_memory_tracer is not None:
+        watch_limit = limit_memory_tracer.watch(lambda: memory_tracer.read()[2])
+    try:
+        with watch_limit:
+            yield process_memory
+    finally:
+        memory_tracer.disarm()
+
+    memory_peak = memory_tracer.memory_usages_peak[pid]
+    if peak_rss_reset:
+        memory_peak = max(memory_peak, _pop_peak_rss())
+
+    process_memory["current"] = memory_tracer.memory_usages_current[pid] - memory_before
+    process_memory["peak"] = memory_peak - memory_before
+
+
+def _push_peak_rss() -> bool:
+    """Reset the peak RSS for a new measurement, return whether it is supported.
+
+    The peak before the reset is kept for the measurements in progress.
+    """
+
+    peak_rss = get_peak_rss()
+    if not reset_peak_rss():
+        return False
+
+    for index, floor in enumerate(_peak_rss_floors):
+        _peak_rss_floors[index] = max(floor, peak_rss or 0)
+    _peak_rss_floors.append(0)
+    return True
+
+
+def _pop_peak_rss() -> int:
+    """Get the peak RSS since the reset of the innermost measurement, which ends."""
+
+    return max(_peak_rss_floors.pop(), get_peak_rss() or 0)
+
+
+def get_native_memory(
+    process_memory: MemoryUsages, traced_memory: tuple[int, int], tracemalloc_memory: int
+) -> tuple[int, int]:
+    """Get the current and peak process memory increments that were not traced by tracemalloc.
+
+    Both are at least 0: the process memory usage drops when the execution frees the memory allocated before it,
+    which is not the native memory of the execution.
+    """
+
+    # memory used by tracemalloc itself is not allocated by the traced code
+    return (
+        max(process_memory["current"] - traced_memory[0] - tracemalloc_memory, 0),
+        max(process_memory["peak"] - traced_memory[1] - tracemalloc_memory, 0),
+    )
+
+
+@dataclass
+class TraceOptions:
+    """Options of a memory usage measurement, see `trace`.
+
+    `peak_threshold` makes the snapshot tracer take snapshots at the rises of the traced memory, see
+    `SnapshotMemoryTracer`, and the tree of the descendant processes is re-scanned every `scan_interval`
+    milliseconds with `children`.
+    """
+
+    sample: bool = False
+    native: bool = False
+    children: bool = False
+    snapshot: bool = False
+    depth: int = 1
+    peak_threshold: int | None = None
+    limit: int | None = None
+    interval: float | AdaptiveInterval = 10.0
+    metric: str = "rss"
+    timeline: bool = False
+    scan_interval: float = 100.0
+
+    def __post_init__(self) -> None:
+        if self.sample and self.native:
+            raise ValueError("the native memory usage is not available with sampling")
+
+    @property
+    def check_interval(self) -> float:
+        """Interval in milliseconds of the snapshot, limit and children checks, which are not adaptive."""
+
+        return self.interval if isinstance(self.interval, (int, float)) else _CHECK_INTERVAL
+
+
+class MemoryTrace:
+    """Measurement of the memory usage of an execution, the engine of `trace` and of the %memory magic.
+
+    The tracers requested by the options are made on init, so that their details can be read after
+    the measurement, e.g. the allocation sites of the snapshot tracer or the memory that exceeded the limit.
+    The current process memory usage is sampled by `sampler`, a new thread tracer if it is not set.
+    `processes_tracer`, if set, traces the peaks of the `pids` processes during the execution, and the processes
+    in `excluded_pids`, called once the processes tracer is armed, are not traced as the descendant processes.
+    The peaks of `allocation_tracers` are taken into the traced peak, as they reset the tracemalloc peak,
+    e.g. the line and task memory tracers.
+    """
+
+    def __init__(
+        self,
+        options: TraceOptions,
+        sampler: ThreadMemoryTracer | None = None,
+        processes_tracer: ThreadMemoryTracer | ContextMemoryTracer | None = None,
+        pids: Iterable[int] = (),
+        excluded_pids: Callable[[], Iterable[int]] = tuple,
+        allocation_tracers: Iterable[LineMemoryTracer | TaskMemoryTracer] = (),
+    ) -> None:
+        self.options: TraceOptions = options
+        self.memory_result: MemoryResult = MemoryResult(options.metric if options.sample else "tracemalloc")
+
+        self.snapshot_tracer: SnapshotMemoryTracer | None = None
+        if options.snapshot:
+            self.snapshot_tracer = SnapshotMemoryTracer(options.depth, options.peak_threshold, options.check_interval)
+        self.limit_tracer: LimitMemoryTracer | None = None
+        if options.limit is not None:
+            on_exceed = self.snapshot_tracer.take_snapshot if self.snapshot_tracer is not None else None
+            self.limit_tracer = LimitMemoryTracer(options.limit, options.check_interval, on_exceed)
+        self.children_tracer: ChildrenMemoryTracer | None = None
+        if options.children:
+            scan_interval = max(options.scan_interval, options.check_interval)
+            self.children_tracer = ChildrenMemoryTracer(None, options.check_interval, scan_interval, options.metric)
+        self.timeline_buffer: TimelineBuffer | None = TimelineBuffer() if options.timeline else None
+
+        self.processes_tracer: ThreadMemoryTracer | ContextMemoryTracer | None = processes_tracer
+        self._sampler = sampler
+        self._pids = list(pids)
+        self._excluded_pids = excluded_pids
+        self._allocation_tracers = list(allocation_tracers)
+
+    @property
+    def samples_process(self) -> bool:
+        """Whether the current process memory usage is sampled during the execution."""
+
+        options = self.options
+        return options.sample or options.native or options.limit is not None or options.timeline
+
+    @contextmanager
+    def measure(self) -> Iterator[MemoryResult]:
+        """Measure the memory usage of the code executed in the context, the yielded result is filled on exit."""
+
+        memory_result = self.memory_result
+        process_memory = None
+        traced_memory = None
+        with ExitStack() as stack:
+            self._start_tracers(stack)
+            if self.samples_process:
+                process_memory = stack.enter_context(self._sample_process_memory(stack))
+            if not self.options.sample:
+                traced_memory = stack.enter_context(trace_allocations(self.snapshot_tracer))
+
+            memory_result.start_time = time.time()
+            start_counter = time.perf_counter()
+            yield memory_result
+            # the tracers are stopped after the duration is measured
+            memory_result.duration = time.perf_counter() - start_counter
+            numpy_memory = self._get_numpy_memory() if self.options.native else None
+
+        if self.options.sample:
+            memory_result.current = process_memory["current"]
+            memory_result.peak = max(process_memory["peak"], memory_result.current, 0)
+        else:
+            allocation_peaks = [tracer.peak for tracer in self._allocation_tracers]
+            memory_result.current = traced_memory["current"]
+            memory_result.peak = max([traced_memory["peak"], *allocation_peaks])
+        self._fill_scopes(process_memory, traced_memory, numpy_memory)
+
+    def _start_tracers(self, stack: ExitStack) -> None:
+        """Start the processes and children tracers, they are stopped by the exit stack."""
+
+        if self.processes_tracer is not None:
+            self.processes_tracer.arm(self._pids, self.options.interval, metric=self.options.metric)
+            stack.callback(self.processes_tracer.disarm)
+        if self.children_tracer is not None:
+            # the tracer processes are started by now
+            self.children_tracer.excluded_pids = set(self._excluded_pids())
+            stack.enter_context(self.children_tracer.watch())
+
+    def _sample_process_memory(self, stack: ExitStack) -> ContextManager[MemoryUsages]:
+        sampler = self._sampler
+        if sampler is None:
+            sampler = ThreadMemoryTracer()
+            stack.callback(sampler.stop)
+        return sample_process_memory(
+            sampler, self.options.interval, self.limit_tracer, self.timeline_buffer, self.options.metric
+        )
+
+    def _get_numpy_memory(self) -> int | None:
+        """Get the memory of the NumPy arrays traced during the execution, None if NumPy is not imported.
+
+        NumPy is looked up while tracemalloc is still tracing, so that it can be imported by the execution.
+        """
+
+        numpy_domain = get_numpy_tracemalloc_domain()
+        if numpy_domain is None:
+            return None
+        return SnapshotMemoryTracer().domain_size(numpy_domain, tracemalloc.take_snapshot())
+
+    def _fill_scopes(
+        self, process_memory: MemoryUsages | None, traced_memory: MemoryUsages | None, numpy_memory: int | None
+    ) -> None:
+        """Put the memory usages of the other scopes, the snapshot, the timeline and the backend to the result."""
+
+        memory_result = self.memory_result
+        scopes = memory_result.scopes
+        if numpy_memory is not None:
+            scopes["numpy"] = (numpy_memory, None)
+        if self.options.native:
+            cell_memory = (memory_result.current, memory_result.peak)
+            scopes["native"] = get_native_memory(process_memory, cell_memory, traced_memory["tracemalloc"])
+        if self.children_tracer is not None:
+            scopes["children"] = (self.children_tracer.children_current, self.children_tracer.children_peak)
+            scopes["tree"] = (self.children_tracer.tree_current, self.children_tracer.tree_peak)
+
+        if self.snapshot_tracer is not None:
+            memory_result.snapshot = self.snapshot_tracer.snapshot
+        if self.timeline_buffer is not None:
+            memory_result.timeline = MemoryTimeline.from_buffer(
+                self.timeline_buffer, [os.getpid()], traced=not self.options.sample, metric=self.options.metric
+            )
+        if self.processes_tracer is not None:
+            memory_result.backend = self.processes_tracer.backend
+        elif self.samples_process:
+            memory_result.backend = ThreadMemoryTracer.backend
+
+
+@contextmanager
+def trace(
+    sample: bool = False,
+    native: bool = False,
+    children: bool = False,
+    snapshot: bool = False,
+    depth: int = 1,
+    limit: int | None = None,
+    interval: float | AdaptiveInterval = 10.0,
+    metric: str = "rss",
+    timeline: bool = False,
+) -> Iterator[MemoryResult]:
+    """Measure the memory usage of the code executed in the context, the yielded result is filled on exit.
+
+    The options are the same as of the %memory magic:
+
+    - `sample`: sample the process memory usage every `interval` milliseconds instead of tracing
+      the allocations with tracemalloc;
+    - `native`: also measure the process memory usage not traced by tracemalloc, put to the 'native' scope
+      and at least 0, and the memory of NumPy arrays, put to the 'numpy' scope, if NumPy is imported,
+      not available with `sample`;
+    - `children`: also trace the descendant processes, put to the 'children' and 'tree' scopes;
+    - `snapshot`: take a tracemalloc snapshot of the allocations at the end, grouped by `depth` frames;
+    - `limit`: raise `MemoryLimitExceeded` in the current thread when the process memory usage exceeds
+      this number of bytes;
+    - `metric`: metric of the process memory usage, 'rss', 'pss' or 'uss';
+    - `timeline`: sample the process memory usage and the traced memory into the timeline of the result.
+
+    tracemalloc is started on enter and stopped on exit, so the contexts cannot be nested.
+    """
+
+    options = TraceOptions(sample, native, children, snapshot, depth, None, limit, interval, metric, timeline)
+    with MemoryTrace(options).measure() as memory_result:
+        yield memory_result
+
+
+def traced(
+    func: Callable | None = None,
+    *,
+    callback: Callable[[MemoryResult], Any] | None = None,
+    **options: Any,
+) -> Callable:
+    """Decorator measuring the memory usage of every call of a function with `trace`, which takes the options.
+
+    The result of the last call that returned is kept in the `memory_result` attribute of the decorated function,
+    and passed to `callback` if it is set. Calls of a coroutine function are measured until the coroutine finishes.
+    """
+
+    if func is None:
+        return functools.partial(traced, callback=callback, **options)
+
+    if inspect.iscoroutinefunction(func):
+
+        @functools.wraps(func)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            memory_trace = MemoryTrace(TraceOptions(**options))
+            with memory_trace.measure():
+                out = await func(*args, **kwargs)
+            _report(wrapper, memory_trace.memory_result, callback)
+            return out
+
+    else:
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:  # noqa: WPS440
+            memory_trace = MemoryTrace(TraceOptions(**options))
+            with memory_trace.measure():
+                out = func(*args, **kwargs)
+            _report(wrapper, memory_trace.memory_result, callback)
+            return out
+
+    wrapper.memory_result = None
+    return wrapper
+
+
+def _report(wrapper: Callable, memory_result: MemoryResult, callback: Callable[[MemoryResult], Any] | None) -> None:
+    wrapper.memory_result = memory_result
+    if callback is not None:
+        callback(memory_result)
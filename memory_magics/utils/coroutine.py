@@ -0,0 +1,70 @@
+"""Running coroutines from synchronous code."""
+
+from __future__ import annotations
+
+import asyncio
+import sys
+import threading
+from typing import Any, Callable, Coroutine
+
+# seconds between the checks of the waiting thread for asynchronous exceptions
+_JOIN_TIMEOUT = 0.01
+
+
+def run_coroutine(coroutine: Coroutine, runner: Callable[[Coroutine], Any]) -> Any:
+    """Run a coroutine to completion and get its result.
+
+    If no event loop is running in the current thread, the coroutine is run with `runner`, e.g. the IPython
+    loop runner, which runs it on the IPython event loop. A running event loop cannot be re-entered, so if one
+    is running, e.g. in ipykernel, the coroutine is run on a new asyncio event loop in a separate thread.
+    """
+
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return runner(coroutine)
+
+    return _run_coroutine_in_thread(coroutine)
+
+
+def _run_coroutine_in_thread(coroutine: Coroutine) -> Any:
+    """Run a coroutine on a new event loop in a separate thread while the current thread waits for it.
+
+    The trace function of the current thread, e.g. of a line memory tracer, is also set in the separate thread.
+    If the waiting thread is interrupted, e.g. by a memory limit, the coroutine is cancelled.
+    """
+
+    loop = asyncio.new_event_loop()
+    task = loop.create_task(coroutine)
+    outcome: dict[str, Any] = {}
+    run_args = (loop, task, sys.gettrace(), outcome)
+
+    thread = threading.Thread(target=_run_task, args=run_args, name="memory-coroutine", daemon=True)
+    thread.start()
+    try:
+        # unlike an unbounded join, a bounded one lets asynchronous exceptions be raised in the waiting thread
+        while thread.is_alive():
+            thread.join(_JOIN_TIMEOUT)
+    except BaseException:  # noqa: WPS424
+        loop.call_soon_threadsafe(task.cancel)
+        thread.join()
+        raise
+
+    exception = outcome.get("exception")
+    if exception is not None:
+        raise exception
+    return outcome["out"]
+
+
+def _run_task(loop: asyncio.AbstractEventLoop, task: asyncio.Task, trace: Any, outcome: dict[str, Any]) -> None:
+    """Run a task to completion on an event loop with a trace function, and store its result or exception."""
+
+    sys.settrace(trace)
+    try:
+        outcome["out"] = loop.run_until_complete(task)
+    except BaseException as exc:  # noqa: WPS424
+        outcome["exception"] = exc
+    finally:
+        sys.settrace(None)
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        loop.close()
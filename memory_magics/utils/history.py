@@ -0,0 +1,206 @@
+"""History of the memory usages of the executed cells."""
+
+from __future__ import annotations
+
+import csv
+import hashlib
+import heapq
+import math
+from array import array
+from dataclasses import dataclass, fields
+from itertools import starmap
+from typing import Any, Iterator
+
+# missing values of the integer columns
+MISSING = -(2**63)
+
+# new modes are appended to keep the stored indices stable
+MODES = ("tracemalloc", "rss", "pss", "uss")
+
+_MODE = "mode"
+# type code of the integer columns
+_INT64 = "q"
+
+
+@dataclass
+class CellMemoryUsage:
+    """Memory usage of an executed cell.
+
+    `mode` is how the cell memory usage was measured: 'tracemalloc' traces the allocations, 'rss', 'pss'
+    or 'uss' sample the kernel memory usage with the metric. `native` is the kernel memory increment not traced
+    by tracemalloc, and `notebook`, `jupyter` and `children` are the total memory usages of the kernel, of Jupyter
+    and of the kernel descendant processes, they are only recorded if they were measured.
+    """
+
+    execution_count: int | None
+    source_hash: int
+    start_time: float
+    duration: float
+    mode: str
+    cell_current: int
+    cell_peak: int
+    native_current: int | None = None
+    native_peak: int | None = None
+    notebook_current: int | None = None
+    notebook_peak: int | None = None
+    jupyter_current: int | None = None
+    jupyter_peak: int | None = None
+    children_current: int | None = None
+    children_peak: int | None = None
+
+
+def get_source_hash(source: str) -> int:
+    """Get a 64-bit hash of a cell source, stable between sessions."""
+
+    digest = hashlib.blake2b(source.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little", signed=True)
+
+
+class MemoryHistory:
+    """Ring buffer of the memory usages of the last `size` executed cells.
+
+    The records are stored in columns of arrays of numbers rather than in objects, so a hundred thousand
+    records take a few megabytes. Missing integers are stored as `MISSING`, missing floats as NaN and modes
+    as indices in `MODES`. Records and columns are ordered from the oldest to the newest.
+    """
+
+    columns = tuple(column.name for column in fields(CellMemoryUsage))
+    typecodes = {"start_time": "d", "duration": "d", _MODE: "b"}
+
+    def __init__(self, size: int = 1000) -> None:
+        self._size: int = size
+        self._next: int = 0
+        self._columns: dict[str, array] = {}
+        self.clear()
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @size.setter
+    def size(self, size: int) -> None:
+        columns = {column: self.get_column(column)[-size:] for column in self.columns} if size else {}
+        self.clear()
+        self._size = size
+        self._columns.update(columns)
+
+    def append(self, record: CellMemoryUsage) -> None:
+        if not self._size:
+            return
+
+        full = len(self) == self._size
+        for column, column_array in self._columns.items():
+            number = self._encode(column, getattr(record, column))
+            if full:
+                column_array[self._next] = number
+            else:
+                column_array.append(number)
+        self._next = (self._next + 1) % self._size
+
+    def clear(self) -> None:
+        self._columns = {column: array(self.typecodes.get(column, _INT64)) for column in self.columns}
+        self._next = 0
+
+    def get_column(self, column: str) -> array:
+        """Get the raw numbers of a column, from the oldest to the newest record."""
+
+        column_array = self._columns[column]
+        if len(column_array) < self._size:
+            return column_array[:]
+        return column_array[self._next :] + column_array[: self._next]  # noqa: E203
+
+    def to_dict(self) -> dict[str, list]:
+        """Get the columns as lists with None for missing values."""
+
+        return {column: self._decode_column(column) for column in self.columns}
+
+    def to_pandas(self) -> Any:
+        """Get the records as a pandas DataFrame, pandas must be installed."""
+
+        import pandas  # noqa: WPS433
+
+        columns = {}
+        for column in self.columns:
+            if column == _MODE:
+                columns[column] = pandas.Categorical.from_codes(self.get_column(column).tolist(), MODES)
+            elif self.typecodes.get(column, _INT64) == _INT64:
+                columns[column] = pandas.array(self._decode_column(column), dtype="Int64")
+            else:
+                columns[column] = self.get_column(column)
+        dataframe = pandas.DataFrame(columns, columns=self.columns)
+        dataframe["start_time"] = pandas.to_datetime(dataframe["start_time"], unit="s")
+        return dataframe
+
+    def to_arrow(self) -> Any:
+        """Get the records as a pyarrow Table, pyarrow must be installed."""
+
+        from pyarrow import table  # noqa: WPS433
+
+        return table(self.to_dict())
+
+    def to_parquet(self, path: str) -> None:
+        """Write the records to a Parquet file, pyarrow must be installed."""
+
+        from pyarrow import parquet  # noqa: WPS433
+
+        parquet.write_table(self.to_arrow(), path)
+
+    def to_csv(self, path: str) -> None:
+        """Write the records to a CSV file."""
+
+        with open(path, "w", newline="", encoding="utf-8") as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(self.columns)
+            writer.writerows(zip(*self.to_dict().values()))
+
+    def top(self, n_records: int, by: str = "cell_peak") -> list[CellMemoryUsage]:  # noqa: WPS111
+        """Get the records with the largest values of a numeric column."""
+
+        if by not in self.columns or by == _MODE:
+            columns = ", ".join(self.columns)
+            raise ValueError(f"cannot sort by {by!r}, available columns: {columns}")
+
+        column_array = self.get_column(by)
+        indices = [index for index, number in enumerate(column_array) if number != MISSING and not math.isnan(number)]
+        indices = heapq.nlargest(n_records, indices, key=lambda index: column_array[index])
+        return [self._get_record(index) for index in indices]
+
+    def tail(self, n_records: int) -> list[CellMemoryUsage]:
+        """Get the last records, only they are read from the columns."""
+
+        if n_records < 0:
+            raise ValueError("the number of records must be non-negative")
+        return [self._get_record(index) for index in range(max(len(self) - n_records, 0), len(self))]
+
+    def __len__(self) -> int:
+        return len(self._columns["cell_peak"])
+
+    def __iter__(self) -> Iterator[CellMemoryUsage]:
+        yield from starmap(CellMemoryUsage, zip(*self.to_dict().values()))
+
+    def _get_record(self, index: int) -> CellMemoryUsage:
+        """Get a record by its index from the oldest to the newest record."""
+
+        if len(self) == self._size:
+            index = (self._next + index) % self._size
+        return CellMemoryUsage(*(self._decode(column, self._columns[column][index]) for column in self.columns))
+
+    def _decode_column(self, column: str) -> list:
+        return [self._decode(column, number) for number in self.get_column(column)]
+
+    def _decode(self, column: str, number: Any) -> Any:
+        """Decode a stored number of a column into a field of a record."""
+
+        if column == _MODE:
+            return MODES[number]
+        if number == MISSING and self.typecodes.get(column, _INT64) == _INT64:
+            return None
+        return number
+
+    @staticmethod
+    def _encode(column: str, field_value: Any) -> Any:
+        """Encode a field of a record into a number of a column."""
+
+        if column == _MODE:
+            return MODES.index(field_value)
+        return MISSING if field_value is None else field_value
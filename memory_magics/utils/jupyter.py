@@ -1,25 +1,41 @@
-import os
-from contextlib import suppress
-from typing import List
+import time
+from contextlib import closing, suppress
+from pathlib import PureWindowsPath
+from typing import TYPE_CHECKING, Iterable, List, Optional
 
-import psutil
+from memory_magics.memory_tracer._memory_tracer import ProcessMemoryReader
 
+if TYPE_CHECKING:
+    import psutil
+
+# scripts and modules running a Jupyter server, and the subcommands of the jupyter launcher running one
+SERVER_COMMANDS = frozenset(
+    ("jupyter-notebook", "jupyter-lab", "jupyter-server", "jupyter-nbclassic", "jupyterhub-singleuser")
+)
+SERVER_MODULES = frozenset(("notebook", "jupyterlab", "jupyter_server", "nbclassic", "jupyterhub.singleuser"))
+SERVER_SUBCOMMANDS = frozenset(("notebook", "lab", "server", "nbclassic"))
+
+# options of the Python interpreter, which take a value
+_PYTHON_VALUE_OPTIONS = frozenset(("-X", "-W", "-Q"))
 
-def get_jupyter_memory_usage() -> List[int]:
-    """Get the total current memory used by Jupyter"""
 
-    jupyter_memory_usages = []
+def get_memory_usage(pids: Iterable[int], metric: str = "rss") -> int:
+    """Get the total current memory used by processes, measured as RSS, PSS or USS"""
 
-    jupyter_pids = get_jupyter_pids()
-    for pid in jupyter_pids:
-        process = psutil.Process(pid)
-        jupyter_memory_usages.append(process.memory_info().rss)
+    with closing(ProcessMemoryReader(pids, metric)) as reader:
+        return sum(reader.read())
+
+
+def get_jupyter_memory_usage(jupyter_pids: Iterable[int], metric: str = "rss") -> int:
+    """Get the total current memory used by Jupyter"""
 
-    return sum(jupyter_memory_usages)
+    return get_memory_usage(jupyter_pids, metric)
 
 
 def get_jupyter_pids() -> List[int]:
-    """Get Jupyter processes ids"""
+    """Get Jupyter processes ids by scanning all processes in the system"""
+
+    import psutil  # noqa: WPS433, WPS442
 
     jupyter_pids = []
 
@@ -27,28 +43,121 @@ def get_jupyter_pids() -> List[int]:
     for pid in pids:
         with suppress(psutil.NoSuchProcess, psutil.AccessDenied):
             process = psutil.Process(pid)
-            cmdline = " ".join(process.cmdline()).lower()
-            if "jupyter" in cmdline:
+            if _is_jupyter_process(process):
                 jupyter_pids.append(pid)
 
     return jupyter_pids
 
 
-def get_last_line(file_path: str, skip_empty: bool = False) -> str:
-    """Get the last line of a file."""
-
-    with open(file_path, "rb") as file:
-        try:
-            file.seek(-1, os.SEEK_END)
-            while True:
-                if file.read(1) == b"\n":
-                    if file.read(1) or not skip_empty:
-                        file.seek(-1, os.SEEK_CUR)
-                        break
-                    file.seek(-1, os.SEEK_CUR)
-                file.seek(-2, os.SEEK_CUR)
-        # one-line case
-        except OSError:
-            file.seek(0)
-
-        return file.read().strip(b"\n").decode()
+def is_jupyter_server(cmdline: List[str]) -> bool:
+    """Check whether a command line runs a Jupyter server, rather than a wrapper or a shell starting one.
+
+    E.g. `python .../jupyter-lab`, `python -m notebook` or `jupyterhub-singleuser` run a server,
+    while `uv run jupyter lab`, `conda run jupyter lab` or the JupyterHub hub do not.
+    """
+
+    args = list(cmdline)
+    if args and _get_command_name(args[0]).startswith("python"):
+        args = _skip_python_options(args[1:])
+        if args and args[0] == "-m":
+            return _is_server_module(args[1:])
+    if not args:
+        return False
+
+    command = _get_command_name(args[0])
+    if command == "jupyter":
+        return len(args) > 1 and args[1] in SERVER_SUBCOMMANDS
+    return command in SERVER_COMMANDS
+
+
+class JupyterProcessFinder:
+    """Find Jupyter processes ids by walking the process tree of the current process.
+
+    The Jupyter server is the nearest ancestor of the current process running a Jupyter server,
+    see `is_jupyter_server`, and Jupyter processes are the server and its descendants (kernels, terminals).
+    If there is no such ancestor, all processes in the system with 'jupyter' in their command lines are scanned.
+
+    The result is cached for `ttl` seconds, in between only the processes that have exited are dropped.
+    """
+
+    def __init__(self, ttl: float = 30.0) -> None:
+        self.ttl: float = ttl
+
+        self._jupyter_pids: List[int] = []
+        self._discovery_time: float = float("-inf")
+
+    def get_pids(self) -> List[int]:
+        import psutil  # noqa: WPS433, WPS442
+
+        if time.monotonic() - self._discovery_time >= self.ttl:
+            self._jupyter_pids = self.discover()
+            self._discovery_time = time.monotonic()
+        else:
+            self._jupyter_pids = [pid for pid in self._jupyter_pids if psutil.pid_exists(pid)]
+
+        return self._jupyter_pids
+
+    def invalidate(self) -> None:
+        self._discovery_time = float("-inf")
+
+    def discover(self) -> List[int]:
+        import psutil  # noqa: WPS433, WPS442
+
+        server = self._find_server()
+        if server is None:
+            return get_jupyter_pids()
+
+        jupyter_pids = [server.pid]
+        with suppress(psutil.NoSuchProcess, psutil.AccessDenied):
+            jupyter_pids.extend(child.pid for child in server.children(recursive=True))
+
+        return jupyter_pids
+
+    @staticmethod
+    def _find_server(pid: Optional[int] = None) -> Optional["psutil.Process"]:
+        """Find the nearest ancestor of a process, the current one by default, running a Jupyter server."""
+
+        import psutil  # noqa: WPS433, WPS442
+
+        parents = []
+        with suppress(psutil.NoSuchProcess, psutil.AccessDenied):
+            parents = psutil.Process(pid).parents()
+        for parent in parents:
+            with suppress(psutil.NoSuchProcess, psutil.AccessDenied):
+                if is_jupyter_server(parent.cmdline()):
+                    return parent
+
+        return None
+
+
+def _is_jupyter_process(process: "psutil.Process") -> bool:
+    cmdline = " ".join(process.cmdline()).lower()
+    return "jupyter" in cmdline
+
+
+def _get_command_name(path: str) -> str:
+    """Get the lowercase name of a command without the suffixes of the scripts and executables."""
+
+    # the paths are split on both separators, so that Windows paths are recognised too
+    command = PureWindowsPath(path).name.lower()
+    for suffix in ("-script.py", ".exe", ".py"):
+        if command.endswith(suffix):
+            return command[: -len(suffix)]
+    return command
+
+
+def _skip_python_options(args: List[str]) -> List[str]:
+    """Skip the options of the Python interpreter before the script, or before the -m option."""
+
+    while args and args[0].startswith("-") and args[0] != "-m":
+        args = args[2:] if args[0] in _PYTHON_VALUE_OPTIONS else args[1:]
+    return args
+
+
+def _is_server_module(args: List[str]) -> bool:
+    """Check whether the module run by `python -m`, given with its arguments, is a Jupyter server."""
+
+    module = args[0] if args else ""
+    if module == "jupyter":
+        return len(args) > 1 and args[1] in SERVER_SUBCOMMANDS
+    return module in SERVER_MODULES
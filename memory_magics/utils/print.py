@@ -1,63 +1,266 @@
 """Print utility functions."""
-from typing import Optional
+import heapq
+import linecache
+import re
+import time
+import tracemalloc
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+from memory_magics.memory_tracer.leak_memory_tracer import LeakSite
+from memory_magics.memory_tracer.line_memory_tracer import LineMemoryUsage
+from memory_magics.memory_tracer.snapshot_memory_tracer import is_excluded_file
+from memory_magics.utils.history import CellMemoryUsage
+from memory_magics.utils.sizeof import RetainedSizes
+
+if TYPE_CHECKING:
+    # the task memory tracer imports asyncio
+    from memory_magics.memory_tracer.task_memory_tracer import TaskMemoryUsage
+
+# label, current and peak memory usages
+MemoryUsageRow = Tuple[str, int, Optional[int]]
+
+# width of the columns of memory usages
+_COLUMN = 11
+_EMPTY_COLUMN = " " * _COLUMN
+_DASH = "     --    "
+_RULE_WIDTH = 66
+_HISTORY_RULE_WIDTH = 90
+_TIME_BUDGET_RAN_OUT = "The time budget ran out, the sizes are lower bounds"
 
 
 def format_bytes(n_bytes: int) -> str:
     """Format an integer number of bytes into a string."""
 
+    if n_bytes < 0:
+        return "-" + format_bytes(-n_bytes)
+
     for unit in ["B", "KiB", "MiB", "GiB"]:
         if not n_bytes // 1024:
             return f"{round(n_bytes, 2)} {unit}"  # noqa: WPS237
         n_bytes /= 1024
 
 
+def parse_bytes(size: str) -> int:
+    """Parse a string like '512', '1.5 MiB' or '8GB' into an integer number of bytes."""
+
+    units = {"": 1, "b": 1, "k": 1024, "m": 1024**2, "g": 1024**3, "t": 1024**4}
+
+    match = re.fullmatch(r"\s*(\d+(?:\.\d*)?)\s*([kmgt]?)(i?b)?\s*", size.lower())
+    if match is None:
+        raise ValueError(f"invalid number of bytes: {size!r}")
+
+    number, unit, _ = match.groups()
+    return int(float(number) * units[unit])
+
+
 def print_memory_usage_info(
-    memory_current: int,
-    memory_peak: int,
-    memory_notebook: Optional[int],
-    memory_notebook_peak: Optional[int],
-    memory_jupyter: Optional[int],
-    memory_jupyter_peak: Optional[int],
-    expr_type: Optional[str] = None,
+    rows: List[MemoryUsageRow],
+    show_peaks: bool = True,
     print_table: bool = False,
+    measured_by: Optional[str] = None,
+    metric: str = "rss",
 ) -> None:
-    dash = "     --    "
+    """Print rows of a label, a current and an optional peak memory usages.
 
-    memory_current = format_bytes(memory_current) if memory_current is not None else None
-    memory_peak = format_bytes(memory_peak) if memory_peak is not None else dash
-    memory_notebook = format_bytes(memory_notebook) if memory_notebook is not None else None
-    memory_notebook_peak = format_bytes(memory_notebook_peak) if memory_notebook_peak is not None else dash
-    memory_jupyter = format_bytes(memory_jupyter) if memory_jupyter is not None else None
-    memory_jupyter_peak = format_bytes(memory_jupyter_peak) if memory_jupyter_peak is not None else dash
+    `metric` is how the process memory usages were measured, it is printed unless it is the RSS.
+    """
 
+    formatted_rows = [(label, format_bytes(current), _format_peak(peak)) for label, current, peak in rows]
     if print_table:
-        if any([memory_current is not None, memory_notebook is not None, memory_jupyter is not None]):
-            print("RAM usage |   current   |     peak     |")
-            print("----------------------------------------")
-        if memory_current is not None:
-            print(f" {expr_type}     | {memory_current:11} | {memory_peak:11}  |")
-        if memory_notebook is not None:
-            print(f" notebook | {memory_notebook:11} | {memory_notebook_peak:11}  |")
-        if memory_jupyter is not None:
-            print(f" jupyter  | {memory_jupyter:11} | {memory_jupyter_peak:11}  |")
-
+        _print_memory_usage_table(formatted_rows)
     else:
-        if expr_type is not None:
-            if memory_notebook:
-                print(f"RAM usage: {expr_type}:     {memory_current:11} / {memory_peak:11}")
-                print(f"           notebook: {memory_notebook:11} / {memory_notebook_peak:11}")
-                if memory_jupyter:
-                    print(f"           jupyter:  {memory_jupyter:11} / {memory_jupyter_peak:11}")
-            elif memory_jupyter:
-                print(f"RAM usage: {expr_type}:    {memory_current:11} / {memory_peak:11}")
-                print(f"           jupyter: {memory_jupyter:11} / {memory_jupyter_peak:11}")
-            else:
-                print(f"RAM usage: {expr_type}: {memory_current} / {memory_peak}")
+        _print_memory_usage_lines(formatted_rows, show_peaks)
+
+    if measured_by is not None:
+        print(f"Measured by {measured_by}")
+    if metric != "rss" and rows:
+        print(f"Process memory measured as {metric.upper()}")
+
+
+def print_line_memory_usage(source_lines: List[str], line_memory_usages: Dict[int, LineMemoryUsage]) -> None:
+    """Print source lines annotated with their memory usage."""
+
+    _print_header("Line # |  increment  |    peak     | occurrences | line contents")
+    for lineno, source_line in enumerate(source_lines, start=1):
+        line_memory_usage = line_memory_usages.get(lineno)
+        if line_memory_usage is None:
+            _print_row(f"{lineno:6}", _EMPTY_COLUMN, _EMPTY_COLUMN, _EMPTY_COLUMN, source_line)
+            continue
+
+        increment = format_bytes(line_memory_usage.increment)
+        peak = format_bytes(line_memory_usage.peak)
+        occurrences = str(line_memory_usage.occurrences).rjust(_COLUMN)
+        _print_row(f"{lineno:6}", increment.ljust(_COLUMN), peak.ljust(_COLUMN), occurrences, source_line)
+
+
+def print_task_memory_usage(task_memory_usages: Dict[str, "TaskMemoryUsage"]) -> None:
+    """Print asyncio tasks with their memory usage, from the highest peak to the lowest."""
+
+    if not task_memory_usages:
+        return
+
+    _print_header(" increment  |    peak     |    steps    | task")
+    task_memory_usages = sorted(task_memory_usages.items(), key=lambda task: task[1].peak, reverse=True)
+    for name, task_memory_usage in task_memory_usages:
+        increment = format_bytes(task_memory_usage.increment)
+        peak = format_bytes(task_memory_usage.peak)
+        steps = str(task_memory_usage.steps).rjust(_COLUMN)
+        _print_row(increment.ljust(_COLUMN), peak.ljust(_COLUMN), steps, name)
+
+
+def print_variable_sizes(retained_sizes: RetainedSizes) -> None:
+    """Print the variables with the memory they retain, from the largest to the smallest."""
+
+    if not retained_sizes.sizes:
+        return
+
+    _print_header(" retained   | variable")
+    sizes = retained_sizes.sizes
+    for name in sorted(sizes, key=sizes.get, reverse=True):
+        size = format_bytes(sizes[name])
+        _print_row(size.ljust(_COLUMN), name)
+    if retained_sizes.shared:
+        shared = format_bytes(retained_sizes.shared)
+        _print_row(shared.ljust(_COLUMN), "<shared by several variables>")
+    if not retained_sizes.complete:
+        print(_TIME_BUDGET_RAN_OUT)
+
+
+def print_namespace_memory_usage(
+    object_sizes: RetainedSizes, type_names: Dict[str, str], n_objects: int, duration: float
+) -> None:
+    """Print the largest objects of a namespace with their deep sizes and types."""
+
+    n_measured = len(object_sizes.sizes)
+    total = format_bytes(sum(object_sizes.sizes.values()))
+    duration_ms = duration * 1000
+    print(f"Namespace: {n_measured} objects, {total} in total, measured in {duration_ms:.1f} ms")
+    if not object_sizes.complete:
+        print(_TIME_BUDGET_RAN_OUT)
+    if not object_sizes.sizes or not n_objects:
+        return
+
+    _print_header("    size     |        type        | variable")
+    sizes = object_sizes.sizes
+    for name in heapq.nlargest(n_objects, sizes, key=sizes.get):
+        size = format_bytes(sizes[name])
+        type_name = type_names.get(name, "")
+        _print_row(size.ljust(_COLUMN + 1), f"{type_name:18.18}", name)
+
 
+def print_memory_limit_exceeded(limit: int, memory: int, lineno: Optional[int], source_lines: List[str]) -> None:
+    """Print the memory limit that was exceeded and the line of the traced code that was interrupted."""
+
+    message = "Memory limit exceeded: " + format_bytes(memory) + " > " + format_bytes(limit)
+    if lineno is not None and lineno <= len(source_lines):
+        source_line = source_lines[lineno - 1].strip()
+        message += f", interrupted at <cell>:{lineno}: {source_line}"
+    print(message)
+
+
+def print_top_allocations(
+    statistics: List[tracemalloc.Statistic],
+    source_lines: List[str],
+    title: str = "Top allocations",
+) -> None:
+    """Print the largest allocation sites, the lines of the traced code are taken from `source_lines`."""
+
+    if not statistics:
+        return
+
+    print(f"{title}:")
+    for rank, statistic in enumerate(statistics, start=1):
+        size = format_bytes(statistic.size)
+        print(f" #{rank}: {size} in {statistic.count} blocks")
+        print_traceback(statistic.traceback, source_lines)
+
+
+def print_memory_leaks(
+    repeat: int, trend: Tuple[float, float], leak_sites: List[LeakSite], source_lines: List[str]
+) -> None:
+    """Print the growth of the retained memory over the runs and the leaking allocation sites."""
+
+    slope, r_squared = trend
+    growth = format_bytes(round(slope))
+    print(f"Retained memory growth over {repeat} runs: {growth} per run (R² {r_squared:.2f})")
+    if not leak_sites:
+        print("No allocation sites with retained memory growing steadily across the runs")
+        return
+
+    print("Leaking allocation sites:")
+    for rank, leak_site in enumerate(leak_sites, start=1):
+        growth = format_bytes(round(leak_site.slope))
+        size = format_bytes(leak_site.size)
+        print(f" #{rank}: {growth} per run, {size} retained (R² {leak_site.r_squared:.2f})")
+        print_traceback(leak_site.traceback, source_lines)
+
+
+def print_traceback(traceback: tracemalloc.Traceback, source_lines: List[str]) -> None:
+    """Print the frames of an allocation site, the lines of the traced code are taken from `source_lines`."""
+
+    for frame in traceback:
+        if is_excluded_file(frame.filename):
+            continue
+        filename = frame.filename
+        if filename.startswith("<memory traced"):
+            filename = "<cell>"
+            source_line = source_lines[frame.lineno - 1] if frame.lineno <= len(source_lines) else ""
         else:
-            if memory_notebook:
-                print(f"RAM usage: notebook: {memory_notebook}")
-                if memory_jupyter:
-                    print(f"           jupyter:  {memory_jupyter}")
-            elif memory_jupyter:
-                print(f"RAM usage: jupyter: {memory_jupyter}")
+            source_line = linecache.getline(filename, frame.lineno)
+        print(f"    {filename}:{frame.lineno}: {source_line.strip()}")  # noqa: WPS237
+
+
+def print_memory_history(records: List[CellMemoryUsage]) -> None:
+    """Print the recorded memory usages of the cells."""
+
+    _print_header(
+        " In # |    mode     |  started  |  duration  |   current   |    peak     |   native    ", _HISTORY_RULE_WIDTH
+    )
+    for record in records:
+        execution_count = str(record.execution_count) if record.execution_count is not None else ""
+        started = time.strftime("%H:%M:%S", time.localtime(record.start_time)).ljust(9)
+        duration = f"{record.duration:.3f} s".ljust(10)
+        current = format_bytes(record.cell_current)
+        peak = format_bytes(record.cell_peak)
+        native = format_bytes(record.native_peak) if record.native_peak is not None else ""
+        memory_usage = [current.ljust(_COLUMN), peak.ljust(_COLUMN), native]
+        _print_row(execution_count.rjust(5), record.mode.ljust(_COLUMN), started, duration, *memory_usage)
+
+
+def _print_header(header: str, width: int = _RULE_WIDTH) -> None:
+    print(header)
+    print("-" * width)
+
+
+def _print_row(*columns: str) -> None:
+    print(" | ".join(columns))
+
+
+def _format_peak(peak: Optional[int]) -> str:
+    return format_bytes(peak) if peak is not None else _DASH
+
+
+def _print_memory_usage_table(rows: List[Tuple[str, str, str]]) -> None:
+    if rows:
+        print("RAM usage |   current   |     peak     |")
+        print("----------------------------------------")
+    for label, current, peak in rows:
+        print(f" {label:8} | {current:11} | {peak:11}  |")
+
+
+def _print_memory_usage_lines(rows: List[Tuple[str, str, str]], show_peaks: bool = True) -> None:
+    """Print the memory usages one per line, aligned when there are several rows."""
+
+    if not rows:
+        return
+
+    label_width = max(len(label) for label, _, _ in rows) + 1
+    width = _COLUMN if len(rows) > 1 else 0
+    prefix = "RAM usage: "
+    for label, current, peak in rows:
+        label_column = f"{label}:".ljust(label_width)
+        memory_usage = current
+        if show_peaks:
+            memory_usage = current.ljust(width) + " / " + peak.ljust(width)
+        print(f"{prefix}{label_column} {memory_usage}")
+        prefix = " " * len(prefix)
@@ -0,0 +1,56 @@
+"""Utility functions for the Linux /proc file system."""
+
+from __future__ import annotations
+
+PROC_SELF_STATUS = "/proc/self/status"
+PROC_SELF_CLEAR_REFS = "/proc/self/clear_refs"
+CGROUP_V2_MEMORY_MAX = "/sys/fs/cgroup/memory.max"
+CGROUP_V1_MEMORY_LIMIT = "/sys/fs/cgroup/memory/memory.limit_in_bytes"
+
+# cgroup v1 reports a huge page-aligned number when there is no limit
+CGROUP_V1_NO_LIMIT = 2**60
+
+
+def reset_peak_rss() -> bool:
+    """Reset the peak resident set size of the current process, return whether it is supported."""
+
+    try:
+        with open(PROC_SELF_CLEAR_REFS, "w", encoding="utf-8") as clear_refs:
+            # 5 resets the peak resident set size only
+            clear_refs.write("5")
+    except OSError:
+        return False
+
+    return True
+
+
+def get_peak_rss() -> int | None:
+    """Get the peak resident set size (VmHWM) of the current process, or None if it is not available."""
+
+    try:
+        with open(PROC_SELF_STATUS, "rb") as status:
+            for line in status:
+                if line.startswith(b"VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+
+    return None
+
+
+def get_cgroup_memory_limit() -> int | None:
+    """Get the memory limit of the cgroup of the current process (memory.max), or None if it is not limited."""
+
+    for path in (CGROUP_V2_MEMORY_MAX, CGROUP_V1_MEMORY_LIMIT):
+        try:
+            with open(path, encoding="utf-8") as memory_limit_file:
+                memory_limit = memory_limit_file.read().strip()
+        except OSError:
+            continue
+
+        if memory_limit == "max":
+            return None
+        memory_limit = int(memory_limit)
+        return memory_limit if memory_limit < CGROUP_V1_NO_LIMIT else None
+
+    return None
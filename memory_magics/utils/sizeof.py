@@ -0,0 +1,328 @@
+"""Sizes of Python objects with the objects they refer to."""
+
+from __future__ import annotations
+
+import gc
+import itertools
+import sys
+import time
+import types
+import weakref
+from dataclasses import dataclass, field
+from typing import Any, Hashable, Iterable
+
+# objects of these types are shared by the code rather than held by a variable, they are not walked into
+SHARED_TYPES = (
+    types.ModuleType,
+    type,
+    types.FunctionType,
+    types.BuiltinFunctionType,
+    types.MethodType,
+    types.CodeType,
+    types.FrameType,
+)
+
+# owner of the objects reachable from several variables, and of the excluded objects
+_SHARED = -1
+_EXCLUDED = -2
+
+# number of objects walked between the checks of the time budget
+_CHECK_EVERY = 1024
+
+# objects of these types do not refer to other objects
+_ATOMIC_TYPES = frozenset((str, bytes, bytearray, int, float, complex, bool, type(None)))
+
+# sequences of other objects, which size changes with their items
+_SEQUENCE_TYPES = (list, tuple)
+
+# unordered containers of other objects
+_SET_TYPES = (set, frozenset)
+
+# number of the items of a container, which ids are a part of its version
+_VERSION_ITEMS = 16
+
+# sequences of bytes or characters, which size changes with their length
+_BUFFER_TYPES = (bytes, bytearray, str)
+
+# containers which version is their size, length and the ids of a few items
+_CONTAINER_TYPES = (*_BUFFER_TYPES, *_SEQUENCE_TYPES, *_SET_TYPES, dict)
+
+
+@dataclass
+class RetainedSizes:
+    """Sizes of the objects retained by variables.
+
+    `sizes` maps the variables to the sizes of the objects reachable only from them, i.e. freed by `del`, and `shared`
+    is the size of the objects reachable from several variables. If the time budget ran out, `complete` is False
+    and the sizes are lower bounds.
+    """
+
+    sizes: dict[str, int] = field(default_factory=dict)
+    shared: int = 0
+    complete: bool = True
+
+
+def get_size(instance: Any) -> tuple[int, Iterable]:
+    """Get the size of an object itself and the objects it refers to.
+
+    NumPy arrays, pandas objects and memoryviews are measured by the sizes of their buffers, which are not walked
+    element by element, except for the arrays and columns of Python objects.
+    """
+
+    if type(instance) in _ATOMIC_TYPES:  # noqa: WPS516
+        return sys.getsizeof(instance), ()
+    if isinstance(instance, memoryview):
+        # the buffer belongs to the exporting object, unless the memoryview is released
+        return sys.getsizeof(instance), () if instance.released else (instance.obj,)
+
+    buffers_size = _get_buffers_size(instance)
+    if buffers_size is not None:
+        return buffers_size
+    return sys.getsizeof(instance), gc.get_referents(instance)
+
+
+def _get_buffers_size(instance: Any) -> tuple[int, Iterable] | None:
+    """Get the size of a NumPy array or of a pandas object with its buffers, and the Python objects it holds,
+    or None if it is neither."""
+
+    numpy = sys.modules.get("numpy")
+    if numpy is not None and isinstance(instance, numpy.ndarray):
+        # the size of an array includes its buffer if it owns it, otherwise the buffer belongs to the base
+        referents = () if instance.base is None else (instance.base,)
+        return sys.getsizeof(instance), instance.flat if instance.dtype.hasobject else referents
+
+    pandas = sys.modules.get("pandas")
+    if pandas is None or not isinstance(instance, (pandas.DataFrame, pandas.Series, pandas.Index)):
+        return None
+    # sums the nbytes of the blocks, object columns are counted as arrays of pointers
+    size = instance.memory_usage(deep=False)
+    if isinstance(instance, pandas.DataFrame):
+        size = size.sum()
+        columns = [column.to_numpy() for _, column in instance.items() if column.dtype == object]
+    else:
+        columns = [instance.to_numpy()] if instance.dtype == object else []
+    size += object.__sizeof__(instance)  # noqa: WPS609
+    return int(size), [element for column in columns for element in column.flat]
+
+
+def get_retained_sizes(
+    variables: dict[str, Any], excluded: Iterable[Any] = (), time_budget: float = 1.0
+) -> RetainedSizes:
+    """Get the sizes of the objects retained by every variable, walking the objects they refer to.
+
+    Every object is measured once: the objects reachable from several variables are put to the shared size,
+    and the `excluded` objects, e.g. the values of the other variables, are not walked into. Modules, classes and
+    functions are shared by the code rather than retained by a variable, they are not walked into either.
+    The walk stops when `time_budget` seconds run out.
+    """
+
+    return _RetainedSizeWalker(variables, excluded, time_budget).walk()
+
+
+class _RetainedSizeWalker:
+    def __init__(self, variables: dict[str, Any], excluded: Iterable[Any], time_budget: float) -> None:
+        self.variables = variables
+        self.retained_sizes = RetainedSizes(dict.fromkeys(variables, 0))
+
+        self._names = list(variables)
+        self._owners: dict[int, int] = {id(instance): _EXCLUDED for instance in excluded}
+        # the walked objects are kept alive, so that their ids are not reused by temporary objects
+        self._walked: list[Any] = []
+        self._deadline = time.perf_counter() + time_budget
+
+    def walk(self) -> RetainedSizes:
+        for index, instance in enumerate(self.variables.values()):
+            if isinstance(instance, SHARED_TYPES):
+                continue
+            try:
+                self._walk(instance, index)
+            except TimeoutError:
+                self.retained_sizes.complete = False
+                break
+
+        return self.retained_sizes
+
+    def _walk(self, instance: Any, index: int) -> None:
+        """Attribute the objects reachable from an object to the variable of the index."""
+
+        stack = [instance]
+        while stack:
+            instance = stack.pop()
+            key = id(instance)
+            owner = self._owners.get(key)
+            if owner in {index, _SHARED, _EXCLUDED}:
+                continue
+            if owner is not None:
+                # reachable from another variable, and so is everything reachable from it
+                self._share(instance)
+                continue
+
+            self._owners[key] = index
+            self.retained_sizes.sizes[self._names[index]] += self._visit(instance, index, stack)
+
+    def _share(self, instance: Any) -> None:
+        """Attribute the objects reachable from an object to the shared size."""
+
+        stack = [instance]
+        while stack:
+            instance = stack.pop()
+            key = id(instance)
+            owner = self._owners.get(key)
+            if owner in {_SHARED, _EXCLUDED}:
+                continue
+
+            self._owners[key] = _SHARED
+            size = self._visit(instance, _SHARED, stack)
+            self.retained_sizes.shared += size
+            if owner is not None:
+                self.retained_sizes.sizes[self._names[owner]] -= size
+
+    def _visit(self, instance: Any, index: int, stack: list[Any]) -> int:
+        """Measure an object with the atomic objects it refers to, and push the other ones to the stack."""
+
+        if len(self._walked) % _CHECK_EVERY == 0 and time.perf_counter() > self._deadline:
+            raise TimeoutError
+
+        size, referents = get_size(instance)
+        self._walked.append(instance)
+
+        referents = list(referents)
+        atoms = [referent for referent in referents if type(referent) in _ATOMIC_TYPES]  # noqa: WPS516
+        if len(atoms) < len(referents):
+            stack.extend(
+                referent
+                for referent in referents
+                if type(referent) not in _ATOMIC_TYPES and not isinstance(referent, SHARED_TYPES)  # noqa: WPS516
+            )
+        return size + self._visit_atoms(atoms, index)
+
+    def _visit_atoms(self, atoms: list[Any], index: int) -> int:
+        """Measure the atomic objects that are not owned yet, the ones owned by another variable become shared.
+
+        The atomic objects do not refer to other objects, e.g. the strings of a list, so they are measured in bulk.
+        """
+
+        atoms_by_id = dict(zip(map(id, atoms), atoms))
+        for key in atoms_by_id.keys() & self._owners.keys():
+            owner = self._owners[key]
+            if owner not in {index, _SHARED, _EXCLUDED}:
+                size = sys.getsizeof(atoms_by_id[key])
+                self._owners[key] = _SHARED
+                self.retained_sizes.shared += size
+                self.retained_sizes.sizes[self._names[owner]] -= size
+            del atoms_by_id[key]  # noqa: WPS420
+
+        self._owners.update(dict.fromkeys(atoms_by_id, index))
+        return sum(map(sys.getsizeof, atoms_by_id.values()))
+
+
+def get_version(instance: Any) -> Hashable | None:
+    """Get a cheap signal of the changes of the deep size of an object, or None if there is none.
+
+    The signal is the capacity, the length and the ids of a few items of a container, i.e. of evenly spaced items
+    of a list or a tuple, and of the first items of a set or of the first and last items of a dict, the length
+    of a string, the buffers of a NumPy array or of the blocks of a pandas object, and the ids of the attributes
+    of an object with a `__dict__`. The signal is bounded, so the other items of a container may be replaced
+    unnoticed, and the changes of the nested objects are not signalled.
+    """
+
+    if isinstance(instance, _CONTAINER_TYPES):
+        return type(instance), sys.getsizeof(instance), len(instance), _get_item_ids(instance)
+
+    numpy = sys.modules.get("numpy")
+    if numpy is not None and isinstance(instance, numpy.ndarray):
+        return type(instance), instance.shape, instance.strides, instance.dtype.str, id(instance.base)
+
+    pandas = sys.modules.get("pandas")
+    if pandas is not None and isinstance(instance, (pandas.DataFrame, pandas.Series)):
+        blocks = getattr(getattr(instance, "_mgr", None), "blocks", None)
+        if blocks is None:
+            return None
+        return type(instance), instance.shape, tuple(id(block.values) for block in blocks)
+
+    attributes = getattr(instance, "__dict__", None)
+    if isinstance(attributes, dict):
+        return type(instance), tuple(attributes), tuple(map(id, attributes.values()))
+    return None
+
+
+def _get_item_ids(container: Any) -> tuple[int, ...]:
+    """Get the ids of a few items of a container, see `get_version`, and of the keys of a dict."""
+
+    if isinstance(container, _SEQUENCE_TYPES):
+        step = max(len(container) // _VERSION_ITEMS, 1)
+        return (*map(id, container[::step]), *map(id, container[-1:]))
+    if isinstance(container, _SET_TYPES):
+        return tuple(map(id, itertools.islice(container, _VERSION_ITEMS)))
+    if isinstance(container, dict):
+        n_items = _VERSION_ITEMS // 2
+        first_items = itertools.islice(container.items(), n_items)
+        last_items = itertools.islice(reversed(container.items()), n_items)
+        return tuple(id(part) for key_value in itertools.chain(first_items, last_items) for part in key_value)
+    return ()
+
+
+class SizeCache:
+    """Deep sizes of objects cached by their ids and versions, see `get_version`.
+
+    A size is reused while the object with the id is alive and its version does not change, so measuring
+    a namespace again only walks the objects that were created or changed since. The objects that do not support
+    weak references are recognised by their type and version. The entries of the objects that are not measured
+    again are dropped.
+    """
+
+    def __init__(self) -> None:
+        self._entries: dict[int, tuple[Any, Hashable, int]] = {}
+
+    def get_sizes(
+        self, variables: dict[str, Any], excluded: Iterable[Any] = (), time_budget: float = 1.0
+    ) -> RetainedSizes:
+        """Get the deep sizes of the objects, see `get_retained_sizes` for `excluded` and `time_budget`.
+
+        Unlike the retained sizes, the objects reachable from several objects are counted in the size of each of them.
+        """
+
+        excluded = list(excluded)
+        deadline = time.perf_counter() + time_budget
+        sizes = RetainedSizes()
+        entries: dict[int, tuple[Any, Hashable, int]] = {}
+
+        for name, instance in variables.items():
+            version = get_version(instance)
+            entry = entries.get(id(instance)) or self._entries.get(id(instance))
+            if self._is_fresh(entry, instance, version):
+                sizes.sizes[name] = entry[2]
+                entries[id(instance)] = entry
+                continue
+
+            instance_sizes = get_retained_sizes({name: instance}, excluded, max(deadline - time.perf_counter(), 0))
+            sizes.sizes[name] = instance_sizes.sizes[name]
+            sizes.complete = sizes.complete and instance_sizes.complete
+            if instance_sizes.complete and version is not None:
+                entries[id(instance)] = (self._make_ref(instance), version, sizes.sizes[name])
+
+        self._entries = entries
+        return sizes
+
+    def clear(self) -> None:
+        self._entries = {}
+
+    @staticmethod
+    def _make_ref(instance: Any) -> Any:
+        """Make a weak reference to an object, or get its type if it does not support weak references."""
+
+        try:
+            return weakref.ref(instance)
+        except TypeError:
+            return type(instance)
+
+    @staticmethod
+    def _is_fresh(entry: tuple[Any, Hashable, int] | None, instance: Any, version: Hashable | None) -> bool:
+        """Check whether a cache entry is of the object and of its current version."""
+
+        if entry is None or version is None or entry[1] != version:
+            return False
+        ref = entry[0]
+        if isinstance(ref, weakref.ref):
+            return ref() is instance
+        return ref is type(instance)  # noqa: WPS516
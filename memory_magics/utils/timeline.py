@@ -0,0 +1,203 @@
+"""Memory usage timeline of an execution."""
+
+from __future__ import annotations
+
+from typing import Any, Dict, List, Sequence, Tuple
+
+from memory_magics.memory_tracer._memory_tracer import TimelineBuffer
+from memory_magics.utils.print import format_bytes
+
+SPARKLINE_BLOCKS = "▁▂▃▄▅▆▇█"
+SVG_COLORS = ("#1f77b4", "#ff7f0e", "#2ca02c", "#d62728", "#9467bd", "#8c564b")
+
+# times and memory usages of a series
+Series = Tuple[List[float], List[int]]
+
+# size of the SVG plot and of its margins, and offsets of its labels in pixels
+_SVG_WIDTH = 600
+_SVG_HEIGHT = 200
+_SVG_MARGIN = 40
+_SVG_LABEL_OFFSET = 14
+_SVG_LEGEND_WIDTH = 60
+
+
+def downsample(times: Sequence[float], memory_usages: Sequence[int], n_points: int) -> Series:
+    """Downsample a time series to at most `n_points` points, keeping the minimum and maximum of every bucket.
+
+    Unlike averaging or taking every n-th point, min/max bucketing keeps short spikes.
+    """
+
+    n_samples = len(memory_usages)
+    if n_samples <= n_points:
+        return list(times), list(memory_usages)
+
+    indices = []
+    n_buckets = max(n_points // 2, 1)
+    for bucket in range(n_buckets):
+        start = bucket * n_samples // n_buckets
+        bucket_memory = memory_usages[start : (bucket + 1) * n_samples // n_buckets]  # noqa: E203
+        index_min = start + bucket_memory.index(min(bucket_memory))
+        index_max = start + bucket_memory.index(max(bucket_memory))
+        indices.extend(sorted({index_min, index_max}))
+
+    return [times[index] for index in indices], [memory_usages[index] for index in indices]
+
+
+def _svg_text(x_position: float, y_position: float, text: str, attributes: str = "") -> str:
+    return f'<text x="{x_position}" y="{y_position}"{attributes}>{text}</text>'
+
+
+class MemoryTimeline:
+    """Time series of the memory usage increments during an execution.
+
+    Every series is downsampled to at most `n_points` points. The timeline is rendered as an SVG plot
+    in notebooks and as sparklines in terminals, `plot` draws it with matplotlib.
+    """
+
+    def __init__(self, times: Sequence[float], series: Dict[str, Sequence[int]], n_points: int = 200) -> None:
+        start = times[0] if times else 0
+        self.n_samples: int = len(times)
+        self.duration: float = times[-1] - start if times else 0
+
+        times = [timestamp - start for timestamp in times]
+        self.series: Dict[str, Series] = {
+            name: downsample(times, memory_usages, n_points) for name, memory_usages in series.items()
+        }
+
+    @classmethod
+    def from_buffer(
+        cls, buffer: TimelineBuffer, pids: Sequence[int], traced: bool = True, metric: str = "rss"
+    ) -> MemoryTimeline:
+        """Make a timeline of the memory usage increments of the processes and of the traced memory from a buffer."""
+
+        times, processes_memory, traced_memory = buffer.read()
+
+        series = {}
+        for pid, memory_usages in zip(pids, processes_memory):
+            name = metric if len(pids) == 1 else f"{metric} {pid}"
+            series[name] = [memory - memory_usages[0] for memory in memory_usages]
+        if traced:
+            series["traced"] = traced_memory
+
+        return cls(times, series)
+
+    def to_dict(self) -> dict[str, Any]:
+        """Get the timeline as a JSON-serializable dict, the series are mapped to lists of times and memory usages."""
+
+        return {
+            "n_samples": self.n_samples,
+            "duration": self.duration,
+            "series": {name: list(map(list, series)) for name, series in self.series.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, timeline_dict: dict[str, Any]) -> MemoryTimeline:
+        """Make a timeline from a dict made by `to_dict`, the series are not downsampled again."""
+
+        timeline = cls([], {})
+        timeline.n_samples = timeline_dict["n_samples"]
+        timeline.duration = timeline_dict["duration"]
+        timeline.series = {name: tuple(map(list, series)) for name, series in timeline_dict["series"].items()}
+        return timeline
+
+    def sparkline(self, name: str, width: int = 60) -> str:
+        """Get a sparkline of a series, every character shows the maximum of its time bucket."""
+
+        memory_usages = self.series[name][1]
+        if not memory_usages:
+            return ""
+
+        low, high = min(memory_usages), max(memory_usages)
+        sparkline = []
+        for bucket_memory in self._get_time_buckets(name, width):
+            if bucket_memory:
+                level = (max(bucket_memory) - low) / (high - low) if high > low else 0
+                block = SPARKLINE_BLOCKS[round(level * (len(SPARKLINE_BLOCKS) - 1))]
+            else:
+                # the empty buckets repeat the previous block
+                block = sparkline[-1] if sparkline else SPARKLINE_BLOCKS[0]
+            sparkline.append(block)
+
+        return "".join(sparkline)
+
+    def plot(self, ax: Any = None) -> Any:
+        """Plot the timeline with matplotlib, which must be installed."""
+
+        from matplotlib import pyplot  # noqa: WPS433
+
+        if ax is None:
+            _, ax = pyplot.subplots()
+        for name, (times, memory_usages) in self.series.items():
+            ax.plot(times, [memory / 1024**2 for memory in memory_usages], label=name)
+        ax.set_xlabel("time, s")
+        ax.set_ylabel("memory increment, MiB")
+        ax.legend()
+
+        return ax
+
+    def __str__(self) -> str:
+        lines = [f"Memory timeline: {self.n_samples} samples in {self.duration:.3f} s"]
+        name_width = max(map(len, self.series), default=0)
+        for name, (_, memory_usages) in self.series.items():
+            memory_range = ""
+            if memory_usages:
+                memory_range = format_bytes(min(memory_usages)) + " .. " + format_bytes(max(memory_usages))
+            lines.append(f"{name:{name_width}} {self.sparkline(name)} {memory_range}")
+        return "\n".join(lines)
+
+    def _repr_pretty_(self, printer: Any, cycle: bool) -> None:  # noqa: WPS120
+        printer.text(str(self))
+
+    def _repr_svg_(self) -> str:  # noqa: WPS120
+        low, high = self._get_memory_range()
+
+        elements = self._get_svg_frame(low, high)
+        legend_x = _SVG_WIDTH - _SVG_MARGIN
+        for index, (name, series) in enumerate(self.series.items()):
+            color = SVG_COLORS[index % len(SVG_COLORS)]
+            points = self._get_svg_points(series, low, high)
+            elements.append(f'<polyline points="{points}" fill="none" stroke="{color}"/>')
+            elements.append(_svg_text(legend_x, _SVG_MARGIN - 5, name, f' fill="{color}" text-anchor="end"'))
+            legend_x -= _SVG_LEGEND_WIDTH
+        elements.append("</svg>")
+
+        return "\n".join(elements)
+
+    def _get_time_buckets(self, name: str, n_buckets: int) -> List[List[int]]:
+        """Group the memory usages of a series by `n_buckets` equal time buckets."""
+
+        buckets = [[] for _ in range(n_buckets)]
+        for timestamp, memory in zip(*self.series[name]):
+            bucket = int(timestamp / self.duration * (n_buckets - 1)) if self.duration else 0
+            buckets[bucket].append(memory)
+        return buckets
+
+    def _get_memory_range(self) -> Tuple[int, int]:
+        all_memory = [memory for _, memory_usages in self.series.values() for memory in memory_usages]
+        return min(all_memory, default=0), max(all_memory, default=0)
+
+    def _get_svg_frame(self, low: int, high: int) -> List[str]:
+        """Get the SVG elements of the plot frame with the memory and time labels."""
+
+        plot_width = _SVG_WIDTH - 2 * _SVG_MARGIN
+        plot_height = _SVG_HEIGHT - 2 * _SVG_MARGIN
+        label_y = _SVG_HEIGHT - _SVG_MARGIN + _SVG_LABEL_OFFSET
+        frame = f'<rect x="{_SVG_MARGIN}" y="{_SVG_MARGIN}" width="{plot_width}" height="{plot_height}" '
+        return [
+            f'<svg xmlns="http://www.w3.org/2000/svg" width="{_SVG_WIDTH}" height="{_SVG_HEIGHT}" font-size="11">',
+            frame + 'fill="none" stroke="#ccc"/>',
+            _svg_text(_SVG_MARGIN, _SVG_MARGIN - 5, format_bytes(high)),
+            _svg_text(_SVG_MARGIN, label_y, format_bytes(low)),
+            _svg_text(_SVG_WIDTH - _SVG_MARGIN, label_y, f"{self.duration:.3f} s", ' text-anchor="end"'),
+        ]
+
+    def _get_svg_points(self, series: Series, low: int, high: int) -> str:
+        """Get the SVG coordinates of the points of a series scaled to the plot frame."""
+
+        memory_scale = (_SVG_HEIGHT - 2 * _SVG_MARGIN) / (high - low) if high > low else 0
+        time_scale = (_SVG_WIDTH - 2 * _SVG_MARGIN) / self.duration if self.duration else 0
+        points = (
+            (_SVG_MARGIN + timestamp * time_scale, _SVG_HEIGHT - _SVG_MARGIN - (memory - low) * memory_scale)
+            for timestamp, memory in zip(*series)
+        )
+        return " ".join(f"{x_position:.1f},{y_position:.1f}" for x_position, y_position in points)
@@ -0,0 +1,68 @@
+from IPython.testing import tools as tt
+
+
+def get_magics(ipython):
+    return ipython.magics_manager.registry["MemoryMagics"]
+
+
+def test_auto(ipython):
+    magics = get_magics(ipython)
+    magics.history.clear()
+
+    with tt.AssertPrints("Automatic memory tracking: on (RSS), 0 cells recorded"):
+        ipython.run_cell("%memory_auto on")
+    ipython.run_cell("x = b'x' * 10**7")
+    ipython.run_cell("del x")
+    with tt.AssertPrints("Automatic memory tracking: off, 2 cells recorded"):
+        ipython.run_cell("%memory_auto off")
+
+    records = list(magics.history)
+    assert records[0].mode == "rss"
+    assert records[0].cell_peak >= 10**7
+
+
+def test_auto_tracemalloc(ipython):
+    magics = get_magics(ipython)
+    magics.history.clear()
+
+    ipython.run_cell("%memory_auto on --tracemalloc -i 10")
+    ipython.run_cell("x = b'x' * 10**7")
+    ipython.run_cell("%memory_auto off")
+
+    record = next(iter(magics.history))
+    assert record.mode == "tracemalloc"
+    assert record.cell_current >= 10**7
+    assert record.native_peak is not None
+    ipython.run_cell("del x")
+
+
+def test_auto_history_size(ipython):
+    magics = get_magics(ipython)
+    magics.history.clear()
+
+    ipython.run_cell("%config MemoryMagics.history_size = 2")
+    ipython.run_cell("%memory_auto on")
+    for _ in range(5):
+        ipython.run_cell("pass")
+    ipython.run_cell("%memory_auto off")
+    ipython.run_cell("%config MemoryMagics.history_size = 1000")
+
+    assert len(magics.history) == 2
+
+
+def test_auto_usage(ipython):
+    with tt.AssertPrints("UsageError", channel="stderr"):
+        ipython.run_cell("%memory_auto maybe")
+
+
+def test_auto_nested_memory(ipython):
+    magics = get_magics(ipython)
+    magics.history.clear()
+
+    ipython.run_cell("%memory_auto on")
+    # %memory resets the peak RSS and samples the kernel with its own tracer, after the cell allocated
+    ipython.run_cell("x = bytearray(200 * 2**20); x[::4096] = b'x' * len(x[::4096]); del x\n%memory -q --native y = 1")
+    ipython.run_cell("%memory_auto off")
+
+    records = [record for record in magics.history if record.mode == "rss"]
+    assert records[0].cell_peak >= 200 * 2**20 * 0.9
@@ -1,3 +1,6 @@
+import asyncio
+
+import psutil
 from IPython.testing import tools as tt
 
 
@@ -36,3 +39,98 @@ def test_notebook_jupyter_table(ipython):
         ipython.run_cell("%%memory -n -j -t -i 20\nlist(range(10**5))")
     with tt.AssertPrints("jupyter"):
         ipython.run_cell("%%memory -n -j -t -i 20\nlist(range(10**5))")
+
+
+def test_lines(ipython):
+    with tt.AssertPrints("line contents"):
+        ipython.run_cell("%%memory -l\nx = list(range(10**5))\ndel x")
+    with tt.AssertPrints("del x"):
+        ipython.run_cell("%%memory -l\nx = list(range(10**5))\ndel x")
+
+
+def test_lines_line_mode(ipython):
+    with tt.AssertPrints("UsageError", channel="stderr"):
+        ipython.run_cell("%memory -l list(range(10**5))")
+
+
+def test_top(ipython):
+    with tt.AssertPrints("Top allocations:"):
+        ipython.run_cell("%%memory --top 3\nx = list(range(10**5))")
+    with tt.AssertPrints("<cell>:1: x = list(range(10**5))"):
+        ipython.run_cell("%%memory --top 3 -d 5\nx = list(range(10**5))")
+
+
+def test_peak_snapshot(ipython):
+    with tt.AssertPrints("Top allocations at peak"):
+        ipython.run_cell("%%memory -p 1MiB\nimport time\nx = list(range(10**6))\ntime.sleep(0.1)\ndel x")
+
+
+def test_limit(ipython):
+    limit = psutil.Process().memory_info().rss + 50 * 1024**2
+    with tt.AssertPrints("interrupted at <cell>:3: x.append(b'x' * 10**6)"):
+        ipython.run_cell(f"%%memory --limit {limit}\nx = []\nfor _ in range(2000):\n    x.append(b'x' * 10**6)")
+    ipython.run_cell("del x")
+
+
+def test_timeline(ipython):
+    with tt.AssertPrints("Memory timeline:"):
+        ipython.run_cell("%%memory --timeline\nimport time\nx = list(range(10**5))\ntime.sleep(0.05)\ndel x")
+
+
+def test_output_timeline(ipython):
+    cell = "import time\noutput_list = list(range(10**5))\ntime.sleep(0.05)"
+    memory_result = ipython.run_cell_magic("memory", "-o --timeline --top 3", cell)
+
+    assert memory_result.peak >= memory_result.current
+    assert memory_result.timeline.series["traced"]
+    assert memory_result.top_allocations(1)
+    assert memory_result.to_dict()["timeline"]["n_samples"] == memory_result.timeline.n_samples
+
+
+def test_children(ipython):
+    cell = "%%memory -c\nimport subprocess, sys\nsubprocess.run([sys.executable, '-c', 'import time; time.sleep(0.3)'])"
+    with tt.AssertPrints("children:"):
+        ipython.run_cell(cell)
+    with tt.AssertPrints("tree:"):
+        ipython.run_cell(cell)
+
+
+def test_async(ipython):
+    ipython.run_cell("import asyncio")
+    with tt.AssertPrints("RAM usage: cell:"):
+        execution_result = ipython.run_cell(
+            "%%memory\nx = await asyncio.sleep(0, list(range(10**5)))\nawait asyncio.sleep(0, 1)"
+        )
+    assert execution_result.result == 1
+
+
+async def _run_cell(ipython, cell):
+    return ipython.run_cell(cell)
+
+
+def test_async_running_loop(ipython):
+    ipython.run_cell("import asyncio")
+    assert asyncio.run(_run_cell(ipython, "%memory await asyncio.sleep(0, 1)")).result == 1
+
+
+def test_async_tasks(ipython):
+    ipython.run_cell("import asyncio")
+    with tt.AssertPrints("loader"):
+        cell = "\n".join(
+            [
+                "async def load():",
+                "    await asyncio.sleep(0)",
+                "    return list(range(10**5))",
+                "await asyncio.create_task(load(), name='loader')",
+            ]
+        )
+        ipython.run_cell("%%memory --tasks\n" + cell)
+
+
+def test_variables(ipython):
+    with tt.AssertPrints("| variables_list"):
+        ipython.run_cell("%%memory -v\nvariables_list = list(range(10**4))")
+    with tt.AssertPrints("<shared by several variables>"):
+        ipython.run_cell(
+            "%%memory -v\nvariables_a = list(range(10**4))\nvariables_b = [variables_a]\nvariables_c = [variables_a]"
+        )
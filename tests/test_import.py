@@ -0,0 +1,23 @@
+import subprocess
+import sys
+
+LOAD_SCRIPT = """
+import sys
+from IPython.core.interactiveshell import InteractiveShell
+
+import memory_magics
+
+memory_magics.load_ipython_extension(InteractiveShell.instance())
+print(" ".join(sorted(set(sys.modules) & {"psutil", "ctypes", "multiprocessing.shared_memory"})))
+"""
+
+
+def test_load_defers_imports():
+    output = subprocess.run([sys.executable, "-c", LOAD_SCRIPT], check=True, capture_output=True, text=True).stdout
+    assert output.strip() == ""
+
+
+def test_import_defers_asyncio():
+    script = "import sys, memory_magics; print('asyncio' in sys.modules)"
+    output = subprocess.run([sys.executable, "-c", script], check=True, capture_output=True, text=True).stdout
+    assert output.strip() == "False"
@@ -0,0 +1,21 @@
+from IPython.testing import tools as tt
+
+
+def test_leak(ipython):
+    ipython.run_cell("leak_cache = []")
+    with tt.AssertPrints("Leaking allocation sites:"):
+        ipython.run_cell("%memory_leak -r 5 leak_cache.append(list(range(100)))")
+    with tt.AssertPrints("<cell>:1: x = list(range(100))"):
+        ipython.run_cell("%%memory_leak -r 5 -w 0\nx = list(range(100))\nleak_cache.append(x)")
+
+
+def test_no_leak(ipython):
+    with tt.AssertPrints("No allocation sites with retained memory growing steadily"):
+        ipython.run_cell("%memory_leak -r 5 x = list(range(100))")
+
+
+def test_usage(ipython):
+    with tt.AssertPrints("UsageError", channel="stderr"):
+        ipython.run_cell("%memory_leak -r 1 x = 1")
+    with tt.AssertPrints("UsageError", channel="stderr"):
+        ipython.run_cell("%memory_leak")
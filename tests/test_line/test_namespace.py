@@ -0,0 +1,14 @@
+from IPython.testing import tools as tt
+
+
+def test_namespace(ipython):
+    ipython.run_cell("namespace_list = list(range(10**5))")
+    with tt.AssertPrints("| list               | namespace_list"):
+        ipython.run_cell("%memory_ns -n 1000")
+    with tt.AssertPrints("Namespace:"):
+        ipython.run_cell("%memory_ns -f -n 0")
+
+
+def test_namespace_usage(ipython):
+    with tt.AssertPrints("UsageError", channel="stderr"):
+        ipython.run_cell("%memory_ns -n x")
@@ -1,5 +1,10 @@
+import pytest
+from IPython.core.error import UsageError
 from IPython.testing import tools as tt
 
+from memory_magics.options import MemoryOptionsParser
+from memory_magics.tracing import TraceOptions
+
 
 def test_empty(ipython):
     with tt.AssertPrints(""):
@@ -41,3 +46,101 @@ def test_notebook_jupyter_table(ipython):
 def test_notebook_jupyter_table_interval(ipython):
     with tt.AssertPrints("RAM usage |   current   |     peak     |"):
         ipython.run_cell("%memory -n -j -t -i 10")
+
+
+def test_backend_thread(ipython):
+    with tt.AssertPrints("notebook"):
+        ipython.run_cell("%memory -n -b thread list(range(10**5))")
+
+
+def test_backend_process(ipython):
+    with tt.AssertPrints("notebook"):
+        ipython.run_cell("%memory -n --backend process list(range(10**5))")
+
+
+def test_backend_unknown(ipython):
+    with tt.AssertPrints("UsageError", channel="stderr"):
+        ipython.run_cell("%memory -n -b unknown list(range(10**5))")
+
+
+def test_sample(ipython):
+    with tt.AssertPrints("Measured by RSS sampling every 10 ms"):
+        ipython.run_cell("%memory --sample list(range(10**5))")
+
+
+def test_sample_lines(ipython):
+    with tt.AssertPrints("UsageError", channel="stderr"):
+        ipython.run_cell("%memory --sample --top 5 list(range(10**5))")
+
+
+def test_native(ipython):
+    with tt.AssertPrints("native:"):
+        ipython.run_cell("%memory --native list(range(10**5))")
+
+
+def test_native_sample(ipython):
+    with tt.AssertPrints("UsageError", channel="stderr"):
+        ipython.run_cell("%memory --sample --native list(range(10**5))")
+
+
+def test_limit_percent(ipython):
+    with tt.AssertPrints("RAM usage: line:"):
+        ipython.run_cell("%memory --limit 1000% list(range(10**5))")
+
+
+def test_limit_invalid(ipython):
+    with tt.AssertPrints("UsageError", channel="stderr"):
+        ipython.run_cell("%memory --limit foo list(range(10**5))")
+
+
+def test_interval_auto(ipython):
+    with tt.AssertPrints("Measured by adaptive RSS sampling every 1-100 ms"):
+        ipython.run_cell("%memory --sample -i auto list(range(10**5))")
+
+
+def test_interval_too_small(ipython):
+    with tt.AssertPrints("ValueError"):
+        ipython.run_cell("%memory -i 0.5 list(range(10**5))")
+
+
+def test_metric(ipython):
+    with tt.AssertPrints("Measured by PSS sampling every 10 ms"):
+        ipython.run_cell("%memory -n --sample --metric pss list(range(10**5))")
+
+
+def test_metric_unknown(ipython):
+    with tt.AssertPrints("UsageError", channel="stderr"):
+        ipython.run_cell("%memory --metric vms list(range(10**5))")
+
+
+def test_output(ipython):
+    memory_result = ipython.run_line_magic("memory", "-o -n bytearray(10**7)")
+
+    assert memory_result.mode == "tracemalloc"
+    assert memory_result.peak >= 10**7
+    assert memory_result.duration > 0
+    assert memory_result.backend == "process"
+    assert "notebook" in memory_result.scopes
+    assert "line" not in memory_result.scopes
+
+
+def test_output_empty(ipython):
+    assert ipython.run_line_magic("memory", "-o -n") is None
+
+
+def test_options_parser():
+    parser = MemoryOptionsParser(memory_limit="1GiB", children_scan_interval=50.0)
+    options = parser.parse({"n": "", "p": "1MiB", "metric": "PSS", "c": ""}, cell_mode=True)
+
+    assert options.notebook and options.traces_processes
+    assert options.top == 10
+    assert options.trace == TraceOptions(
+        children=True,
+        snapshot=True,
+        peak_threshold=2**20,
+        limit=2**30,
+        metric="pss",
+        scan_interval=50.0,
+    )
+    with pytest.raises(UsageError):
+        parser.parse({"lines": ""})
@@ -0,0 +1,247 @@
+import asyncio
+import os
+import subprocess
+import sys
+from contextlib import ExitStack, closing
+from multiprocessing import shared_memory
+from unittest import mock
+
+import psutil
+import pytest
+
+from memory_magics.memory_tracer import MEMORY_TRACERS
+from memory_magics.memory_tracer._memory_tracer import AdaptiveInterval, PeakMemoryBuffer, ProcessMemoryReader
+from memory_magics.memory_tracer.children_memory_tracer import ChildrenMemoryTracer, get_resource_tracker_pid
+from memory_magics.memory_tracer.context_memory_tracer import ContextMemoryTracer
+from memory_magics.memory_tracer.leak_memory_tracer import LeakMemoryTracer, fit_line
+from memory_magics.memory_tracer.task_memory_tracer import TaskMemoryTracer
+from memory_magics.tracing import trace_allocations
+
+
+@pytest.fixture(name="memory_tracer", params=list(MEMORY_TRACERS))
+def memory_tracer_fixture(request):
+    memory_tracer = MEMORY_TRACERS[request.param]([os.getpid()])
+    yield memory_tracer
+    memory_tracer.stop()
+
+
+def test_peaks(memory_tracer):
+    with memory_tracer:
+        list(range(10**5))
+
+    assert memory_tracer.memory_usages_peak[os.getpid()] > 0
+    assert memory_tracer.total_peak >= memory_tracer.memory_usages_peak[os.getpid()]
+
+
+def test_metric(memory_tracer):
+    memory_tracer.arm(metric="uss")
+    memory_tracer.disarm()
+
+    assert 0 < memory_tracer.memory_usages_peak[os.getpid()] <= psutil.Process().memory_info().rss
+
+
+def test_reuse(memory_tracer):
+    memory_tracer.arm()
+    memory_tracer.disarm()
+    assert memory_tracer.is_running
+
+    memory_tracer.arm()
+    memory_tracer.disarm()
+    assert memory_tracer.memory_usages_peak[os.getpid()] > 0
+
+
+def test_stop(memory_tracer):
+    memory_tracer.start()
+    memory_tracer.stop()
+    assert not memory_tracer.is_running
+
+
+def test_cleanup_at_exit():
+    # the tracer is left running at the interpreter exit
+    source = "; ".join(
+        [
+            "import os",
+            "from memory_magics.memory_tracer.context_memory_tracer import ContextMemoryTracer",
+            "memory_tracer = ContextMemoryTracer([os.getpid()])",
+            "memory_tracer.arm()",
+            "memory_tracer.disarm()",
+            "print(memory_tracer.pid, memory_tracer._shared_memory.name)",
+        ]
+    )
+    output = subprocess.run([sys.executable, "-c", source], check=True, capture_output=True, text=True)
+    tracer_pid, name = output.stdout.split()
+
+    assert "leaked" not in output.stderr
+    assert not psutil.pid_exists(int(tracer_pid))
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name)
+
+
+def test_buffer():
+    buffer = PeakMemoryBuffer()
+    buffer.write([1, 2], [10, 20], [15, 25], 30, 40)
+
+    assert buffer.read() == ({1: 10, 2: 20}, {1: 15, 2: 25}, 30, 40)
+
+
+def test_adaptive_interval():
+    interval = AdaptiveInterval(min_interval=1, max_interval=8, cpu_budget=0.5)
+    interval.update(0, 0, 0)
+
+    assert [interval.update(0, 0, 0) for _ in range(5)] == [2, 4, 8, 8, 8]
+    assert interval.update(2**20, 2**20, 0) == 1
+    # the sampler may not use more than half of a core
+    assert interval.update(2**20, 2**20, 0.01) == 20
+
+
+def test_adaptive_interval_string():
+    interval = AdaptiveInterval.from_string(str(AdaptiveInterval(2, 50, 0.1)))
+    assert (interval.min_interval, interval.max_interval, interval.cpu_budget) == (2, 50, 0.1)
+
+
+def test_adaptive_arm(memory_tracer):
+    memory_tracer.arm(interval=AdaptiveInterval())
+    list(range(10**5))
+    memory_tracer.disarm()
+
+    assert memory_tracer.memory_usages_peak[os.getpid()] > 0
+
+
+@pytest.mark.parametrize("metric", ["pss", "uss"])
+def test_reader_metric(metric):
+    with closing(ProcessMemoryReader([os.getpid()], metric)) as reader:
+        memory_usage = reader.read()[0]
+
+    memory_info = psutil.Process().memory_full_info()
+    assert 0 < memory_usage <= memory_info.rss
+    assert memory_usage == pytest.approx(getattr(memory_info, metric), rel=0.1)
+
+
+def test_reader_reset():
+    with closing(ProcessMemoryReader([os.getpid()])) as reader:
+        memory_usage = reader.read()[0]
+        with mock.patch("os.open") as open_mock:
+            with mock.patch("os.close") as close_mock:
+                reader.reset([os.getpid()])
+                assert reader.read()[0] == pytest.approx(memory_usage, rel=0.1)
+                # the file of the process read again is reused
+                open_mock.assert_not_called()
+                close_mock.assert_not_called()
+
+        reader.reset([os.getpid()], "pss")
+        assert reader.read()[0] > 0
+
+
+def test_reader():
+    source = "import time; print(flush=True); time.sleep(30)"
+    process = subprocess.Popen([sys.executable, "-c", source], stdout=subprocess.PIPE)
+    with ExitStack() as stack:
+        stack.callback(process.kill)
+        reader = stack.enter_context(closing(ProcessMemoryReader([os.getpid(), process.pid])))
+        # wait for the interpreter to start
+        process.stdout.readline()
+        memory_usages = reader.read()
+        memory_usage = memory_usages[1]
+        assert memory_usage == psutil.Process(process.pid).memory_info().rss
+
+        process.kill()
+        process.wait()
+        reader.read(memory_usages)
+        # the memory usage of an exited process is left unchanged
+        assert memory_usages[1] == memory_usage
+        assert memory_usages[0] > 0
+
+
+def test_children():
+    # e.g. tracer processes started by other tests
+    excluded_pids = [child.pid for child in psutil.Process().children(recursive=True)]
+    children_memory_tracer = ChildrenMemoryTracer(interval=10, scan_interval=10, excluded_pids=excluded_pids)
+    source = "x = bytearray(64 * 2**20); import time; time.sleep(0.5)"
+    with children_memory_tracer.watch():
+        subprocess.run([sys.executable, "-c", source], check=True)
+
+    assert children_memory_tracer.children_peak >= 64 * 2**20
+    assert children_memory_tracer.children_count_peak == 1
+    assert children_memory_tracer.children_current == 0
+    assert children_memory_tracer.tree_peak > children_memory_tracer.children_peak
+
+
+def test_children_excluded():
+    source = "import subprocess, sys; subprocess.run([sys.executable, '-c', 'import time; time.sleep(0.5)'])"
+    process = subprocess.Popen([sys.executable, "-c", source])
+    excluded_pids = [child.pid for child in psutil.Process().children(recursive=True) if child.pid != process.pid]
+    children_memory_tracer = ChildrenMemoryTracer(
+        interval=10, scan_interval=10, excluded_pids=[*excluded_pids, process.pid]
+    )
+    with ExitStack() as stack:
+        stack.callback(process.kill)
+        stack.enter_context(children_memory_tracer.watch())
+        process.wait()
+
+    assert children_memory_tracer.children_count_peak == 0
+    assert children_memory_tracer.children_peak == 0
+
+
+def test_children_excluded_tracers():
+    # e.g. the Jupyter server started by other tests, but not the resource tracker of the shared memory
+    excluded_pids = [
+        child.pid for child in psutil.Process().children(recursive=True) if child.pid != get_resource_tracker_pid()
+    ]
+    memory_tracer = ContextMemoryTracer([os.getpid()])
+    children_memory_tracer = ChildrenMemoryTracer(interval=10, scan_interval=10)
+    with ExitStack() as stack:
+        stack.callback(memory_tracer.stop)
+        memory_tracer.arm()
+        children_memory_tracer.excluded_pids = {*excluded_pids, memory_tracer.pid}
+        stack.enter_context(children_memory_tracer.watch())
+
+    assert get_resource_tracker_pid() is not None
+    assert children_memory_tracer.children_count_peak == 0
+    assert children_memory_tracer.children_peak == 0
+
+
+async def _allocate(size):
+    await asyncio.sleep(0)
+    return bytearray(size)
+
+
+async def _allocate_in_tasks():
+    small = asyncio.create_task(_allocate(10**5), name="small")
+    large = asyncio.create_task(_allocate(10**7), name="large")
+    return await small, await large
+
+
+def test_tasks():
+    task_memory_tracer = TaskMemoryTracer("main")
+    with trace_allocations():
+        asyncio.run(task_memory_tracer.trace(_allocate_in_tasks()))
+
+    task_memory_usages = task_memory_tracer.task_memory_usages
+    assert set(task_memory_usages) == {"main", "small", "large"}
+    assert task_memory_usages["large"].increment >= 10**7
+    assert 10**5 <= task_memory_usages["small"].increment < 10**7
+    assert task_memory_usages["large"].steps == 2
+    assert task_memory_tracer.peak >= 10**7
+
+
+def test_leaks():
+    cache = []
+    leak_memory_tracer = LeakMemoryTracer()
+    with leak_memory_tracer.trace():
+        leak_memory_tracer.record()
+        for _ in range(10):
+            cache.append(bytearray(1000))
+            bytearray(10000)
+            leak_memory_tracer.record()
+
+    leak_sites = leak_memory_tracer.leaks()
+    assert len(leak_sites) == 1
+    assert 1000 <= leak_sites[0].slope < 1200
+    assert leak_sites[0].growth == leak_sites[0].size
+    assert leak_memory_tracer.trend()[0] == pytest.approx(leak_sites[0].slope, rel=0.1)
+
+
+def test_fit_line():
+    assert fit_line([1, 3, 5, 7]) == (2, 1)
+    assert fit_line([5, 5, 5]) == (0, 0)
+    assert fit_line([0, 10, 0, 10])[1] < 0.5
@@ -0,0 +1,153 @@
+import asyncio
+import subprocess
+import sys
+
+import pytest
+from IPython.lib.pretty import pretty
+
+import memory_magics
+from memory_magics import MemoryResult
+from memory_magics.memory_tracer.limit_memory_tracer import MemoryLimitExceeded
+
+
+def test_trace():
+    with memory_magics.trace(snapshot=True) as memory_result:
+        allocated = bytearray(10**7)
+
+    assert memory_result.mode == "tracemalloc"
+    assert memory_result.current >= 10**7
+    assert memory_result.peak >= memory_result.current
+    assert memory_result.duration > 0
+    assert memory_result.start_time is not None
+    assert memory_result.top_allocations(1)[0].size >= 10**7
+    del allocated
+
+
+def test_trace_sample():
+    with memory_magics.trace(sample=True) as memory_result:
+        allocated = bytearray(10**8)
+        allocated[::4096] = b"x" * len(allocated[::4096])
+
+    assert memory_result.mode == "rss"
+    assert memory_result.peak >= 10**8 * 0.9
+    assert "native" not in memory_result.scopes
+    del allocated
+
+    with pytest.raises(ValueError):
+        with memory_magics.trace(sample=True, native=True):
+            pass
+
+
+def test_trace_native_freed():
+    allocated = bytearray(10**8)
+    allocated[::4096] = b"x" * len(allocated[::4096])
+    with memory_magics.trace(native=True) as memory_result:
+        del allocated
+
+    assert memory_result.scopes["native"][0] >= 0
+
+
+def test_trace_numpy_imported():
+    # numpy is imported by the traced code only in a new process
+    source = "\n".join(
+        [
+            "import memory_magics",
+            "with memory_magics.trace(native=True) as result:",
+            "    import numpy",
+            "    x = numpy.ones(10**6)",
+            "print(result.scopes['numpy'][0])",
+        ]
+    )
+    output = subprocess.run([sys.executable, "-c", source], check=True, capture_output=True, text=True)
+
+    assert int(output.stdout) >= 8 * 10**6
+
+
+def test_trace_scopes():
+    with memory_magics.trace(native=True, children=True) as memory_result:
+        subprocess.run([sys.executable, "-c", "import time; time.sleep(0.3)"], check=True)
+
+    assert set(memory_result.scopes) >= {"native", "children", "tree"}
+
+
+def test_trace_timeline():
+    with memory_magics.trace(timeline=True, interval=1) as memory_result:
+        allocated = bytearray(10**7)
+
+    assert memory_result.timeline is not None
+    assert memory_result.backend == "thread"
+    assert "native" not in memory_result.scopes
+    del allocated
+
+
+def test_trace_limit():
+    with pytest.raises(MemoryLimitExceeded):
+        with memory_magics.trace(limit=0):
+            while True:
+                bytearray(10**4)
+
+
+def test_result_json():
+    memory_result = MemoryResult("rss", 10, 20, 0.5, {"children": (1, None)}, backend="thread", start_time=1.0)
+    copy = MemoryResult.from_json(memory_result.to_json())
+
+    assert copy == memory_result
+    assert copy.scopes == {"children": (1, None)}
+    assert copy != MemoryResult("rss", 10, 30, 0.5, {"children": (1, None)}, backend="thread", start_time=1.0)
+
+
+def test_result_equality():
+    memory_result = MemoryResult("rss", 10, 20, 0.5, {"children": (1, None)}, backend="thread", start_time=1.0)
+
+    assert memory_result == MemoryResult("rss", 10, 20, 0.7, {"children": (1, None)}, backend="thread", start_time=2.0)
+    assert memory_result != MemoryResult("rss", 10, 20, 0.5, {"children": (1, 2)}, backend="thread", start_time=1.0)
+    assert memory_result != MemoryResult("tracemalloc", 10, 20, 0.5, {"children": (1, None)}, backend="thread")
+    with pytest.raises(TypeError):
+        hash(memory_result)
+
+
+def test_result_compare():
+    memory_result = MemoryResult("tracemalloc", 10, 50, 1.0, {"native": (5, 8), "numpy": (2, None)})
+    baseline = MemoryResult("tracemalloc", 4, 20, 0.5, {"native": (1, 2), "numpy": (1, None), "tree": (0, 0)})
+    difference = memory_result.compare(baseline)
+
+    assert (difference.current, difference.peak, difference.duration) == (6, 30, 0.5)
+    assert difference.scopes == {"native": (4, 6), "numpy": (1, None)}
+    with pytest.raises(ValueError):
+        memory_result.compare(MemoryResult("rss"))
+
+
+def test_result_repr():
+    memory_result = MemoryResult("tracemalloc", 1024, 2048, 0.25, {"notebook": (2**20, None)})
+
+    assert pretty(memory_result) == (
+        "MemoryResult tracemalloc in 0.250 s\n  execution  1.0 KiB / 2.0 KiB\n  notebook   1.0 MiB"
+    )
+    assert "<th>notebook</th><td>1.0 MiB</td>" in memory_result._repr_html_()  # noqa: WPS437
+
+
+def test_traced():
+    memory_results = []
+
+    @memory_magics.traced(callback=memory_results.append)
+    def allocate(size):
+        return bytearray(size)
+
+    assert len(allocate(10**6)) == 10**6
+    assert allocate.memory_result.peak >= 10**6
+    assert memory_results == [allocate.memory_result]
+
+
+def test_traced_coroutine():
+    @memory_magics.traced
+    async def allocate(size):
+        await asyncio.sleep(0)
+        return bytearray(size)
+
+    asyncio.run(allocate(10**6))
+    assert allocate.memory_result.peak >= 10**6
+
+
+def test_import_without_ipython():
+    code = "import sys, memory_magics; assert 'IPython' not in sys.modules"
+    subprocess.run([sys.executable, "-c", code], check=True)
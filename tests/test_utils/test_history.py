@@ -0,0 +1,69 @@
+from IPython.testing import tools as tt
+
+from memory_magics.utils.history import CellMemoryUsage, MemoryHistory
+
+
+def make_record(execution_count, cell_peak):
+    return CellMemoryUsage(execution_count, 0, 0, 0.1, "rss", 0, cell_peak)
+
+
+def test_ring_buffer():
+    history = MemoryHistory(size=3)
+    for execution_count in range(5):
+        history.append(make_record(execution_count, execution_count))
+
+    assert len(history) == 3
+    assert [record.execution_count for record in history] == [2, 3, 4]
+
+    history.size = 2
+    assert [record.execution_count for record in history] == [3, 4]
+
+
+def test_missing_values():
+    history = MemoryHistory()
+    history.append(make_record(None, 1))
+
+    columns = history.to_dict()
+    assert columns["execution_count"] == [None]
+    assert columns["native_peak"] == [None]
+    assert columns["mode"] == ["rss"]
+
+
+def test_top():
+    history = MemoryHistory()
+    for cell_peak in [3, 1, 5, 2]:
+        history.append(make_record(cell_peak, cell_peak))
+
+    assert [record.cell_peak for record in history.top(2)] == [5, 3]
+
+
+def test_tail():
+    history = MemoryHistory(size=3)
+    for execution_count in range(5):
+        history.append(make_record(execution_count, execution_count))
+    history.append(make_record(None, 5))
+
+    assert [record.execution_count for record in history.tail(2)] == [4, None]
+    assert history.tail(5) == list(history)
+    assert history.tail(0) == []
+
+
+def test_csv(tmp_path):
+    history = MemoryHistory()
+    history.append(make_record(1, 1024))
+    history.to_csv(tmp_path / "history.csv")
+
+    lines = (tmp_path / "history.csv").read_text().splitlines()
+    assert lines[0].startswith("execution_count,source_hash")
+    assert len(lines) == 2
+
+
+def test_memory_history(ipython):
+    ipython.run_cell("%memory_history --clear")
+    ipython.run_cell("%memory -q list(range(10**5))")
+    with tt.AssertPrints("tracemalloc"):
+        ipython.run_cell("%memory_history")
+    with tt.AssertPrints("tracemalloc"):
+        ipython.run_cell("%memory_history --top 1 --by duration")
+    with tt.AssertPrints("UsageError", channel="stderr"):
+        ipython.run_cell("%memory_history --top 1 --by mode")
@@ -0,0 +1,114 @@
+import os
+
+import psutil
+import pytest
+from IPython.testing import tools as tt
+
+from memory_magics.utils.jupyter import JupyterProcessFinder, is_jupyter_server
+
+
+def test_finder_cache(monkeypatch):
+    finder = JupyterProcessFinder(ttl=60)
+    monkeypatch.setattr(finder, "discover", lambda: [os.getpid()])
+    assert finder.get_pids() == [os.getpid()]
+
+    monkeypatch.setattr(finder, "discover", list)
+    assert finder.get_pids() == [os.getpid()]
+
+    finder.invalidate()
+    assert finder.get_pids() == []
+
+
+def test_finder_drops_exited(monkeypatch):
+    finder = JupyterProcessFinder(ttl=60)
+    monkeypatch.setattr(finder, "discover", lambda: [os.getpid(), 2**22 + 1])
+    finder.get_pids()
+
+    assert finder.get_pids() == [os.getpid()]
+
+
+@pytest.fixture(name="jupyter_pids_config")
+def jupyter_pids_config_fixture(ipython):
+    yield
+    ipython.run_cell("%config MemoryMagics.jupyter_pids = None")
+
+
+@pytest.mark.usefixtures("jupyter_pids_config")
+def test_pinned_pids(ipython):
+    ipython.run_cell(f"%config MemoryMagics.jupyter_pids = [{os.getpid()}]")
+    with tt.AssertPrints("jupyter"):
+        ipython.run_cell("%memory -j list(range(10**5))")
+    assert ipython.magics_manager.registry["MemoryMagics"].get_jupyter_pids() == [os.getpid()]
+
+
+class FakeProcess:
+    def __init__(self, pid, cmdline, parent=None):
+        self.pid = pid
+        self._cmdline = cmdline
+        self.parent = parent
+        self.child_processes = []
+        if parent is not None:
+            parent.child_processes.append(self)
+
+    def cmdline(self):
+        return self._cmdline
+
+    def parents(self):
+        parents = []
+        process = self.parent
+        while process is not None:
+            parents.append(process)
+            process = process.parent
+        return parents
+
+    def children(self, recursive=False):
+        children = []
+        for child in self.child_processes:
+            children.append(child)
+            if recursive:
+                children.extend(child.children(recursive=True))
+        return children
+
+
+@pytest.mark.parametrize(
+    "cmdline, expected",
+    [
+        (["/venv/bin/python", "/venv/bin/jupyter-lab"], True),
+        (["python3", "-X", "frozen_modules=off", "-m", "notebook"], True),
+        (["/venv/bin/jupyter", "server", "--port", "8888"], True),
+        (["jupyterhub-singleuser", "--ip=0.0.0.0"], True),
+        ([r"C:\venv\Scripts\jupyter-lab.exe"], True),
+        (["uv", "run", "jupyter", "lab"], False),
+        (["/opt/conda/bin/python", "/opt/conda/bin/conda", "run", "jupyter", "lab"], False),
+        (["python3", "/usr/bin/jupyterhub", "-f", "jupyterhub_config.py"], False),
+        (["bash", "-c", "jupyter lab"], False),
+        (["python", "-m", "ipykernel_launcher", "-f", "kernel.json"], False),
+    ],
+)
+def test_is_jupyter_server(cmdline, expected):
+    assert is_jupyter_server(cmdline) is expected
+
+
+def test_finder_skips_wrappers(monkeypatch):
+    shell = FakeProcess(100, ["bash", "-c", "uv run jupyter lab"])
+    wrapper = FakeProcess(101, ["uv", "run", "jupyter", "lab"], shell)
+    server = FakeProcess(102, ["/venv/bin/python", "/venv/bin/jupyter-lab"], wrapper)
+    kernel = FakeProcess(103, ["/venv/bin/python", "-m", "ipykernel_launcher"], server)
+    other_kernel = FakeProcess(104, ["/venv/bin/python", "-m", "ipykernel_launcher"], server)
+    FakeProcess(105, ["/venv/bin/python", "-c", "worker"], other_kernel)
+    monkeypatch.setattr(psutil, "Process", lambda pid: kernel)
+
+    assert JupyterProcessFinder().discover() == [102, 103, 104, 105]
+
+
+@pytest.mark.usefixtures("jupyter_pids_config")
+def test_kernel_always_traced(ipython):
+    ipython.run_cell("%config MemoryMagics.jupyter_pids = []")
+    assert ipython.magics_manager.registry["MemoryMagics"].get_jupyter_pids() == [os.getpid()]
+
+
+def test_notebook_peak(ipython):
+    # the peak of a statement holding the GIL is only seen by the process backend
+    memory_result = ipython.run_line_magic("memory", "-o -q -n len(b'x' * (200 * 2**20))")
+
+    assert memory_result.scopes["notebook"][1] >= 200 * 2**20
@@ -0,0 +1,92 @@
+import sys
+from unittest import mock
+
+import pytest
+
+from memory_magics.tracing import trace_allocations
+from memory_magics.utils.sizeof import SizeCache, get_retained_sizes, get_version
+
+
+def test_retained_sizes():
+    shared = list(range(1000))
+    retained_sizes = get_retained_sizes({"a": [shared, bytearray(10**5)], "b": [shared], "c": len})
+
+    assert retained_sizes.sizes["a"] >= 10**5
+    assert retained_sizes.sizes["b"] == sys.getsizeof([shared])
+    assert retained_sizes.sizes["c"] == 0
+    assert retained_sizes.shared >= sys.getsizeof(shared)
+    assert retained_sizes.complete
+
+
+def test_retained_sizes_excluded():
+    excluded = bytearray(10**5)
+    retained_sizes = get_retained_sizes({"a": [excluded]}, [excluded])
+
+    assert retained_sizes.sizes["a"] == sys.getsizeof([excluded])
+
+
+def test_retained_sizes_time_budget():
+    retained_sizes = get_retained_sizes({"a": [list(range(100)) for _ in range(10**4)]}, time_budget=0)
+
+    assert not retained_sizes.complete
+
+
+def test_retained_sizes_numpy_pandas():
+    numpy = pytest.importorskip("numpy")
+    pandas = pytest.importorskip("pandas")
+
+    array = numpy.ones(10**5)
+    retained_sizes = get_retained_sizes({"array": array, "frame": pandas.DataFrame({"x": numpy.ones(10**5)})})
+
+    assert retained_sizes.sizes["array"] >= array.nbytes
+    assert retained_sizes.sizes["frame"] >= array.nbytes
+
+
+def test_size_cache():
+    size_cache = SizeCache()
+    numbers = list(range(1000))
+    variables = {"numbers": numbers, "alias": numbers}
+
+    sizes = size_cache.get_sizes(variables).sizes
+    assert sizes["numbers"] == sizes["alias"]
+    assert sizes["numbers"] >= sys.getsizeof(numbers)
+
+    with mock.patch("memory_magics.utils.sizeof.get_retained_sizes") as get_retained_sizes_mock:
+        assert size_cache.get_sizes(variables).sizes == sizes
+        get_retained_sizes_mock.assert_not_called()
+
+    numbers.extend(range(1000))
+    assert size_cache.get_sizes(variables).sizes["numbers"] > sizes["numbers"]
+
+
+def test_version():
+    numbers = [1, 2]
+    version = get_version(numbers)
+    numbers.append(3)
+
+    assert get_version(numbers) != version
+    assert get_version(object()) is None
+
+
+def test_size_cache_replaced_item():
+    size_cache = SizeCache()
+    numbers = [[]]
+    mapping = {"key": []}
+    variables = {"numbers": numbers, "mapping": mapping}
+    sizes = size_cache.get_sizes(variables).sizes
+
+    numbers[0] = list(range(1000))
+    mapping["key"] = list(range(1000))
+    new_sizes = size_cache.get_sizes(variables).sizes
+    assert new_sizes["numbers"] > sizes["numbers"]
+    assert new_sizes["mapping"] > sizes["mapping"]
+
+
+def test_size_cache_footprint():
+    size_cache = SizeCache()
+    variables = {"numbers": list(range(10**5)), "mapping": dict.fromkeys(range(10**5)), "keys": set(range(10**5))}
+
+    with trace_allocations() as traced_memory:
+        size_cache.get_sizes(variables)
+
+    assert traced_memory["current"] < 64 * 1024
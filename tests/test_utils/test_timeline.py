@@ -0,0 +1,43 @@
+import json
+
+from memory_magics.memory_tracer._memory_tracer import TimelineBuffer
+from memory_magics.utils.timeline import MemoryTimeline, downsample
+
+
+def test_downsample_keeps_spikes():
+    memory_usages = [100 if index == 567 else 0 for index in range(1000)]
+    times, downsampled_usages = downsample(range(1000), memory_usages, 20)
+
+    assert len(downsampled_usages) <= 20
+    assert 100 in downsampled_usages
+    assert 567 in times
+
+
+def test_buffer_ring():
+    buffer = TimelineBuffer(n_pids=2, capacity=3)
+    for i in range(5):  # noqa: WPS111
+        buffer.append(float(i), [i, 10 * i], 100 * i)
+
+    times, memory_usages, traced = buffer.read()
+    assert times == [2.0, 3.0, 4.0]
+    assert memory_usages == [[2, 3, 4], [20, 30, 40]]
+    assert traced == [200, 300, 400]
+
+
+def test_timeline_repr():
+    buffer = TimelineBuffer()
+    for i, memory_usage in enumerate([10, 20, 15, 40]):  # noqa: WPS111
+        buffer.append(i / 10, [memory_usage], memory_usage)
+    timeline = MemoryTimeline.from_buffer(buffer, [1])
+
+    assert timeline.series["rss"][1] == [0, 10, 5, 30]
+    assert "Memory timeline: 4 samples in 0.300 s" in str(timeline)
+    assert timeline._repr_svg_().startswith("<svg")  # noqa: WPS437
+
+
+def test_timeline_dict():
+    timeline = MemoryTimeline([0.5, 1.0, 1.5], {"rss": [0, 20, 10]})
+    copy = MemoryTimeline.from_dict(json.loads(json.dumps(timeline.to_dict())))
+
+    assert copy.series == timeline.series
+    assert (copy.n_samples, copy.duration) == (3, 1.0)